@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# Copyright (C) 2026 Canonical Ltd
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Measure how many lines per second ImportParser gets through.
+
+The stream used is mostly commit headers and file commands, with small
+data sections, so that the time goes on recognising lines:
+
+   PYTHONPATH=. python benchmarks/dispatch.py [COMMITS]
+"""
+
+import sys
+import time
+from cStringIO import StringIO
+
+from fastimport import parser
+
+
+def make_stream(commits):
+    lines = []
+    for i in xrange(1, commits + 1):
+        lines.append("blob\nmark :%d\ndata 6\nhello\n" % (3 * i))
+        lines.append("commit refs/heads/master\n")
+        lines.append("mark :%d\n" % (3 * i + 1))
+        lines.append("author A U Thor <author@example.com> %d +0100\n" % i)
+        lines.append("committer C O Mitter <committer@example.com> "
+            "%d +0100\n" % i)
+        lines.append("data 11\nmessage %03d\n" % (i % 1000))
+        if i > 1:
+            lines.append("from :%d\n" % (3 * i - 2))
+        if i % 10 == 0:
+            lines.append("merge :%d\n" % (3 * i - 5))
+        if i % 5 == 0:
+            lines.append("property branch-nick 6 master\n")
+        for j in range(8):
+            lines.append("M 644 :%d dir%d/file%d.txt\n" % (3 * i, j, i))
+        lines.append("D dir/old%d.txt\n" % i)
+        lines.append("R dir/a%d.txt dir/b%d.txt\n" % (i, i))
+        lines.append("C dir/b%d.txt dir/c%d.txt\n" % (i, i))
+        lines.append("\n")
+        lines.append("reset refs/heads/branch%d\nfrom :%d\n\n" % (
+            i % 7, 3 * i + 1))
+    return ''.join(lines)
+
+
+def main(argv):
+    if len(argv) > 1:
+        commits = int(argv[1])
+    else:
+        commits = 5000
+    stream = make_stream(commits)
+    lines = stream.count('\n')
+    best = None
+    for i in range(20):
+        start = time.time()
+        for cmd in parser.ImportParser(StringIO(stream)).iter_commands():
+            pass
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    print "%d lines in %.3f s: %.0f lines/s" % (lines, best, lines / best)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
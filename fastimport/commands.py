@@ -21,6 +21,8 @@ a fast-import stream.
 
 import stat
 
+from fastimport import payload
+
 # There is a bug in git 1.5.4.3 and older by which unquoting a string consumes
 # one extra character. Set this variable to True to work-around it. It only
 # happens when renaming a file whose name contains spaces and/or quotes, and
@@ -49,16 +51,79 @@ FEATURE_NAMES = [
 
 
 class ImportCommand(object):
-    """Base class for import commands."""
+    """Base class for import commands.
+
+    Commands keep their fields in slots rather than a __dict__, as there
+    can be millions of them. The name and the fields not to display are
+    the same for all the commands of a class, so are class attributes.
+    Subclasses should list their own fields in __slots__, or leave it
+    out to have a __dict__.
+    """
 
-    def __init__(self, name):
-        self.name = name
-        # List of field names not to display
-        self._binary = []
+    __slots__ = ('offset', 'end_offset', '_lineno')
+
+    name = None
+    # Names of the fields not to display
+    _binary = ()
+
+    def __init__(self, name=None):
+        if name is not None and name != self.name:
+            self.name = name
+        # Where the command starts and ends in the input, if parsed
+        self.offset = None
+        self.end_offset = None
+
+    def _fields(self):
+        """Get the names of the public fields which are set."""
+        fields = ['name']
+        for cls in type(self).__mro__:
+            for slot in cls.__dict__.get('__slots__', ()):
+                if not slot.startswith('_') and hasattr(self, slot):
+                    fields.append(slot)
+        if hasattr(self, '_lineno'):
+            fields.append('lineno')
+        fields.extend([k for k in getattr(self, '__dict__', ())
+            if not k.startswith('_') and k != 'name'])
+        return fields
+
+    def __getstate__(self):
+        state = {}
+        for cls in type(self).__mro__:
+            for slot in cls.__dict__.get('__slots__', ()):
+                if hasattr(self, slot):
+                    state[slot] = getattr(self, slot)
+        state.update(getattr(self, '__dict__', {}))
+        return state
+
+    def __setstate__(self, state):
+        for key, value in state.iteritems():
+            setattr(self, key, value)
+
+    def _get_lineno(self):
+        lineno = self._lineno
+        if callable(lineno):
+            # The parser only counts lines when asked to
+            lineno = self._lineno = lineno()
+        return lineno
+
+    def _set_lineno(self, lineno):
+        self._lineno = lineno
+
+    lineno = property(_get_lineno, _set_lineno,
+        doc="The line number of the command; set to a callable to compute "
+            "it only when needed.")
 
     def __str__(self):
         return repr(self)
 
+    def iter_chunks(self):
+        """Iterate over the pieces of repr(self).
+
+        Data sections are split into chunks rather than copied into a
+        single string, so large commands can be written out cheaply.
+        """
+        yield repr(self)
+
     def dump_str(self, names=None, child_lists=None, verbose=False):
         """Dump fields as a string.
 
@@ -74,11 +139,11 @@ class ImportCommand(object):
         """
         interesting = {}
         if names is None:
-            fields = [k for k in self.__dict__.keys() if not k.startswith('_')]
+            fields = self._fields()
         else:
             fields = names
         for field in fields:
-            value = self.__dict__.get(field)
+            value = getattr(self, field, None)
             if field in self._binary and value is not None:
                 value = '(...)'
             interesting[field] = value
@@ -90,30 +155,46 @@ class ImportCommand(object):
 
 class BlobCommand(ImportCommand):
 
+    __slots__ = ('mark', 'data', 'id')
+
+    name = 'blob'
+    _binary = ('data',)
+
     def __init__(self, mark, data, lineno=0):
-        ImportCommand.__init__(self, 'blob')
+        ImportCommand.__init__(self)
         self.mark = mark
         self.data = data
         self.lineno = lineno
         # Provide a unique id in case the mark is missing
         if mark is None:
-            self.id = '@%d' % lineno
+            self.id = '@%d' % self.lineno
         else:
             self.id = ':' + mark
-        self._binary = ['data']
 
     def __repr__(self):
+        return "%s%s" % (self._header(), self.data)
+
+    def iter_chunks(self):
+        yield self._header()
+        for chunk in payload.iter_chunks(self.data):
+            yield chunk
+
+    def _header(self):
         if self.mark is None:
             mark_line = ""
         else:
             mark_line = "\nmark :%s" % self.mark
-        return "blob%s\ndata %d\n%s" % (mark_line, len(self.data), self.data)
+        return "blob%s\ndata %d\n" % (mark_line, len(self.data))
 
 
 class CheckpointCommand(ImportCommand):
 
+    __slots__ = ()
+
+    name = 'checkpoint'
+
     def __init__(self):
-        ImportCommand.__init__(self, 'checkpoint')
+        ImportCommand.__init__(self)
 
     def __repr__(self):
         return "checkpoint"
@@ -121,9 +202,15 @@ class CheckpointCommand(ImportCommand):
 
 class CommitCommand(ImportCommand):
 
+    __slots__ = ('ref', 'mark', 'author', 'committer', 'message', 'from_',
+        'merges', 'file_iter', 'more_authors', 'properties', 'id')
+
+    name = 'commit'
+    _binary = ('file_iter',)
+
     def __init__(self, ref, mark, author, committer, message, from_,
         merges, file_iter, lineno=0, more_authors=None, properties=None):
-        ImportCommand.__init__(self, 'commit')
+        ImportCommand.__init__(self)
         self.ref = ref
         self.mark = mark
         self.author = author
@@ -135,10 +222,9 @@ class CommitCommand(ImportCommand):
         self.more_authors = more_authors
         self.properties = properties
         self.lineno = lineno
-        self._binary = ['file_iter']
         # Provide a unique id in case the mark is missing
         if mark is None:
-            self.id = '@%d' % lineno
+            self.id = '@%d' % self.lineno
         else:
             self.id = ':%s' % mark
 
@@ -146,9 +232,10 @@ class CommitCommand(ImportCommand):
         if not isinstance(self.file_iter, list):
             self.file_iter = list(self.file_iter)
 
-        fields = dict((k, v) for k, v in self.__dict__.iteritems()
-                      if k not in ('id', 'name')
-                      if not k.startswith('_'))
+        fields = dict((k, getattr(self, k)) for k in self._fields()
+                      if k not in ('id', 'name', 'offset', 'end_offset',
+                                   'lineno'))
+        fields['lineno'] = self._lineno
         fields.update(kwargs)
         return CommitCommand(**fields)
 
@@ -158,7 +245,27 @@ class CommitCommand(ImportCommand):
     def __str__(self):
         return self.to_string(include_file_contents=False)
 
+    def iter_chunks(self):
+        yield self._header_string()
+        if self.file_iter is not None:
+            for c in self.iter_files():
+                yield "\n"
+                for chunk in c.iter_chunks():
+                    yield chunk
+
     def to_string(self, use_features=True, include_file_contents=False):
+        if self.file_iter is None:
+            filecommands = ""
+        else:
+            if include_file_contents:
+                format_str = "\n%r"
+            else:
+                format_str = "\n%s"
+            filecommands = "".join([format_str % (c,)
+                for c in self.iter_files()])
+        return self._header_string(use_features) + filecommands
+
+    def _header_string(self, use_features=True):
         if self.mark is None:
             mark_line = ""
         else:
@@ -193,18 +300,9 @@ class CommitCommand(ImportCommand):
             properties_section = "".join(property_lines)
         else:
             properties_section = ""
-        if self.file_iter is None:
-            filecommands = ""
-        else:
-            if include_file_contents:
-                format_str = "\n%r"
-            else:
-                format_str = "\n%s"
-            filecommands = "".join([format_str % (c,)
-                for c in self.iter_files()])
-        return "commit %s%s%s\n%s%s%s%s%s%s" % (self.ref, mark_line,
+        return "commit %s%s%s\n%s%s%s%s%s" % (self.ref, mark_line,
             author_section, committer, msg_section, from_line, merge_lines,
-            properties_section, filecommands)
+            properties_section)
 
     def dump_str(self, names=None, child_lists=None, verbose=False):
         result = [ImportCommand.dump_str(self, names, verbose=verbose)]
@@ -228,8 +326,12 @@ class CommitCommand(ImportCommand):
 
 class FeatureCommand(ImportCommand):
 
+    __slots__ = ('feature_name', 'value')
+
+    name = 'feature'
+
     def __init__(self, feature_name, value=None, lineno=0):
-        ImportCommand.__init__(self, 'feature')
+        ImportCommand.__init__(self)
         self.feature_name = feature_name
         self.value = value
         self.lineno = lineno
@@ -244,8 +346,12 @@ class FeatureCommand(ImportCommand):
 
 class ProgressCommand(ImportCommand):
 
+    __slots__ = ('message',)
+
+    name = 'progress'
+
     def __init__(self, message):
-        ImportCommand.__init__(self, 'progress')
+        ImportCommand.__init__(self)
         self.message = message
 
     def __repr__(self):
@@ -254,8 +360,12 @@ class ProgressCommand(ImportCommand):
 
 class ResetCommand(ImportCommand):
 
+    __slots__ = ('ref', 'from_')
+
+    name = 'reset'
+
     def __init__(self, ref, from_):
-        ImportCommand.__init__(self, 'reset')
+        ImportCommand.__init__(self)
         self.ref = ref
         self.from_ = from_
 
@@ -274,8 +384,12 @@ class ResetCommand(ImportCommand):
 
 class TagCommand(ImportCommand):
 
+    __slots__ = ('id', 'from_', 'tagger', 'message')
+
+    name = 'tag'
+
     def __init__(self, id, from_, tagger, message):
-        ImportCommand.__init__(self, 'tag')
+        ImportCommand.__init__(self)
         self.id = id
         self.from_ = from_
         self.tagger = tagger
@@ -300,19 +414,24 @@ class TagCommand(ImportCommand):
 
 class FileCommand(ImportCommand):
     """Base class for file commands."""
-    pass
+
+    __slots__ = ()
 
 
 class FileModifyCommand(FileCommand):
 
+    __slots__ = ('path', 'mode', 'dataref', 'data')
+
+    name = 'filemodify'
+    _binary = ('data',)
+
     def __init__(self, path, mode, dataref, data):
         # Either dataref or data should be null
-        FileCommand.__init__(self, 'filemodify')
+        FileCommand.__init__(self)
         self.path = check_path(path)
         self.mode = mode
         self.dataref = dataref
         self.data = data
-        self._binary = ['data']
 
     def __repr__(self):
         return self.to_string(include_file_contents=True)
@@ -320,6 +439,13 @@ class FileModifyCommand(FileCommand):
     def __str__(self):
         return self.to_string(include_file_contents=False)
 
+    def iter_chunks(self):
+        yield self.to_string(include_file_contents=False)
+        if self.dataref is None and not stat.S_ISDIR(self.mode):
+            yield "\ndata %d\n" % len(self.data)
+            for chunk in payload.iter_chunks(self.data):
+                yield chunk
+
     def _format_mode(self, mode):
         if mode in (0755, 0100755):
             return "755"
@@ -350,8 +476,12 @@ class FileModifyCommand(FileCommand):
 
 class FileDeleteCommand(FileCommand):
 
+    __slots__ = ('path',)
+
+    name = 'filedelete'
+
     def __init__(self, path):
-        FileCommand.__init__(self, 'filedelete')
+        FileCommand.__init__(self)
         self.path = check_path(path)
 
     def __repr__(self):
@@ -360,8 +490,12 @@ class FileDeleteCommand(FileCommand):
 
 class FileCopyCommand(FileCommand):
 
+    __slots__ = ('src_path', 'dest_path')
+
+    name = 'filecopy'
+
     def __init__(self, src_path, dest_path):
-        FileCommand.__init__(self, 'filecopy')
+        FileCommand.__init__(self)
         self.src_path = check_path(src_path)
         self.dest_path = check_path(dest_path)
 
@@ -373,8 +507,12 @@ class FileCopyCommand(FileCommand):
 
 class FileRenameCommand(FileCommand):
 
+    __slots__ = ('old_path', 'new_path')
+
+    name = 'filerename'
+
     def __init__(self, old_path, new_path):
-        FileCommand.__init__(self, 'filerename')
+        FileCommand.__init__(self)
         self.old_path = check_path(old_path)
         self.new_path = check_path(new_path)
 
@@ -385,20 +523,40 @@ class FileRenameCommand(FileCommand):
 
 
 class FileDeleteAllCommand(FileCommand):
+    """A deleteall command.
+
+    It has no fields, so a single instance is shared by all of them.
+    """
+
+    __slots__ = ()
+
+    name = 'filedeleteall'
+
+    def __new__(cls):
+        instance = cls.__dict__.get('_instance')
+        if instance is None:
+            instance = FileCommand.__new__(cls)
+            cls._instance = instance
+        return instance
 
     def __init__(self):
-        FileCommand.__init__(self, 'filedeleteall')
+        FileCommand.__init__(self)
 
     def __repr__(self):
         return "deleteall"
 
+
 class NoteModifyCommand(FileCommand):
 
+    __slots__ = ('from_', 'data')
+
+    name = 'notemodify'
+    _binary = ('data',)
+
     def __init__(self, from_, data):
-        super(NoteModifyCommand, self).__init__('notemodify')
+        super(NoteModifyCommand, self).__init__()
         self.from_ = from_
         self.data = data
-        self._binary = ['data']
 
     def __str__(self):
         return "N inline :%s" % self.from_
@@ -460,10 +618,14 @@ def format_who_when(fields):
 
 
 def format_property(name, value):
-    """Format the name and value (both unicode) of a property as a string."""
-    utf8_name = name.encode('utf8')
+    """Format the name and value (unicode or bytes) of a property as a string."""
+    utf8_name = name
+    if isinstance(utf8_name, unicode):
+        utf8_name = utf8_name.encode('utf8')
     if value is not None:
-        utf8_value = value.encode('utf8')
+        utf8_value = value
+        if isinstance(utf8_value, unicode):
+            utf8_value = utf8_value.encode('utf8')
         result = "property %s %d %s" % (utf8_name, len(utf8_value), utf8_value)
     else:
         result = "property %s" % (utf8_name,)
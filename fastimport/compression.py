@@ -0,0 +1,340 @@
+# Copyright (C) 2026 Canonical Ltd
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Reading and writing of compressed streams.
+
+gzip and bzip2 are always supported; xz needs an lzma module (Python 3's
+or the backports.lzma package). Compressed input is recognised by its
+first bytes:
+
+   input = fastimport.compression.open_input(open('export.fi.gz', 'rb'))
+   p = fastimport.parser.ImportParser(input)
+
+and output is compressed by wrapping the file written to:
+
+   outf = fastimport.compression.CompressingFile(sys.stdout, 'xz')
+   ...
+   outf.close()
+
+The (de)compression is done in a background thread, so it overlaps with
+parsing or producing the stream.
+"""
+
+import bz2
+import Queue
+import sys
+import threading
+import zlib
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+from fastimport import (
+    errors,
+    parser,
+    readahead,
+    )
+
+
+# Number of bytes of compressed data read at a time
+BLOCK_SIZE = 256 * 1024
+
+# Number of bytes written collected before compressing them
+WRITE_BLOCK_SIZE = 1024 * 1024
+
+# The magic bytes starting each format
+_MAGIC = [
+    ('gz', '\x1f\x8b'),
+    ('bz2', 'BZh'),
+    ('xz', '\xfd7zXZ\x00'),
+    ]
+_MAGIC_SIZE = max([len(magic) for format, magic in _MAGIC])
+
+FORMATS = [format for format, magic in _MAGIC]
+
+
+def detect(prefix):
+    """Find the compression format of data from its first bytes.
+
+    :return: 'gz', 'bz2', 'xz' or None if the data doesn't look compressed
+    """
+    for format, magic in _MAGIC:
+        if prefix.startswith(magic):
+            return format
+    return None
+
+
+def _check_format(format):
+    if format not in FORMATS:
+        raise errors.UnsupportedCompression(format)
+    if format == 'xz' and lzma is None:
+        raise errors.UnsupportedCompression(format, "no lzma module")
+
+
+def _decompressor(format):
+    if format == 'gz':
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    elif format == 'bz2':
+        return bz2.BZ2Decompressor()
+    else:
+        return lzma.LZMADecompressor()
+
+
+def _compressor(format, level):
+    if format == 'gz':
+        return zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    elif format == 'bz2':
+        return bz2.BZ2Compressor(level)
+    else:
+        return lzma.LZMACompressor(preset=level)
+
+
+class DecompressingFile(object):
+    """A file-like object reading the decompressed data of another.
+
+    Only read is supported. Concatenated compressed streams, as written
+    by "cat a.gz b.gz", are read one after the other.
+    """
+
+    def __init__(self, input, format, block_size=BLOCK_SIZE):
+        _check_format(format)
+        self.input = input
+        self.format = format
+        self.block_size = block_size
+        self._decompressor = _decompressor(format)
+        self._unused = ''
+        # Decompressed data not read yet: _pending from _pos on
+        self._pending = ''
+        self._pos = 0
+        # Pipes and sockets are read without waiting for a whole block
+        self._read = parser.block_reader(input, binary=True)
+
+    def _decompress(self):
+        """Decompress the next piece of the input.
+
+        :return: the data, or '' at the end of the input
+        """
+        while True:
+            data = self._unused or self._read(self.block_size)
+            self._unused = ''
+            if not data:
+                return ''
+            try:
+                result = self._decompressor.decompress(data)
+            except EOFError:
+                # The last stream ended exactly at the end of the data
+                # before, so there was no unused data to tell
+                self._decompressor = _decompressor(self.format)
+                result = self._decompressor.decompress(data)
+            if self._decompressor.unused_data:
+                # The end of a stream was found; another one may follow
+                self._unused = self._decompressor.unused_data
+                self._decompressor = _decompressor(self.format)
+            if result:
+                return result
+
+    def read(self, size=-1):
+        """Read at most size bytes, or all that is left if size < 0.
+
+        Fewer bytes than asked for may be returned before the end of
+        the data.
+        """
+        if size < 0:
+            parts = [self._pending[self._pos:]]
+            self._pending = ''
+            self._pos = 0
+            while True:
+                data = self._decompress()
+                if not data:
+                    return ''.join(parts)
+                parts.append(data)
+        if self._pos == len(self._pending):
+            self._pending = self._decompress()
+            self._pos = 0
+        if self._pos == 0 and size >= len(self._pending):
+            # Hand the whole piece over without copying it
+            result = self._pending
+        else:
+            result = self._pending[self._pos:self._pos + size]
+        self._pos += len(result)
+        return result
+
+
+class _PrefixedFile(object):
+    """A file-like object putting back bytes read from another.
+
+    Besides read, readline and fileno are supported, and read1 if the
+    other file has it, so that pipes can be read without waiting for
+    whole blocks (see parser.block_reader).
+    """
+
+    def __init__(self, prefix, input):
+        self._prefix = prefix
+        self.input = input
+        if getattr(input, 'read1', None) is not None:
+            self.read1 = self._read1
+
+    def fileno(self):
+        return self.input.fileno()
+
+    def _read1(self, size=-1):
+        if not self._prefix:
+            return self.input.read1(size)
+        return self.read(size)
+
+    def readline(self, size=-1):
+        if not self._prefix:
+            return self.input.readline(size)
+        end = self._prefix.find('\n') + 1 or len(self._prefix)
+        if size >= 0:
+            end = min(end, size)
+        result = self._prefix[:end]
+        self._prefix = self._prefix[end:]
+        if not (self._prefix or result.endswith('\n') or
+            len(result) == size):
+            # The rest of the line follows the prefix
+            if size >= 0:
+                size -= len(result)
+            result += self.input.readline(size)
+        return result
+
+    def read(self, size=-1):
+        if not self._prefix:
+            return self.input.read(size)
+        if size < 0:
+            result = self._prefix + self.input.read()
+            self._prefix = ''
+        else:
+            result = self._prefix[:size]
+            self._prefix = self._prefix[size:]
+        return result
+
+
+def open_input(input, read_ahead=True):
+    """Get the decompressed data of input if it is compressed.
+
+    :param input: a file-like object
+    :param read_ahead: if True, decompress in a background thread
+    :return: input itself if it isn't compressed and can seek, otherwise
+      a file-like object reading its (decompressed) data
+    """
+    try:
+        offset = input.tell()
+    except (AttributeError, IOError, ValueError):
+        offset = None
+    prefix = input.read(_MAGIC_SIZE)
+    if offset is None:
+        input = _PrefixedFile(prefix, input)
+    else:
+        input.seek(offset)
+    format = detect(prefix)
+    if format is None:
+        return input
+    result = DecompressingFile(input, format)
+    if read_ahead:
+        result = readahead.ReadAheadFile(result)
+    return result
+
+
+class CompressingFile(object):
+    """A file-like object writing compressed data to another.
+
+    Only write, flush and close are supported. Data is compressed and
+    written in a background thread, a block at a time. Closing doesn't
+    close the file written to.
+    """
+
+    def __init__(self, outf, format='gz', level=6,
+        block_size=WRITE_BLOCK_SIZE, depth=readahead.DEPTH):
+        _check_format(format)
+        self.outf = outf
+        self.format = format
+        self.block_size = block_size
+        self._compressor = _compressor(format, level)
+        self._parts = []
+        self._size = 0
+        self._error = None
+        self._closed = False
+        self._queue = Queue.Queue(depth)
+        self._thread = threading.Thread(target=self._compress,
+            name='fastimport compression')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _compress(self):
+        """Compress and write the queued blocks.
+
+        This runs in the background thread. None marks the end.
+        """
+        while True:
+            block = self._queue.get()
+            try:
+                if self._error is None:
+                    if block is None:
+                        self.outf.write(self._compressor.flush())
+                    else:
+                        self.outf.write(self._compressor.compress(block))
+            except Exception:
+                self._error = sys.exc_info()
+            self._queue.task_done()
+            if block is None:
+                break
+
+    def _check_error(self):
+        # The error is kept, as nothing more can be written after it
+        error = self._error
+        if error is not None:
+            raise error[0], error[1], error[2]
+
+    def _queue_parts(self):
+        if self._parts:
+            self._queue.put(''.join(self._parts))
+            self._parts = []
+            self._size = 0
+
+    def write(self, data):
+        if self._closed:
+            raise ValueError("I/O operation on closed file")
+        self._check_error()
+        self._parts.append(str(data))
+        self._size += len(data)
+        if self._size >= self.block_size:
+            self._queue_parts()
+
+    def flush(self):
+        """Write out the data written so far, as far as possible.
+
+        The compressor may keep some of it until close.
+        """
+        self._queue_parts()
+        self._queue.join()
+        self._check_error()
+        self.outf.flush()
+
+    def close(self):
+        """Finish the compressed data."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue_parts()
+        self._queue.put(None)
+        self._thread.join()
+        self._check_error()
+        self.outf.flush()
@@ -24,9 +24,38 @@ timestamp,timezone where
 """
 
 
+import array
+import calendar
+import email.utils
 import time
 
-from fastimport import errors
+from fastimport import (
+    errors,
+    helpers,
+    )
+
+
+# The array typecodes of timestamps and timezones parsed in bulk
+TIMESTAMP_TYPECODE = helpers.array_typecode(8, True)
+TIMEZONE_TYPECODE = helpers.array_typecode(4, True)
+
+# The timezones already parsed by parse_raw, by their text. Streams only
+# use a few of them; no more than _MAX_TIMEZONES are kept.
+_timezones = {}
+_MAX_TIMEZONES = 1024
+
+# Month and weekday names of rfc2822 dates as usually written
+_MONTHS = dict((name, i + 1) for i, name in enumerate(
+    ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct',
+     'Nov', 'Dec']))
+_WEEKDAYS = frozenset(['Mon,', 'Tue,', 'Wed,', 'Thu,', 'Fri,', 'Sat,',
+    'Sun,'])
+
+# The days since the epoch of the dates already seen by parse_rfc2822,
+# by their text without the time, e.g. "Tue, 3 Jun 2008"; no more than
+# _MAX_DAYS are kept.
+_days = {}
+_MAX_DAYS = 64 * 1024
 
 
 def parse_raw(s, lineno=0):
@@ -34,23 +63,64 @@ def parse_raw(s, lineno=0):
     
     The format must be exactly "seconds-since-epoch offset-utc".
     See the spec for details.
+
+    The timestamp is an int, or a float if it isn't a whole number.
     """
     timestamp_str, timezone_str = s.split(' ', 1)
-    timestamp = float(timestamp_str)
     try:
-        timezone = parse_tz(timezone_str)
+        timestamp = int(timestamp_str)
     except ValueError:
-        raise errors.InvalidTimezone(lineno, timezone_str)
+        timestamp = float(timestamp_str)
+    timezone = _timezones.get(timezone_str)
+    if timezone is None:
+        timezone = _parse_raw_tz(timezone_str, lineno)
     return timestamp, timezone
 
 
+def _parse_raw_tz(tz, lineno):
+    """Parse a timezone not found in _timezones, and remember it."""
+    try:
+        timezone = parse_tz(tz)
+    except ValueError:
+        raise errors.InvalidTimezone(lineno, tz)
+    if len(_timezones) < _MAX_TIMEZONES:
+        _timezones[tz] = timezone
+    return timezone
+
+
+def parse_raw_dates(strings, lineno=0):
+    """Parse many dates in the raw format at once.
+
+    :param strings: an iterable of strings as for parse_raw; lineno is
+      that of the first one and counts up by one for each string
+    :return: a tuple of two arrays, of the timestamps (whole seconds)
+      and of the timezones
+    """
+    timestamps = array.array(TIMESTAMP_TYPECODE)
+    timezones = array.array(TIMEZONE_TYPECODE)
+    add_timestamp = timestamps.append
+    add_timezone = timezones.append
+    get_timezone = _timezones.get
+    for s in strings:
+        timestamp_str, timezone_str = s.split(' ', 1)
+        try:
+            add_timestamp(int(timestamp_str))
+        except ValueError:
+            add_timestamp(int(float(timestamp_str)))
+        timezone = get_timezone(timezone_str)
+        if timezone is None:
+            timezone = _parse_raw_tz(timezone_str, lineno + len(timezones))
+        add_timezone(timezone)
+    return timestamps, timezones
+
+
 def parse_tz(tz):
     """Parse a timezone specification in the [+|-]HHMM format.
 
     :return: the timezone offset in seconds.
     """
     # from git_repository.py in bzr-git
-    if tz[0] not in ('+', '-'):
+    if not tz or tz[0] not in ('+', '-'):
         raise ValueError(tz)
     sign = {'+': +1, '-': -1}[tz[0]]
     hours = int(tz[1:-2])
@@ -62,8 +132,70 @@ def parse_rfc2822(s, lineno=0):
     """Parse a date from a rfc2822 string.
     
     See the spec for details.
+
+    Dates written as git and Mercurial do, e.g. "Tue, 3 Jun 2008
+    12:34:56 +0200", are parsed directly; anything else is left to
+    email.utils.
+    """
+    parts = s.rsplit(' ', 2)
+    if len(parts) == 3:
+        day_str, clock, timezone_str = parts
+        days = _days.get(day_str)
+        if days is None:
+            days = _parse_day(day_str)
+        timezone = _timezones.get(timezone_str)
+        if timezone is None and timezone_str[:1] in ('+', '-'):
+            timezone = _parse_raw_tz(timezone_str, lineno)
+        if (days is not None and timezone is not None and
+            len(clock) == 8 and clock[2] == ':' and clock[5] == ':'):
+            try:
+                hours = int(clock[:2])
+                minutes = int(clock[3:5])
+                seconds = int(clock[6:])
+            except ValueError:
+                pass
+            else:
+                if hours < 24 and minutes < 60 and seconds < 62:
+                    return (((days * 24 + hours) * 60 + minutes) * 60 +
+                        seconds - timezone, timezone)
+    return _parse_rfc2822_slowly(s, lineno)
+
+
+def _parse_day(s):
+    """Count the days from the epoch to a date such as "Tue, 3 Jun 2008".
+
+    :return: the number of days, or None if the date isn't written in
+      that way
     """
-    raise NotImplementedError(parse_rfc2822)
+    parts = s.split()
+    if len(parts) == 4 and parts[0] in _WEEKDAYS:
+        del parts[0]
+    if len(parts) != 3:
+        return None
+    day_str, month_str, year_str = parts
+    month = _MONTHS.get(month_str)
+    if month is None or len(year_str) != 4:
+        return None
+    try:
+        day = int(day_str)
+        year = int(year_str)
+    except ValueError:
+        return None
+    if not 1 <= day <= 31:
+        return None
+    days = calendar.timegm((year, month, day, 0, 0, 0)) // 86400
+    if len(_days) < _MAX_DAYS:
+        _days[s] = days
+    return days
+
+
+def _parse_rfc2822_slowly(s, lineno):
+    """Parse any rfc2822 date understood by email.utils."""
+    fields = email.utils.parsedate_tz(s)
+    if fields is None:
+        raise errors.InvalidDate(lineno, s)
+    timezone = fields[9] or 0
+    return calendar.timegm(fields[:6]) - timezone, timezone
 
 
 def parse_now(s, lineno=0):
@@ -165,6 +165,16 @@ class InvalidTimezone(ParsingError):
             self.reason = ''
 
 
+class InvalidDate(ParsingError):
+    """Raised when a date can't be parsed."""
+
+    _fmt = (_LOCATION_FMT + "Date %(date)r could not be parsed.")
+
+    def __init__(self, lineno, date):
+        ParsingError.__init__(self, lineno)
+        self.date = date
+
+
 class PrematureEndOfStream(ParsingError):
     """Raised when the 'done' feature was specified but missing."""
 
@@ -237,3 +247,37 @@ class UnknownFeature(ImportError):
     def __init__(self, feature):
         ImportError.__init__(self)
         self.feature = feature
+
+
+class BadIndex(ImportError):
+    """Raised when a stream index can't be read or doesn't fit the stream."""
+
+    _fmt = ("Bad stream index - %(reason)s")
+
+    def __init__(self, reason):
+        ImportError.__init__(self)
+        self.reason = reason
+
+
+class BadMarks(ImportError):
+    """Raised when a marks file can't be read."""
+
+    _fmt = ("Bad marks file - %(reason)s")
+
+    def __init__(self, reason):
+        ImportError.__init__(self)
+        self.reason = reason
+
+
+class UnsupportedCompression(ImportError):
+    """Raised when a compression format can't be read or written."""
+
+    _fmt = ("Unsupported compression format '%(format)s'%(reason)s")
+
+    def __init__(self, format, reason=None):
+        ImportError.__init__(self)
+        self.format = format
+        if reason:
+            self.reason = ' - ' + reason
+        else:
+            self.reason = ''
@@ -0,0 +1,203 @@
+# Copyright (C) 2026 Canonical Ltd
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Parser which is given the bytes of a stream as they arrive.
+
+Rather than reading from a file object, a FeedParser is fed chunks of
+any size and returns the commands they complete, so it can be driven by
+network callbacks or event loops:
+
+   p = fastimport.feedparser.FeedParser()
+   for chunk in chunks:
+       for cmd in p.feed(chunk):
+           ...
+   for cmd in p.close():
+       ...
+"""
+
+import collections
+import sys
+
+from fastimport import (
+    parser,
+    scanner,
+    )
+
+
+# Commands which end with their header line; the others may only be
+# parsed once the line after them has arrived
+_ONE_LINE_COMMANDS = ('checkpoint', 'feature', 'progress')
+
+
+class _FeedInput(object):
+    """The bytes fed to a FeedParser which it hasn't read yet."""
+
+    def __init__(self):
+        self._chunks = collections.deque()
+        self._size = 0
+
+    def append(self, chunk):
+        self._chunks.append(chunk)
+        self._size += len(chunk)
+
+    def read(self, size=-1):
+        if size < 0 or size >= self._size:
+            result = ''.join(self._chunks)
+            self._chunks.clear()
+            self._size = 0
+            return result
+        parts = []
+        missing = size
+        while missing:
+            chunk = self._chunks.popleft()
+            if len(chunk) > missing:
+                self._chunks.appendleft(chunk[missing:])
+                chunk = chunk[:missing]
+            parts.append(chunk)
+            missing -= len(chunk)
+        self._size -= size
+        return ''.join(parts)
+
+
+class FeedParser(parser.ImportParser):
+    """An ImportParser fed with bytes instead of reading them.
+
+    The bytes fed are scanned as they arrive to find where commands end,
+    skipping data sections and property values by their declared length.
+    A command is only parsed once all of it has arrived, including the
+    line after it when the grammar needs to look ahead, so parsing never
+    waits for input.
+    """
+
+    def __init__(self, verbose=False, output=sys.stdout, user_mapper=None,
+        strict=True, spool_threshold=None):
+        """Create a parser.
+
+        The parameters are as for ImportParser.
+        """
+        parser.ImportParser.__init__(self, _FeedInput(), verbose=verbose,
+            output=output, user_mapper=user_mapper, strict=strict,
+            spool_threshold=spool_threshold)
+        self._command_iter = self.iter_commands()
+        # Scanning state: the unfinished last line, the bytes of data
+        # left to skip and the terminator of delimited data being skipped
+        self._tail = []
+        self._skip = 0
+        self._terminator = None
+        self._done = False
+        # Number of commands which have arrived and been parsed, and
+        # whether the start of another one has arrived
+        self._complete = 0
+        self._parsed = 0
+        self._started = False
+
+    def feed(self, data):
+        """Give the parser the next bytes of the stream.
+
+        :return: the list of commands completed by the bytes
+        """
+        if self._done:
+            # Anything after a 'done' command is ignored
+            return []
+        self.input.append(data)
+        self._scan(data)
+        return self._parse_complete()
+
+    def close(self):
+        """Tell the parser the stream has ended.
+
+        :return: the list of the remaining commands
+        """
+        self._done = True
+        return list(self._command_iter)
+
+    def _scan(self, data):
+        """Look for the ends of commands in the bytes fed."""
+        pos = 0
+        size = len(data)
+        while pos < size and not self._done:
+            if self._skip:
+                skipped = min(self._skip, size - pos)
+                self._skip -= skipped
+                pos += skipped
+                continue
+            end = data.find('\n', pos)
+            if end == -1:
+                self._tail.append(data[pos:])
+                break
+            line = data[pos:end]
+            if self._tail:
+                self._tail.append(line)
+                line = ''.join(self._tail)
+                self._tail = []
+            pos = end + 1
+            self._scan_line(line)
+
+    def _scan_line(self, line):
+        if self._terminator is not None:
+            if line == self._terminator:
+                self._terminator = None
+        elif line.startswith('data '):
+            rest = line[len('data '):]
+            if rest.startswith('<<'):
+                self._terminator = rest[2:]
+            else:
+                try:
+                    self._skip = int(rest)
+                except ValueError:
+                    # Left for the parser to report
+                    pass
+        elif line.startswith('property '):
+            # The value may go on over the next lines, which are skipped
+            # like data
+            parts = line[len('property '):].split(' ', 2)
+            if len(parts) > 1:
+                if len(parts) > 2:
+                    value = parts[2]
+                else:
+                    value = ''
+                try:
+                    self._skip = max(0, int(parts[1]) - len(value))
+                except ValueError:
+                    # Left for the parser to report
+                    pass
+        elif line.startswith(scanner.HEADER_PREFIXES):
+            if self._started:
+                self._complete += 1
+            for prefix, name in scanner.HEADERS:
+                if line.startswith(prefix):
+                    break
+            if name == 'done':
+                self._done = True
+                self._started = False
+            elif name in _ONE_LINE_COMMANDS:
+                self._complete += 1
+                self._started = False
+            else:
+                self._started = True
+
+    def _parse_complete(self):
+        """Parse the commands which have arrived."""
+        cmds = []
+        while self._parsed < self._complete:
+            self._parsed += 1
+            try:
+                cmds.append(self._command_iter.next())
+            except StopIteration:
+                break
+        if self._done:
+            # Let the parser see the 'done' command
+            cmds.extend(self._command_iter)
+        return cmds
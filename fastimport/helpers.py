@@ -15,6 +15,8 @@
 
 """Miscellaneous useful stuff."""
 
+import array
+
 
 def _common_path_and_rest(l1, l2, common=[]):
     # From http://code.activestate.com/recipes/208993/
@@ -88,3 +90,51 @@ def is_inside_any(dir_list, fname):
         if is_inside(dirname, fname):
             return True
     return False
+
+
+def array_typecode(size, signed):
+    """Find the array typecode for integers of a given size in bytes."""
+    if signed:
+        codes = 'bhil'
+    else:
+        codes = 'BHIL'
+    for code in codes:
+        if array.array(code).itemsize == size:
+            return code
+    raise AssertionError("no %d byte integer array type" % (size,))
+
+
+class InternTable(dict):
+    """A bounded table of values computed from keys, such as parsed paths.
+
+    Looking a key up returns the value already computed for it, so
+    repeated keys share one value and the work of computing it is only
+    done once. A key not yet in the table is passed to make.
+
+    The table holds two generations of at most size entries each: new
+    entries go into the current one and, when it is full, it becomes the
+    old one and the previous old one is dropped. Entries found in the
+    old generation are moved back into the current one, so the entries
+    dropped are the least recently used ones. Unlike a strict LRU list,
+    nothing is done on a hit in the current generation, which is just a
+    dict lookup.
+
+    len() and the dict methods only see the current generation.
+    """
+
+    def __init__(self, make, size):
+        dict.__init__(self)
+        self.make = make
+        self.size = size
+        self._old = {}
+
+    def __missing__(self, key):
+        if key in self._old:
+            value = self._old.pop(key)
+        else:
+            value = self.make(key)
+        if len(self) >= self.size:
+            self._old = self.copy()
+            self.clear()
+        self[key] = value
+        return value
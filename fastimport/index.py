@@ -0,0 +1,280 @@
+# Copyright (C) 2026 Canonical Ltd
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Indexes giving random access into a fast-import stream.
+
+An index records where each command of a stream is, so a single command
+can be parsed without parsing what comes before it:
+
+   index = fastimport.index.build_index(open('export.fi', 'rb'))
+   index.save(open('export.fi.idx', 'wb'))
+   ...
+   index = fastimport.index.StreamIndex.load(open('export.fi.idx', 'rb'))
+   reader = fastimport.index.StreamReader(open('export.fi', 'rb'), index)
+   commit = reader.get(42)
+
+The index is stored as a few fixed-width columns (command kind, mark,
+offset, length, timestamp and ref) plus a table of the ref names.
+"""
+
+import array
+import struct
+import sys
+
+from fastimport import (
+    commands,
+    errors,
+    helpers,
+    marks,
+    parser,
+    )
+
+
+_MAGIC = 'FIDX'
+_VERSION = 1
+_HEADER = struct.Struct('<4sII')
+
+# Number of bytes copied at a time when extracting
+_CHUNK_SIZE = 1024 * 1024
+
+
+# (name, typecode) of the columns, in the order they are stored
+_COLUMNS = [
+    ('kinds', helpers.array_typecode(1, False)),
+    ('marks', helpers.array_typecode(8, False)),
+    ('offsets', helpers.array_typecode(8, False)),
+    ('lengths', helpers.array_typecode(8, False)),
+    ('timestamps', helpers.array_typecode(8, True)),
+    ('refs', helpers.array_typecode(4, False)),
+    ]
+
+# Ref number used for commands without a ref
+NO_REF = 0xffffffff
+
+
+class StreamIndex(object):
+    """Where each command of a fast-import stream is.
+
+    Each column is an array with an item per command, in stream order:
+
+    :ivar kinds: the position of the command name in
+      commands.COMMAND_NAMES
+    :ivar marks: the mark of the command, or 0 if it has none
+    :ivar offsets: the offset of the command in the stream
+    :ivar lengths: the number of bytes of the command
+    :ivar timestamps: the committer or tagger timestamp, or 0
+    :ivar refs: the position in ref_names of the ref of a commit or reset
+      or the name of a tag, or NO_REF
+    :ivar ref_names: the list of distinct refs
+    """
+
+    def __init__(self):
+        for name, typecode in _COLUMNS:
+            setattr(self, name, array.array(typecode))
+        self.ref_names = []
+        self._ref_ids = {}
+        self._by_mark = None
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def add(self, cmd):
+        """Record a parsed command.
+
+        The command must have its offset and end_offset set.
+        """
+        self.kinds.append(commands.COMMAND_NAMES.index(cmd.name))
+        if cmd.name in ('blob', 'commit'):
+            # 0 for no mark, as cmd.id is then not a mark reference
+            self.marks.append(marks.mark_number(cmd.id) or 0)
+        else:
+            self.marks.append(0)
+        self.offsets.append(cmd.offset)
+        self.lengths.append(cmd.end_offset - cmd.offset)
+        if cmd.name == 'commit':
+            timestamp, ref = cmd.committer[2], cmd.ref
+        elif cmd.name == 'tag':
+            timestamp, ref = cmd.tagger and cmd.tagger[2] or 0, cmd.id
+        elif cmd.name == 'reset':
+            timestamp, ref = 0, cmd.ref
+        else:
+            timestamp, ref = 0, None
+        self.timestamps.append(int(timestamp))
+        self.refs.append(self._ref_id(ref))
+        self._by_mark = None
+
+    def _ref_id(self, ref):
+        if ref is None:
+            return NO_REF
+        ref_id = self._ref_ids.get(ref)
+        if ref_id is None:
+            ref_id = self._ref_ids[ref] = len(self.ref_names)
+            self.ref_names.append(ref)
+        return ref_id
+
+    def kind(self, i):
+        """Get the name of the i'th command."""
+        return commands.COMMAND_NAMES[self.kinds[i]]
+
+    def ref(self, i):
+        """Get the ref of the i'th command, or None."""
+        ref_id = self.refs[i]
+        if ref_id == NO_REF:
+            return None
+        return self.ref_names[ref_id]
+
+    def find(self, mark):
+        """Find the command with a given mark.
+
+        If a mark is reused, the last command with it is found.
+
+        :param mark: the mark, as an integer or a string with or without
+          the leading colon
+        :return: the position of the command in the index
+        :raise KeyError: if no command has the mark
+        """
+        if isinstance(mark, basestring):
+            mark = marks.mark_number(':' + mark.lstrip(':')) or 0
+        if self._by_mark is None:
+            self._build_mark_table()
+        if 0 < mark < len(self._by_mark):
+            i = self._by_mark[mark]
+            if i >= 0:
+                return i
+        raise KeyError(mark)
+
+    def _build_mark_table(self):
+        # Marks are expected to be dense, so an array indexed by mark is
+        # smaller than a dict
+        if len(self.marks):
+            size = max(self.marks) + 1
+        else:
+            size = 1
+        by_mark = array.array(helpers.array_typecode(8, True), [-1]) * size
+        for i, mark in enumerate(self.marks):
+            if mark:
+                by_mark[mark] = i
+        self._by_mark = by_mark
+
+    def save(self, f):
+        """Write the index to a file-like object."""
+        f.write(_HEADER.pack(_MAGIC, _VERSION, len(self)))
+        for name, typecode in _COLUMNS:
+            column = getattr(self, name)
+            if sys.byteorder != 'little':
+                column = array.array(typecode, column)
+                column.byteswap()
+            f.write(column.tostring())
+        f.write(struct.pack('<I', len(self.ref_names)))
+        for ref in self.ref_names:
+            f.write(struct.pack('<I', len(ref)))
+            f.write(ref)
+
+    @classmethod
+    def load(cls, f):
+        """Read an index written by save from a file-like object."""
+        header = f.read(_HEADER.size)
+        if len(header) != _HEADER.size:
+            raise errors.BadIndex("truncated header")
+        magic, version, count = _HEADER.unpack(header)
+        if magic != _MAGIC or version != _VERSION:
+            raise errors.BadIndex("unknown format")
+        index = cls()
+        for name, typecode in _COLUMNS:
+            column = getattr(index, name)
+            data = f.read(count * column.itemsize)
+            if len(data) != count * column.itemsize:
+                raise errors.BadIndex("truncated %s" % (name,))
+            column.fromstring(data)
+            if sys.byteorder != 'little':
+                column.byteswap()
+        (ref_count,) = struct.unpack('<I', f.read(4))
+        for i in xrange(ref_count):
+            (size,) = struct.unpack('<I', f.read(4))
+            index._ref_id(f.read(size))
+        return index
+
+
+def build_index(input, **kwargs):
+    """Build the index of a fast-import stream.
+
+    File contents are skipped over rather than read where possible.
+
+    :param input: the file-like object to read the stream from
+    :param kwargs: passed on to ImportParser
+    :return: a StreamIndex
+    """
+    kwargs.setdefault('lazy_data', True)
+    index = StreamIndex()
+    for cmd in parser.ImportParser(input, **kwargs).iter_commands():
+        index.add(cmd)
+    return index
+
+
+class StreamReader(object):
+    """Random access to the commands of a fast-import stream."""
+
+    def __init__(self, input, index, **kwargs):
+        """Create a reader.
+
+        :param input: the stream, as a seekable file-like object
+        :param index: the StreamIndex of the stream
+        :param kwargs: passed on to the ImportParser used for each
+          command; lazy_data is on by default
+        """
+        self.input = input
+        self.index = index
+        kwargs.setdefault('lazy_data', True)
+        self._parser_kwargs = kwargs
+
+    def get(self, mark):
+        """Parse the command with a given mark.
+
+        Line numbers of the command are counted from where it starts.
+
+        :raise KeyError: if no command has the mark
+        """
+        return self.parse(self.index.find(mark))
+
+    def parse(self, i):
+        """Parse the i'th command of the stream."""
+        self.input.seek(self.index.offsets[i])
+        p = parser.ImportParser(self.input, **self._parser_kwargs)
+        return p.iter_commands().next()
+
+    def extract(self, start_mark, end_mark, outf):
+        """Copy the commands between two marks to a file-like object.
+
+        The blobs just before the first command are copied too, as
+        exporters output the blobs a commit uses just before it.
+
+        :param start_mark: the mark of the first command to copy
+        :param end_mark: the mark of the last command to copy
+        """
+        start = self.index.find(start_mark)
+        end = self.index.find(end_mark)
+        blob = commands.COMMAND_NAMES.index('blob')
+        while start > 0 and self.index.kinds[start - 1] == blob:
+            start -= 1
+        offset = self.index.offsets[start]
+        remaining = (self.index.offsets[end] + self.index.lengths[end] -
+            offset)
+        self.input.seek(offset)
+        while remaining > 0:
+            chunk = self.input.read(min(remaining, _CHUNK_SIZE))
+            if not chunk:
+                raise errors.BadIndex("stream is shorter than the index")
+            outf.write(chunk)
+            remaining -= len(chunk)
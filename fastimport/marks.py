@@ -0,0 +1,567 @@
+# Copyright (C) 2026 Canonical Ltd
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tables of data about the objects of a stream, indexed by mark.
+
+Marks should be dense integers counting up, so rather than dicts keyed
+by ":N" strings, MarkTable and MarkSet hold their data in a list, array
+or bitmap indexed by mark, starting from the first mark seen:
+
+   blobs = fastimport.marks.MarkTable()
+   blobs[cmd.id] = cmd
+   ...
+   blob = blobs[fc.dataref]
+
+Keys may be mark references (":N") or mark numbers. Other keys, e.g.
+the "@lineno" ids of commands without marks, refs or SHA-1s, are kept
+in a dict or set on the side, as are marks far beyond the ones seen.
+
+Marks files, as named by the import-marks and export-marks features, can
+be read and written in git's text format or in a binary format which
+loads by mapping it into memory, whatever the number of marks:
+
+   table = fastimport.marks.load_marks(path)
+   fastimport.marks.save_marks(path, table, binary=True)
+"""
+
+import array
+import mmap
+import os
+import struct
+import sys
+
+from fastimport import (
+    errors,
+    helpers,
+    )
+
+
+# How far, in marks, a table grows to take a mark beyond either of its
+# ends; marks further away go in the dict or set on the side
+_MAX_GAP = 1024 * 1024
+
+
+def mark_number(ref):
+    """Get the number of a mark reference.
+
+    :param ref: a mark reference such as ":12", or a mark number
+    :return: the number, or None if ref isn't a mark
+    """
+    if ref.__class__ is str:
+        if ref[:1] == ':' and ref[1:].isdigit():
+            number = int(ref[1:])
+            if number > 0:
+                return number
+    elif isinstance(ref, (int, long)) and ref > 0:
+        return ref
+    return None
+
+
+def _reference(mark):
+    return ':%d' % (mark,)
+
+
+def _now_in_range(others, low, high):
+    """Find the marks kept on the side which are now in [low, high)."""
+    return [ref for ref in others
+        if mark_number(ref) is not None and low <= mark_number(ref) < high]
+
+
+def _grow_down(base, index, size):
+    """Find how far below its base a table should grow.
+
+    :param index: the index, below 0, of the mark to make room for
+    :param size: the number of marks the table holds room for
+    :return: the number of marks to add, a multiple of 8 so that bitmaps
+      stay aligned on bytes
+    """
+    count = max(-index, size)
+    return min((count + 7) & ~7, base)
+
+
+class _Bitmap(object):
+    """A bit per mark, growing as needed."""
+
+    def __init__(self):
+        self._bits = bytearray()
+
+    def __contains__(self, mark):
+        i = mark >> 3
+        return i < len(self._bits) and bool(self._bits[i] & (1 << (mark & 7)))
+
+    def add(self, mark):
+        """Set the bit of a mark.
+
+        :return: True if it wasn't set before
+        """
+        i = mark >> 3
+        if i >= len(self._bits):
+            self._bits.extend(bytearray(max(i + 1 - len(self._bits),
+                len(self._bits))))
+        bit = 1 << (mark & 7)
+        if self._bits[i] & bit:
+            return False
+        self._bits[i] |= bit
+        return True
+
+    def discard(self, mark):
+        """Clear the bit of a mark.
+
+        :return: True if it was set before
+        """
+        if mark not in self:
+            return False
+        self._bits[mark >> 3] &= ~(1 << (mark & 7)) & 0xff
+        return True
+
+    def prepend(self, count):
+        """Add count clear bits, a multiple of 8, before the others."""
+        self._bits[0:0] = bytearray(count >> 3)
+
+    def __iter__(self):
+        bits = self._bits
+        for i in xrange(len(bits)):
+            byte = bits[i]
+            if byte:
+                for j in xrange(8):
+                    if byte & (1 << j):
+                        yield (i << 3) | j
+
+    def capacity(self):
+        return len(self._bits) << 3
+
+
+class MarkSet(object):
+    """A set of marks (and other ids) held as a bitmap.
+
+    The bitmap starts at the first mark added, rounded down, so that it
+    stays small when marks start high, e.g. when an import carries on
+    from marks loaded from a previous one.
+    """
+
+    def __init__(self, marks=()):
+        self._bitmap = _Bitmap()
+        # The mark of the first bit, once a mark has been added
+        self._base = None
+        self._others = set()
+        self._count = 0
+        for mark in marks:
+            self.add(mark)
+
+    def _index(self, ref):
+        """Get the bit of a mark, or None if ref is kept on the side.
+
+        The bit may be below 0 for a mark just below the base.
+        """
+        mark = mark_number(ref)
+        if mark is None or self._base is None:
+            return None
+        index = mark - self._base
+        if (index < -_MAX_GAP or
+            index >= self._bitmap.capacity() + _MAX_GAP):
+            return None
+        return index
+
+    def __len__(self):
+        return self._count + len(self._others)
+
+    def __contains__(self, ref):
+        index = self._index(ref)
+        if index is None:
+            return ref in self._others
+        return index >= 0 and index in self._bitmap
+
+    def __iter__(self):
+        """Iterate over the members, with marks as mark references."""
+        for index in self._bitmap:
+            yield _reference(index + self._base)
+        for ref in self._others:
+            yield ref
+
+    def add(self, ref):
+        if self._base is None and mark_number(ref) is not None:
+            self._base = mark_number(ref) & ~7
+        index = self._index(ref)
+        if index is None:
+            self._others.add(ref)
+            return
+        capacity = self._bitmap.capacity()
+        if index < 0:
+            count = _grow_down(self._base, index, capacity)
+            self._bitmap.prepend(count)
+            self._base -= count
+            index += count
+        if self._bitmap.add(index):
+            self._count += 1
+        if self._others and self._bitmap.capacity() != capacity:
+            for ref in _now_in_range(self._others, self._base - _MAX_GAP,
+                self._base + self._bitmap.capacity() + _MAX_GAP):
+                # Adding one may have moved others in already
+                if ref in self._others:
+                    self._others.remove(ref)
+                    self.add(ref)
+
+    def discard(self, ref):
+        index = self._index(ref)
+        if index is None:
+            self._others.discard(ref)
+        elif index >= 0 and self._bitmap.discard(index):
+            self._count -= 1
+
+
+class MarkTable(object):
+    """A mapping from marks (and other ids) to values.
+
+    Values are held in a list indexed by mark or, if typecode is given,
+    in an array of that type, which is much smaller for numbers. As for
+    MarkSet, the list starts at the first mark set.
+    """
+
+    def __init__(self, typecode=None):
+        self.typecode = typecode
+        if typecode is None:
+            self._values = []
+        else:
+            self._values = array.array(typecode)
+        # The mark of the first value, once a mark has been set
+        self._base = None
+        self._present = _Bitmap()
+        self._others = {}
+        self._count = 0
+
+    def _index(self, ref):
+        """Get the index of a mark, or None if ref is kept on the side.
+
+        The index may be below 0 for a mark just below the base.
+        """
+        mark = mark_number(ref)
+        if mark is None or self._base is None:
+            return None
+        index = mark - self._base
+        if index < -_MAX_GAP or index >= len(self._values) + _MAX_GAP:
+            return None
+        return index
+
+    def _blank(self, size):
+        if self.typecode is None:
+            return [None] * size
+        return array.array(self.typecode, [0]) * size
+
+    def _grow(self, index):
+        """Make room for a mark, returning its index once there is."""
+        if index < 0:
+            count = _grow_down(self._base, index, len(self._values))
+            self._values = self._blank(count) + self._values
+            self._present.prepend(count)
+            self._base -= count
+            index += count
+        else:
+            self._values.extend(self._blank(
+                max(index + 1 - len(self._values), len(self._values))))
+        return index
+
+    def _take_others(self):
+        """Move in the marks kept on the side which are now in range."""
+        for ref in _now_in_range(self._others, self._base - _MAX_GAP,
+            self._base + len(self._values) + _MAX_GAP):
+            # Setting one may have moved others in already
+            if ref in self._others:
+                self[ref] = self._others.pop(ref)
+
+    def __len__(self):
+        return self._count + len(self._others)
+
+    def __contains__(self, ref):
+        index = self._index(ref)
+        if index is None:
+            return ref in self._others
+        return index >= 0 and index in self._present
+
+    def __getitem__(self, ref):
+        index = self._index(ref)
+        if index is None:
+            return self._others[ref]
+        if index < 0 or index not in self._present:
+            raise KeyError(ref)
+        return self._values[index]
+
+    def get(self, ref, default=None):
+        index = self._index(ref)
+        if index is None:
+            return self._others.get(ref, default)
+        if index < 0 or index not in self._present:
+            return default
+        return self._values[index]
+
+    def __setitem__(self, ref, value):
+        if self._base is None and mark_number(ref) is not None:
+            self._base = mark_number(ref) & ~7
+        index = self._index(ref)
+        if index is None:
+            self._others[ref] = value
+            return
+        grown = index < 0 or index >= len(self._values)
+        if grown:
+            index = self._grow(index)
+        self._values[index] = value
+        if self._present.add(index):
+            self._count += 1
+        # Moving marks in may grow the table again, so only once this
+        # one is in place
+        if grown and self._others:
+            self._take_others()
+
+    def __delitem__(self, ref):
+        index = self._index(ref)
+        if index is None:
+            del self._others[ref]
+        elif index >= 0 and self._present.discard(index):
+            self._count -= 1
+            if self.typecode is None:
+                # Let the value go
+                self._values[index] = None
+        else:
+            raise KeyError(ref)
+
+    def __iter__(self):
+        """Iterate over the keys, with marks as mark references."""
+        for index in self._present:
+            yield _reference(index + self._base)
+        for ref in self._others:
+            yield ref
+
+    def iteritems(self):
+        for index in self._present:
+            yield _reference(index + self._base), self._values[index]
+        for item in self._others.iteritems():
+            yield item
+
+
+# Marks files
+#
+# The text format is git's: a line ":N object-name" per mark. The binary
+# format is, in little-endian order, a header (_BINARY_HEADER), then an
+# array of slots + 1 8-byte offsets into the names which follow them, the
+# name of mark m being names[offsets[m]:offsets[m + 1]] (empty if there
+# is no mark m).
+
+_BINARY_MAGIC = 'FMRK'
+_BINARY_VERSION = 1
+# magic, version, slots (the largest mark + 1), marks, size of the names
+_BINARY_HEADER = struct.Struct('<4sIQQQ')
+_OFFSET = struct.Struct('<QQ')
+_OFFSET_TYPECODE = helpers.array_typecode(8, False)
+
+
+def read_marks(f):
+    """Read a marks file in git's text format.
+
+    :param f: a file-like object
+    :return: a MarkTable of the object names
+    """
+    table = MarkTable()
+    for line in f:
+        line = line.rstrip('\n')
+        if not line:
+            continue
+        parts = line.split(' ', 1)
+        if len(parts) != 2 or mark_number(parts[0]) is None:
+            raise errors.BadMarks("invalid line %r" % (line,))
+        table[parts[0]] = parts[1]
+    return table
+
+
+def _marks_of(table):
+    """Find the marks of a table, leaving out keys which aren't marks.
+
+    :return: a _Bitmap of the marks and the largest mark (or 0)
+    """
+    # Rather than sorting a list of them all, the marks are set in a
+    # bitmap, which is then gone through to look each one up in order
+    present = _Bitmap()
+    last = 0
+    for ref in table:
+        mark = mark_number(ref)
+        if mark is not None:
+            present.add(mark)
+            if mark > last:
+                last = mark
+    return present, last
+
+
+def write_marks(f, table):
+    """Write the marks of a table in git's text format.
+
+    Keys which aren't marks are left out.
+    """
+    present, last = _marks_of(table)
+    for mark in present:
+        ref = _reference(mark)
+        f.write('%s %s\n' % (ref, table[ref]))
+
+
+def write_binary_marks(f, table):
+    """Write the marks of a table in the binary format.
+
+    Keys which aren't marks are left out. The offsets are only known
+    once the names have been written, so f must be able to seek.
+    """
+    present, last = _marks_of(table)
+    slots = last + 1
+    start = f.tell()
+    offsets = array.array(_OFFSET_TYPECODE, [0]) * (slots + 1)
+    f.seek(start + _BINARY_HEADER.size + offsets.itemsize * len(offsets))
+    count = 0
+    total = 0
+    next = 0
+    for mark in present:
+        # Marks without names end where the last name did
+        for i in xrange(next, mark + 1):
+            offsets[i] = total
+        name = table[_reference(mark)]
+        f.write(name)
+        total += len(name)
+        count += 1
+        next = mark + 1
+    for i in xrange(next, slots + 1):
+        offsets[i] = total
+    end = f.tell()
+    f.seek(start)
+    f.write(_BINARY_HEADER.pack(_BINARY_MAGIC, _BINARY_VERSION, slots,
+        count, total))
+    if sys.byteorder != 'little':
+        offsets.byteswap()
+    f.write(offsets.tostring())
+    f.seek(end)
+
+
+class MappedMarks(object):
+    """The marks of a binary marks file, mapped into memory.
+
+    Opening the file only reads its header: each mark is looked up in
+    the map when asked for. Marks set are kept in a MarkTable on top of
+    the file, which is never changed.
+    """
+
+    def __init__(self, f):
+        """Map a binary marks file.
+
+        :param f: the file, open for reading
+        """
+        try:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, EnvironmentError), e:
+            raise errors.BadMarks("cannot map file: %s" % (e,))
+        if len(self._map) < _BINARY_HEADER.size:
+            raise errors.BadMarks("truncated header")
+        (magic, version, self._slots, self._count,
+            size) = _BINARY_HEADER.unpack_from(self._map)
+        if magic != _BINARY_MAGIC or version != _BINARY_VERSION:
+            raise errors.BadMarks("not a binary marks file")
+        self._names_start = _BINARY_HEADER.size + 8 * (self._slots + 1)
+        if len(self._map) != self._names_start + size:
+            raise errors.BadMarks("wrong size")
+        self._new = MarkTable()
+
+    def close(self):
+        self._map.close()
+
+    def _mapped(self, mark):
+        """Get the name of a mark from the file, or None."""
+        if mark >= self._slots:
+            return None
+        start, end = _OFFSET.unpack_from(self._map,
+            _BINARY_HEADER.size + 8 * mark)
+        if start == end:
+            return None
+        return self._map[self._names_start + start:self._names_start + end]
+
+    def __len__(self):
+        return self._count + len(self._new)
+
+    def get(self, ref, default=None):
+        if ref in self._new:
+            return self._new[ref]
+        mark = mark_number(ref)
+        if mark is not None:
+            name = self._mapped(mark)
+            if name is not None:
+                return name
+        return default
+
+    def __getitem__(self, ref):
+        name = self.get(ref)
+        if name is None:
+            raise KeyError(ref)
+        return name
+
+    def __contains__(self, ref):
+        return self.get(ref) is not None
+
+    def __setitem__(self, ref, name):
+        mark = mark_number(ref)
+        if (ref not in self._new and mark is not None and
+            self._mapped(mark) is not None):
+            # It will be counted in _new from now on
+            self._count -= 1
+        self._new[ref] = name
+
+    def iteritems(self):
+        for mark in xrange(1, self._slots):
+            ref = _reference(mark)
+            if ref not in self._new:
+                name = self._mapped(mark)
+                if name is not None:
+                    yield ref, name
+        for item in self._new.iteritems():
+            yield item
+
+    def __iter__(self):
+        for ref, name in self.iteritems():
+            yield ref
+
+
+def load_marks(path):
+    """Load a marks file in either format.
+
+    :return: a MappedMarks for a binary file, otherwise a MarkTable
+    """
+    f = open(path, 'rb')
+    try:
+        if f.read(len(_BINARY_MAGIC)) == _BINARY_MAGIC:
+            return MappedMarks(f)
+        f.seek(0)
+        return read_marks(f)
+    finally:
+        # The map stays valid once the file is closed
+        f.close()
+
+
+def save_marks(path, table, binary=False):
+    """Save the marks of a table to a file, in either format.
+
+    The marks are written to a new file which then replaces the old
+    one, so a MappedMarks of the old file, which may be the table being
+    saved, can still be used.
+    """
+    f = open(path + '.tmp', 'wb')
+    try:
+        if binary:
+            write_binary_marks(f, table)
+        else:
+            write_marks(f, table)
+    finally:
+        f.close()
+    os.rename(path + '.tmp', path)
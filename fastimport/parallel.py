@@ -0,0 +1,180 @@
+# Copyright (C) 2026 Canonical Ltd
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Parsing of a fast-import stream by several processes.
+
+The stream is split into ranges of whole commands by a CommandScanner,
+which is cheap as it skips over data sections. The ranges are parsed by a
+pool of processes and the commands put back together in order, with
+their offsets and line numbers relative to the whole stream:
+
+   for cmd in fastimport.parallel.iter_commands('export.fi'):
+       ...
+"""
+
+import multiprocessing
+from cStringIO import StringIO
+
+from fastimport import (
+    errors,
+    parser,
+    payload,
+    scanner,
+    )
+
+
+# Number of bytes of the stream parsed by a process at a time
+RANGE_SIZE = 16 * 1024 * 1024
+
+
+class _RangeFinder(object):
+    """Splits a stream into ranges of whole commands.
+
+    :ivar done: whether a 'done' command ended the stream
+    """
+
+    def __init__(self, path, range_size):
+        self.path = path
+        self.range_size = range_size
+        self.done = False
+
+    def __iter__(self):
+        input = open(self.path, 'rb')
+        try:
+            start = 0
+            for name, offset, mark, data_size in \
+                scanner.CommandScanner(input).iter_commands():
+                if name == 'done':
+                    self.done = True
+                    break
+                if offset - start >= self.range_size:
+                    yield start, offset
+                    start = offset
+            else:
+                input.seek(0, 2)
+                offset = input.tell()
+            if offset > start:
+                yield start, offset
+        finally:
+            input.close()
+
+
+def _parse_range(args):
+    """Parse the commands in a range of a stream.
+
+    This is run by the worker processes.
+
+    :return: (commands, newlines, error) where newlines is the number of
+      lines in the range and error the class and attributes of the
+      ParsingError which stopped parsing, if any
+    """
+    path, start, end, kwargs = args
+    input = open(path, 'rb')
+    try:
+        input.seek(start)
+        data = input.read(end - start)
+    finally:
+        input.close()
+    p = parser.ImportParser(StringIO(data), **kwargs)
+    cmds = []
+    error = None
+    try:
+        for cmd in p.iter_commands():
+            _relocate(cmd, start)
+            cmds.append(cmd)
+    except errors.PrematureEndOfStream:
+        # The range ends before the stream does; whether a 'done' command
+        # is missing is checked by the caller
+        pass
+    except errors.ParsingError, e:
+        # Exceptions with keyword attributes can't be pickled as is
+        error = (e.__class__, e.__dict__)
+    return cmds, data.count('\n'), error
+
+
+def _relocate(cmd, start):
+    """Prepare a command parsed from a range to be sent back."""
+    cmd.offset += start
+    cmd.end_offset += start
+    if hasattr(cmd, '_lineno'):
+        # Resolve the line number in the range while it can be counted
+        cmd.lineno
+    for data_cmd in _iter_data_commands(cmd):
+        if isinstance(data_cmd.data, payload.LazyPayload):
+            data_cmd.data.source = None
+            data_cmd.data.offset += start
+
+
+def _iter_data_commands(cmd):
+    """Iterate over the commands holding data in a command."""
+    if cmd.name == 'blob':
+        yield cmd
+    elif cmd.name == 'commit':
+        for file_cmd in cmd.file_iter:
+            if file_cmd.name == 'filemodify' and file_cmd.data is not None:
+                yield file_cmd
+
+
+def iter_commands(path, processes=None, range_size=RANGE_SIZE,
+    strict=True, user_mapper=None, lazy_data=False):
+    """Parse a stream in a file using several processes.
+
+    The commands are the same, in the same order, as from
+    ImportParser.iter_commands.
+
+    :param path: the path of the file holding the stream
+    :param processes: the number of processes to use, by default the
+      number of CPUs
+    :param range_size: roughly how many bytes of the stream each process
+      parses at a time
+    :param strict, user_mapper: as for ImportParser
+    :param lazy_data: as for ImportParser. The payloads returned read from
+      a file object opened on path when the first of them is found, which
+      is closed once neither they nor the iterator hold it any more.
+    """
+    kwargs = {'strict': strict, 'user_mapper': user_mapper,
+        'lazy_data': lazy_data}
+    finder = _RangeFinder(path, range_size)
+    tasks = ((path, start, end, kwargs) for start, end in finder)
+    source = None
+    pool = multiprocessing.Pool(processes)
+    try:
+        lines = 0
+        done_feature = False
+        for cmds, newlines, error in pool.imap(_parse_range, tasks):
+            for cmd in cmds:
+                if hasattr(cmd, '_lineno'):
+                    cmd.lineno += lines
+                    if cmd.name in ('blob', 'commit') and cmd.mark is None:
+                        cmd.id = '@%d' % cmd.lineno
+                for data_cmd in _iter_data_commands(cmd):
+                    if isinstance(data_cmd.data, payload.LazyPayload):
+                        if source is None:
+                            source = open(path, 'rb')
+                        data_cmd.data.source = source
+                if cmd.name == 'feature' and cmd.feature_name == 'done':
+                    done_feature = True
+                yield cmd
+            if error is not None:
+                cls, attrs = error
+                e = cls.__new__(cls)
+                e.__dict__.update(attrs)
+                e.lineno += lines
+                raise e
+            lines += newlines
+        if done_feature and not finder.done:
+            raise errors.PrematureEndOfStream(lines)
+    finally:
+        pool.terminate()
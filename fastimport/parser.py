@@ -159,45 +159,313 @@ The grammar is:
 """
 
 
+import bisect
 import collections
+import functools
+import mmap
+import os
 import re
+import stat
+import struct
 import sys
+import tempfile
+import weakref
+
+try:
+    import fcntl
+    import termios
+except ImportError:
+    fcntl = None
 
 from fastimport import (
     commands,
     dates,
     errors,
+    helpers,
+    payload,
     )
 
 
 ## Stream parsing ##
 
+# Number of bytes requested from the input stream at a time
+BLOCK_SIZE = 1024 * 1024
+
+
 class LineBasedParser(object):
 
-    def __init__(self, input):
-        """A Parser that keeps track of line numbers.
+    def __init__(self, input, block_size=BLOCK_SIZE, use_mmap=False):
+        """A Parser that keeps track of byte offsets and line numbers.
+
+        Input is read in blocks of block_size bytes into an internal
+        buffer and lines are found by searching that buffer. Pipes,
+        sockets and terminals are read with short reads instead, so that
+        commands are parsed as soon as they arrive rather than once a
+        whole block has.
+
+        Positions are tracked as byte offsets in the input. Line numbers
+        are only counted when asked for, e.g. to report an error: if the
+        input can be read again (a regular file or an in-memory file),
+        counting doesn't happen at all until then. Otherwise bytes have
+        to be counted before they are discarded.
 
         :param input: the file-like object to read from
+        :param block_size: the number of bytes to read from input at once
+        :param use_mmap: if True and input is a regular file, map it into
+          memory instead of reading it; see read_buffer.
         """
         self.input = input
-        self.lineno = 0
-        # Lines pushed back onto the input stream
+        self.block_size = block_size
+        # Bytes read from the input; those before _pos are consumed
+        self._data = ''
+        self._pos = 0
+        self._eof = False
+        # Offset of _data in the input, and whether the input can be
+        # read again at any offset
+        self._data_offset = 0
+        self._seekable = False
+        self._map = None
+        if use_mmap:
+            self._map_input()
+        if self._map is None:
+            try:
+                self._data_offset = input.tell()
+            except (AttributeError, IOError, ValueError):
+                pass
+            else:
+                self._seekable = True
+        # The function reading a block of the input, see _block_reader
+        self._read_block = None
+        # The last line returned and where it started in _data, so that
+        # pushing it back is just a matter of rewinding _pos
+        self._line = None
+        self._line_start = 0
+        # Lines pushed back which can't be rewound to
         self._buffer = []
+        # Newlines counted so far: _newlines before offset _counted, plus
+        # sparse (offset, newlines) checkpoints for earlier offsets
+        self._counted = self.offset
+        self._newlines = 0
+        self._checkpoint_offsets = [self._counted]
+        self._checkpoint_newlines = [0]
+        # Adjustment to lineno for lines in _buffer
+        self._pushed_lines = 0
+        # Weak references to the line numbers of commands not counted
+        # yet, pruned when there are more than _pending_limit of them
+        self._pending_linenos = []
+        self._pending_limit = 1024
+        # The temporary file read_spooled copies data to, once it has
+        self._spool = None
+
+    @property
+    def lineno(self):
+        """The number of the last line read."""
+        return self.line_number() - 1 - self._pushed_lines
+
+    def line_number(self, offset=None):
+        """Get the number of the line a byte of the input is on.
+
+        Lines are counted from where the parser started reading.
+
+        :param offset: the offset of the byte in the input, by default
+          the next byte to be parsed
+        """
+        if offset is None:
+            offset = self.offset
+        if offset >= self._counted:
+            self._count_to(offset)
+            return self._newlines + 1
+        i = bisect.bisect(self._checkpoint_offsets, offset) - 1
+        start = self._checkpoint_offsets[i]
+        return (self._checkpoint_newlines[i] +
+            self._count_newlines(start, offset) + 1)
+
+    def _count_to(self, offset):
+        """Count the newlines up to an offset not counted yet."""
+        if offset <= self._counted:
+            return
+        self._newlines += self._count_newlines(self._counted, offset)
+        self._counted = offset
+        if offset - self._checkpoint_offsets[-1] >= BLOCK_SIZE:
+            self._checkpoint_offsets.append(offset)
+            self._checkpoint_newlines.append(self._newlines)
+
+    def _count_newlines(self, start, end):
+        """Count the newlines between two offsets in the input."""
+        if self._map is not None:
+            return _count_newlines(self._map, start, end)
+        data_start = self._data_offset
+        if start >= data_start and end <= data_start + len(self._data):
+            return self._data.count("\n", start - data_start,
+                end - data_start)
+        if not self._seekable:
+            raise AssertionError("bytes %d to %d are no longer available" %
+                (start, end))
+        saved = self.input.tell()
+        try:
+            self.input.seek(start)
+            count = 0
+            while start < end:
+                block = self.input.read(min(self.block_size, end - start))
+                if not block:
+                    break
+                count += block.count("\n")
+                start += len(block)
+            return count
+        finally:
+            self.input.seek(saved)
+
+    def _forget(self, size):
+        """Account for the first size bytes of the buffer being dropped.
+
+        If the input can't be read again, their lines are counted now.
+        """
+        if not self._rereadable():
+            self._count_to(self._data_offset + size)
+        self._data_offset += size
+
+    def _forget_chunk(self, chunk):
+        """Account for a chunk read from the input without buffering it."""
+        if not self._rereadable() and self._counted == self._data_offset:
+            self._newlines += chunk.count("\n")
+            self._counted += len(chunk)
+        self._data_offset += len(chunk)
+
+    def _rereadable(self):
+        """Can bytes be read again from the input once parsed?"""
+        return self._seekable or self._map is not None
+
+    def _lazy_lineno(self):
+        """Get the number of the last line read, for a command.
+
+        :return: the line number or, if it can be computed later, a
+          callable returning it.
+        """
+        if self._buffer or not self._rereadable():
+            return self.lineno
+        lineno = _LineNumber(self, self.offset - 1)
+        pending = self._pending_linenos
+        pending.append(weakref.ref(lineno))
+        if len(pending) >= self._pending_limit:
+            pending[:] = [ref for ref in pending if ref() is not None]
+            self._pending_limit = max(1024, 2 * len(pending))
+        return lineno
+
+    def resolve_line_numbers(self):
+        """Count the line numbers of commands which are still to count.
+
+        Only those of commands still referenced are counted, in one pass
+        over the input. This is done when iter_commands finishes, so that
+        the input isn't needed once it has been parsed.
+        """
+        pending = [ref() for ref in self._pending_linenos]
+        self._pending_linenos = []
+        pending = [lineno for lineno in pending
+            if lineno is not None and lineno.parser is not None]
+        pending.sort(key=lambda lineno: lineno.offset)
+        for lineno in pending:
+            lineno.resolve()
 
     def abort(self, exception, *args):
         """Raise an exception providing line number information."""
         raise exception(self.lineno, *args)
 
+    def _map_input(self):
+        """Use a memory map of the input as the buffer, if possible.
+
+        Only regular files can be mapped; anything else (pipes, sockets,
+        in-memory files) is silently read in blocks as usual.
+        """
+        try:
+            fileno = self.input.fileno()
+            st = os.fstat(fileno)
+            if not stat.S_ISREG(st.st_mode):
+                return
+            offset = self.input.tell()
+        except (AttributeError, IOError, OSError, ValueError):
+            return
+        if offset >= st.st_size:
+            # Nothing to map (and empty maps are not allowed)
+            return
+        self._map = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+        self._data = self._map
+        self._pos = offset
+        self._eof = True
+
+    def _block_reader(self):
+        """Get the function reading the next block of the input."""
+        if self._seekable or self._map is not None:
+            return self.input.read
+        return block_reader(self.input)
+
+    @property
+    def offset(self):
+        """The offset in the input of the next byte to be parsed."""
+        return self._data_offset + self._pos
+
+    def _fill(self):
+        """Append the next block of the input stream to the buffer.
+
+        Consumed bytes are dropped from the buffer first.
+
+        :return: False if the input stream is exhausted
+        """
+        if self._eof:
+            return False
+        if self._read_block is None:
+            self._read_block = self._block_reader()
+        block = self._read_block(self.block_size)
+        if not block:
+            self._eof = True
+            return False
+        if self._pos:
+            self._line = None
+            self._forget(self._pos)
+            self._data = self._data[self._pos:] + block
+            self._pos = 0
+        else:
+            self._data += block
+        return True
+
+    def _readline(self):
+        """Get the next line from the buffer, ignoring pushed back lines."""
+        scanned = 0
+        while True:
+            end = self._data.find('\n', self._pos + scanned)
+            if end != -1:
+                end += 1
+                break
+            scanned = len(self._data) - self._pos
+            if not self._fill():
+                end = len(self._data)
+                break
+        line = self._data[self._pos:end]
+        self._line = line
+        self._line_start = self._pos
+        self._pos = end
+        return line
+
     def readline(self):
         """Get the next line including the newline or '' on EOF."""
-        self.lineno += 1
         if self._buffer:
+            self._line = None
+            self._pushed_lines -= 1
             return self._buffer.pop()
         else:
-            return self.input.readline()
+            return self._readline()
 
     def next_line(self):
         """Get the next line without the newline or None on EOF."""
+        if not self._buffer:
+            # Slice the line out of the buffer without its newline,
+            # rather than with it and then again without it
+            end = self._data.find('\n', self._pos)
+            if end != -1:
+                line = self._data[self._pos:end]
+                self._line = line
+                self._line_start = self._pos
+                self._pos = end + 1
+                return line
         line = self.readline()
         if line:
             return line[:-1]
@@ -207,10 +475,19 @@ class LineBasedParser(object):
     def push_line(self, line):
         """Push line back onto the line buffer.
 
+        Pushing back the line just read rewinds the input instead.
+
         :param line: the line with no trailing newline
         """
-        self.lineno -= 1
-        self._buffer.append(line + "\n")
+        last = self._line
+        if last is not None and (last is line or
+            (len(last) == len(line) + 1 and last.endswith('\n') and
+             last.startswith(line))):
+            self._pos = self._line_start
+            self._line = None
+        else:
+            self._pushed_lines += 1
+            self._buffer.append(line + "\n")
 
     def read_bytes(self, count):
         """Read a given number of bytes from the input stream.
@@ -221,32 +498,201 @@ class LineBasedParser(object):
 
         :return: a string
         """
-        result = self.input.read(count)
+        self._line = None
+        start = self._pos
+        end = start + count
+        if end <= len(self._data):
+            result = self._data[start:end]
+            self._pos = end
+        else:
+            # Read what is missing straight from the input rather than
+            # growing the buffer to hold it
+            result = self._data[start:]
+            self._drop_buffer()
+            chunks = [result]
+            missing = count - len(result)
+            while missing > 0 and not self._eof:
+                chunk = self.input.read(missing)
+                if not chunk:
+                    self._eof = True
+                    break
+                self._forget_chunk(chunk)
+                chunks.append(chunk)
+                missing -= len(chunk)
+            if len(chunks) > 1:
+                result = ''.join(chunks)
         found = len(result)
-        self.lineno += result.count("\n")
         if found != count:
             self.abort(errors.MissingBytes, count, found)
         return result
 
+    def iter_bytes(self, count):
+        """Iterate over a given number of bytes of the input stream.
+
+        The bytes are returned in chunks of at most block_size bytes, so
+        unlike read_bytes only one block is held in memory at a time.
+        The iterator must be exhausted before reading anything else.
+
+        Throws MissingBytes if the bytes are not found.
+        """
+        self._line = None
+        start = self._pos
+        end = min(start + count, len(self._data))
+        found = end - start
+        if found:
+            self._pos = end
+            yield self._data[start:end]
+        if found < count:
+            self._drop_buffer()
+        while found < count and not self._eof:
+            chunk = self.input.read(min(count - found, self.block_size))
+            if not chunk:
+                self._eof = True
+                break
+            self._forget_chunk(chunk)
+            found += len(chunk)
+            yield chunk
+        if found != count:
+            self.abort(errors.MissingBytes, count, found)
+
+    def skip_bytes(self, count):
+        """Skip over a given number of bytes of the input stream.
+
+        Throws MissingBytes if the bytes are not found.
+        """
+        self._line = None
+        end = self._pos + count
+        if end <= len(self._data):
+            self._pos = end
+        elif self._seekable:
+            # Seek over what isn't buffered
+            target = self.offset + count
+            self._drop_buffer()
+            self.input.seek(0, 2)
+            size = self.input.tell()
+            self.input.seek(min(target, size))
+            self._data_offset = min(target, size)
+            if target > size:
+                self._eof = True
+                self.abort(errors.MissingBytes, count,
+                    count - (target - size))
+        else:
+            for chunk in self.iter_bytes(count):
+                pass
+
+    def _drop_buffer(self):
+        """Discard the whole buffer, consumed or not."""
+        self._forget(len(self._data))
+        self._data = ''
+        self._pos = 0
+
+    def read_buffer(self, count):
+        """Read a given number of bytes without copying them if possible.
+
+        If the input is memory mapped, the result is a read-only buffer
+        sharing its memory with the map. Otherwise this is read_bytes.
+
+        Throws MissingBytes if the bytes are not found.
+        """
+        if self._map is None:
+            return self.read_bytes(count)
+        self._line = None
+        start = self._pos
+        found = min(count, len(self._map) - start)
+        self._pos = start + found
+        if found != count:
+            self.abort(errors.MissingBytes, count, found)
+        return buffer(self._map, start, count)
+
+    def read_lazy(self, count):
+        """Skip over a given number of bytes, returning a handle to them.
+
+        The bytes are only read when the handle is used. If the input
+        can't be read again once parsed, this is read_buffer.
+
+        Throws MissingBytes if the bytes are not found.
+
+        :return: a payload.LazyPayload
+        """
+        if self._map is not None:
+            source = self._map
+        elif self._seekable:
+            source = self.input
+        else:
+            return self.read_buffer(count)
+        offset = self.offset
+        self.skip_bytes(count)
+        return payload.LazyPayload(source, offset, count)
+
+    def read_spooled(self, count):
+        """Copy a given number of bytes to a temporary file.
+
+        The bytes are copied a block at a time, so memory use doesn't
+        depend on count. They are appended to a single temporary file
+        for the parser, rather than one each, so that keeping many
+        payloads doesn't use up file descriptors.
+
+        Throws MissingBytes if the bytes are not found.
+
+        :return: a payload.LazyPayload reading from the temporary file
+        """
+        if self._spool is None:
+            self._spool = tempfile.TemporaryFile()
+        spool = self._spool
+        # Payloads read from it leave it where it was, but a failed
+        # copy may not have reached its end
+        spool.seek(0, 2)
+        offset = spool.tell()
+        for chunk in self.iter_bytes(count):
+            spool.write(chunk)
+        return payload.LazyPayload(spool, offset, count)
+
     def read_until(self, terminator):
         """Read the input stream until the terminator is found.
 
+        The terminator must be on a line of its own. The buffer is searched
+        for it directly, a block at a time, rather than line by line.
+
         Throws MissingTerminator if the terminator is not found.
 
         Note: This method does not read from the line buffer.
 
         :return: the bytes read up to but excluding the terminator.
         """
-
-        lines = []
+        self._line = None
         term = terminator + '\n'
+        # The terminator may be the first line; otherwise it follows a LF
+        # which is part of the result
+        while len(self._data) - self._pos < len(term) and self._fill():
+            pass
+        if self._data[self._pos:self._pos + len(term)] == term:
+            self._pos += len(term)
+            return ''
+        needle = '\n' + term
+        chunks = []
         while True:
-            line = self.input.readline()
-            if line == term:
+            found = self._data.find(needle, self._pos)
+            if found != -1:
                 break
-            else:
-                lines.append(line)
-        return ''.join(lines)
+            # Move what has been searched out of the way, keeping enough
+            # to find a terminator straddling the next block
+            cut = len(self._data) - len(needle) + 1
+            if cut > self._pos:
+                chunks.append(self._data[self._pos:cut])
+                self._pos = cut
+            if not self._fill():
+                # The terminator may end the stream without its LF
+                tail = self._data[self._pos:]
+                if tail == needle[:-1]:
+                    found = self._pos
+                    break
+                if not chunks and tail == terminator:
+                    self._pos = len(self._data)
+                    return ''
+                self.abort(errors.MissingTerminator, terminator)
+        chunks.append(self._data[self._pos:found + 1])
+        self._pos = min(found + len(needle), len(self._data))
+        return ''.join(chunks)
 
 
 # Regular expression used for parsing. (Note: The spec states that the name
@@ -256,11 +702,27 @@ class LineBasedParser(object):
 _WHO_AND_WHEN_RE = re.compile(r'([^<]*)<(.*)> (.+)')
 _WHO_RE = re.compile(r'([^<]*)<(.*)>')
 
+# Keywords of commands which are recognised by prefix, i.e. need no space
+# after them, in the order they are tried
+_BARE_COMMANDS = ('blob', 'done', 'checkpoint', 'feature')
+_BARE_FILE_COMMANDS = ('deleteall',)
+
+# Number of recently seen paths (and pairs of paths) kept parsed; up to
+# twice as many are held, see helpers.InternTable
+PATH_CACHE_SIZE = 64 * 1024
+
+# Errors which a command can be skipped for when recovering
+_RECOVERABLE_ERRORS = (errors.InvalidCommand, errors.MissingSection,
+    errors.BadFormat, errors.MissingBytes, errors.MissingTerminator,
+    errors.InvalidTimezone, errors.InvalidDate, ValueError)
+
 
 class ImportParser(LineBasedParser):
 
     def __init__(self, input, verbose=False, output=sys.stdout,
-        user_mapper=None, strict=True):
+        user_mapper=None, strict=True, use_mmap=False, lazy_data=False,
+        spool_threshold=None, decompress=False, stream_file_commands=False,
+        recover=False, error_budget=None):
         """A Parser of import commands.
 
         :param input: the file-like object to read from
@@ -269,48 +731,201 @@ class ImportParser(LineBasedParser):
         :param user_mapper: if not None, the UserMapper used to adjust
           user-ids for authors, committers and taggers.
         :param strict: Raise errors on strictly invalid data
+        :param use_mmap: map input into memory if it is a regular file.
+          The data of blobs and inline file modifications is then returned
+          as read-only buffers into the map rather than as strings.
+        :param lazy_data: if the input can be read again at any position
+          (a regular file or a memory map), return the data of blobs and
+          inline file modifications as LazyPayload handles which read the
+          bytes only when used.
+        :param spool_threshold: if not None, the data of blobs and inline
+          file modifications larger than this many bytes is copied to a
+          temporary file, shared by all of them, a block at a time and
+          returned as a LazyPayload reading from it, unless it can be
+          left in the input instead.
+        :param decompress: if True and input is compressed with gzip,
+          bzip2 or xz, recognised by its first bytes, parse the
+          decompressed data, decompressing in a background thread.
+        :param recover: if True, a command which can't be parsed is
+          skipped rather than raising an error: the lines after it are
+          skipped up to the next one starting a command, skipping data
+          sections by their declared lengths. Each skipped range of the
+          input is recorded in dropped as a DroppedRange.
+        :param error_budget: if not None, the number of commands which
+          may be skipped when recovering; the next error is raised.
+        :param stream_file_commands: if True, the file_iter of a commit
+          is a generator parsing its file commands as they are asked
+          for, rather than a list of them all. The generator can only be
+          consumed once, and only until the next command is parsed: any
+          file commands left are then skipped. end_offset is only set
+          once all the file commands have been parsed.
         """
-        LineBasedParser.__init__(self, input)
+        if decompress:
+            # Imported here as compression depends on this module
+            from fastimport import compression
+            input = compression.open_input(input)
+        LineBasedParser.__init__(self, input, use_mmap=use_mmap)
+        self.lazy_data = lazy_data
+        self.spool_threshold = spool_threshold
         self.verbose = verbose
         self.output = output
         self.user_mapper = user_mapper
         self.strict = strict
+        # The distinct authors, committers and taggers seen
+        self.identities = IdentityTable(user_mapper)
         # We auto-detect the date format when a date is first encountered
         self.date_parser = None
         self.features = {}
+        self.stream_file_commands = stream_file_commands
+        self.recover = recover
+        self.error_budget = error_budget
+        # The ranges of the input skipped to recover from errors
+        self.dropped = []
+        # The file commands of the last commit, if streamed
+        self._file_iter = None
+        # Parsers of commands and file commands by keyword, each given
+        # the rest of the line after the keyword
+        self._command_parsers = {
+            'commit': self._parse_commit,
+            'blob': self._parse_blob,
+            'progress': self._parse_progress,
+            'reset': self._parse_reset,
+            'tag': self._parse_tag,
+            'checkpoint': self._parse_checkpoint,
+            'feature': self._parse_feature,
+            }
+        self._file_command_parsers = {
+            'M': self._parse_file_modify,
+            'D': self._parse_file_delete,
+            'R': self._parse_file_rename,
+            'C': self._parse_file_copy,
+            'deleteall': self._parse_file_delete_all,
+            }
+        # Parsed paths and pairs of paths by their text in the stream,
+        # so that repeated paths are shared and only checked once
+        self._paths = helpers.InternTable(self._parse_path, PATH_CACHE_SIZE)
+        self._path_pairs = helpers.InternTable(self._parse_path_pair,
+            PATH_CACHE_SIZE)
 
     def warning(self, msg):
         sys.stderr.write("warning line %d: %s\n" % (self.lineno, msg))
 
     def iter_commands(self):
-        """Iterator returning ImportCommand objects."""
+        """Iterator returning ImportCommand objects.
+
+        The offset and end_offset of each command are set to where it
+        starts and ends in the input. The line numbers of the commands
+        still referenced are counted when it finishes.
+        """
+        try:
+            while True:
+                if self._file_iter is not None:
+                    # Skip what is left of the last commit
+                    start = self.offset
+                    try:
+                        for file_cmd in self._file_iter:
+                            pass
+                    except _RECOVERABLE_ERRORS, e:
+                        if not self._recover(start, e):
+                            raise
+                    self._file_iter = None
+                start = self.offset
+                line = self.next_line()
+                if line is None:
+                    if 'done' in self.features:
+                        raise errors.PrematureEndOfStream(self.lineno)
+                    break
+                elif not line or line[0] == '#':
+                    continue
+                if self.recover:
+                    try:
+                        cmd = self._parse_command(line)
+                    except _RECOVERABLE_ERRORS, e:
+                        if not self._recover(start, e):
+                            raise
+                        continue
+                else:
+                    cmd = self._parse_command(line)
+                if cmd is None:
+                    break
+                cmd.offset = start
+                if cmd.name == 'commit' and self.stream_file_commands:
+                    self._file_iter = cmd.file_iter
+                else:
+                    cmd.end_offset = self.offset
+                yield cmd
+        finally:
+            self.resolve_line_numbers()
+
+    def _parse_command(self, line):
+        """Parse the command starting with a line.
+
+        :return: the command, or None for a done command
+        """
+        parsers = self._command_parsers
+        # The usual case, a keyword followed by a space, is looked up
+        # here rather than through _lookup
+        space = line.find(' ')
+        parse = parsers.get(line[:space]) if space != -1 else None
+        if parse is not None:
+            return parse(line[space + 1:])
+        keyword, parse = self._lookup(line, parsers, _BARE_COMMANDS)
+        if parse is None:
+            if keyword == 'done':
+                return None
+            self.abort(errors.InvalidCommand, line)
+        return parse(line[len(keyword) + 1:])
+
+    def _recover(self, start, error):
+        """Record an error and skip to the next command, if recovering.
+
+        :param start: the offset of the command the error is in
+        :return: False if the error should be raised instead
+        """
+        if not self.recover:
+            return False
+        if (self.error_budget is not None and
+            len(self.dropped) >= self.error_budget):
+            return False
+        if self._file_iter is not None:
+            # What is left of it is skipped with the rest
+            self._file_iter = None
+        if (self._line is not None and
+            self._data_offset + self._line_start > start):
+            # Look at the line the error was found on again, as it may
+            # start the next command, e.g. when a section is missing
+            self._pos = self._line_start
+            self._line = None
+        self._resync()
+        self.dropped.append(DroppedRange(start, self.offset, error))
+        return True
+
+    def _resync(self):
+        """Skip lines up to the next one starting a command.
+
+        Data sections are skipped by their declared lengths, so that
+        their contents aren't taken for commands.
+        """
+        parsers = self._command_parsers
         while True:
             line = self.next_line()
             if line is None:
-                if 'done' in self.features:
-                    raise errors.PrematureEndOfStream(self.lineno)
-                break
-            elif len(line) == 0 or line.startswith('#'):
+                return
+            if line.startswith('data '):
+                rest = line[len('data '):]
+                try:
+                    if rest.startswith('<<'):
+                        self.read_until(rest[2:])
+                    else:
+                        self.skip_bytes(int(rest))
+                except (errors.ParsingError, ValueError):
+                    # Bad or truncated: carry on from the next line
+                    pass
                 continue
-            # Search for commands in order of likelihood
-            elif line.startswith('commit '):
-                yield self._parse_commit(line[len('commit '):])
-            elif line.startswith('blob'):
-                yield self._parse_blob()
-            elif line.startswith('done'):
-                break
-            elif line.startswith('progress '):
-                yield commands.ProgressCommand(line[len('progress '):])
-            elif line.startswith('reset '):
-                yield self._parse_reset(line[len('reset '):])
-            elif line.startswith('tag '):
-                yield self._parse_tag(line[len('tag '):])
-            elif line.startswith('checkpoint'):
-                yield commands.CheckpointCommand()
-            elif line.startswith('feature'):
-                yield self._parse_feature(line[len('feature '):])
-            else:
-                self.abort(errors.InvalidCommand, line)
+            keyword, parse = self._lookup(line, parsers, _BARE_COMMANDS)
+            if parse is not None or keyword == 'done':
+                self.push_line(line)
+                return
 
     def iter_file_commands(self):
         """Iterator returning FileCommand objects.
@@ -318,74 +933,115 @@ class ImportParser(LineBasedParser):
         If an invalid file command is found, the line is silently
         pushed back and iteration ends.
         """
+        parsers = self._file_command_parsers
         while True:
             line = self.next_line()
             if line is None:
                 break
-            elif len(line) == 0 or line.startswith('#'):
+            elif not line or line[0] == '#':
                 continue
-            # Search for file commands in order of likelihood
-            elif line.startswith('M '):
-                yield self._parse_file_modify(line[2:])
-            elif line.startswith('D '):
-                path = self._path(line[2:])
-                yield commands.FileDeleteCommand(path)
-            elif line.startswith('R '):
-                old, new = self._path_pair(line[2:])
-                yield commands.FileRenameCommand(old, new)
-            elif line.startswith('C '):
-                src, dest = self._path_pair(line[2:])
-                yield commands.FileCopyCommand(src, dest)
-            elif line.startswith('deleteall'):
-                yield commands.FileDeleteAllCommand()
-            else:
+            space = line.find(' ')
+            parse = parsers.get(line[:space]) if space != -1 else None
+            if parse is not None:
+                yield parse(line[space + 1:])
+                continue
+            keyword, parse = self._lookup(line, parsers,
+                _BARE_FILE_COMMANDS)
+            if parse is None:
                 self.push_line(line)
                 break
+            yield parse(line[len(keyword) + 1:])
+
+    def _lookup(self, line, parsers, bare_keywords):
+        """Find the parser of a line from its keyword.
+
+        :param parsers: a dictionary of keywords to parsers
+        :param bare_keywords: the keywords which may be followed by
+          anything, not just a space, as long as nothing else matches
+        :return: the keyword and its parser; either may be None if there
+          is none
+        """
+        space = line.find(' ')
+        if space == -1:
+            keyword = line
+        else:
+            keyword = line[:space]
+        parse = parsers.get(keyword)
+        if parse is None or (space == -1 and keyword not in bare_keywords):
+            for keyword in bare_keywords:
+                if line.startswith(keyword):
+                    parse = parsers.get(keyword)
+                    break
+            else:
+                keyword = parse = None
+        return keyword, parse
 
-    def _parse_blob(self):
+    def _parse_blob(self, info=None):
         """Parse a blob command."""
-        lineno = self.lineno
+        lineno = self._lazy_lineno()
         mark = self._get_mark_if_any()
         data = self._get_data('blob')
         return commands.BlobCommand(mark, data, lineno)
 
     def _parse_commit(self, ref):
         """Parse a commit command."""
-        lineno  = self.lineno
-        mark = self._get_mark_if_any()
-        author = self._get_user_info('commit', 'author', False)
+        lineno = self._lazy_lineno()
+        # Optional sections are recognised from the line already read
+        # rather than by pushing lines back
+        line = self.next_line()
+        mark = None
+        if line is not None and line.startswith('mark :'):
+            mark = line[len('mark :'):]
+            line = self.next_line()
+        author = None
         more_authors = []
-        while True:
-            another_author = self._get_user_info('commit', 'author', False)
-            if another_author is not None:
-                more_authors.append(another_author)
+        while line is not None and line.startswith('author '):
+            who = self._who_when(line[len('author '):], 'commit', 'author')
+            if author is None:
+                author = who
             else:
-                break
-        committer = self._get_user_info('commit', 'committer')
+                more_authors.append(who)
+            line = self.next_line()
+        if line is None or not line.startswith('committer '):
+            self.abort(errors.MissingSection, 'commit', 'committer')
+        committer = self._who_when(line[len('committer '):], 'commit',
+            'committer')
         message = self._get_data('commit', 'message')
-        from_ = self._get_from()
+        line = self.next_line()
+        from_ = None
+        if line is not None and line.startswith('from '):
+            from_ = line[len('from '):]
+            line = self.next_line()
         merges = []
-        while True:
-            merge = self._get_merge()
-            if merge is not None:
-                # while the spec suggests it's illegal, git-fast-export
-                # outputs multiple merges on the one line, e.g.
-                # merge :x :y :z
-                these_merges = merge.split(" ")
-                merges.extend(these_merges)
-            else:
-                break
+        while line is not None and line.startswith('merge '):
+            # while the spec suggests it's illegal, git-fast-export
+            # outputs multiple merges on the one line, e.g.
+            # merge :x :y :z
+            merges.extend(line[len('merge '):].split(" "))
+            line = self.next_line()
         properties = {}
-        while True:
-            name_value = self._get_property()
-            if name_value is not None:
-                name, value = name_value
-                properties[name] = value
-            else:
-                break
-        return commands.CommitCommand(ref, mark, author, committer, message,
-            from_, merges, list(self.iter_file_commands()), lineno=lineno,
+        while line is not None and line.startswith('property '):
+            name, value = self._name_value(line[len('property '):])
+            properties[name] = value
+            line = self.next_line()
+        if line is not None:
+            self.push_line(line)
+        if self.stream_file_commands:
+            file_iter = None
+        else:
+            file_iter = list(self.iter_file_commands())
+        cmd = commands.CommitCommand(ref, mark, author, committer, message,
+            from_, merges, file_iter, lineno=lineno,
             more_authors=more_authors, properties=properties)
+        if file_iter is None:
+            cmd.file_iter = self._stream_file_commands(cmd)
+        return cmd
+
+    def _stream_file_commands(self, cmd):
+        """Parse the file commands of a commit one at a time."""
+        for file_cmd in self.iter_file_commands():
+            yield file_cmd
+        cmd.end_offset = self.offset
 
     def _parse_feature(self, info):
         """Parse a feature command."""
@@ -396,7 +1052,16 @@ class ImportParser(LineBasedParser):
         else:
             value = None
         self.features[name] = value
-        return commands.FeatureCommand(name, value, lineno=self.lineno)
+        return commands.FeatureCommand(name, value,
+            lineno=self._lazy_lineno())
+
+    def _parse_progress(self, info):
+        """Parse a progress command."""
+        return commands.ProgressCommand(info)
+
+    def _parse_checkpoint(self, info):
+        """Parse a checkpoint command."""
+        return commands.CheckpointCommand()
 
     def _parse_file_modify(self, info):
         """Parse a filemodify command within a commit.
@@ -405,7 +1070,9 @@ class ImportParser(LineBasedParser):
           (where dataref might be the hard-coded literal 'inline').
         """
         params = info.split(' ', 2)
-        path = self._path(params[2])
+        if len(params) < 3:
+            self.abort(errors.BadFormat, 'filemodify', 'path', info)
+        path = self._paths[params[2]]
         mode = self._mode(params[0])
         if params[1] == 'inline':
             dataref = None
@@ -416,6 +1083,24 @@ class ImportParser(LineBasedParser):
         return commands.FileModifyCommand(path, mode, dataref,
             data)
 
+    def _parse_file_delete(self, info):
+        """Parse a filedelete command within a commit."""
+        return commands.FileDeleteCommand(self._paths[info])
+
+    def _parse_file_rename(self, info):
+        """Parse a filerename command within a commit."""
+        old, new = self._path_pair(info)
+        return commands.FileRenameCommand(old, new)
+
+    def _parse_file_copy(self, info):
+        """Parse a filecopy command within a commit."""
+        src, dest = self._path_pair(info)
+        return commands.FileCopyCommand(src, dest)
+
+    def _parse_file_delete_all(self, info):
+        """Parse a filedeleteall command within a commit."""
+        return commands.FileDeleteAllCommand()
+
     def _parse_reset(self, ref):
         """Parse a reset command."""
         from_ = self._get_from()
@@ -432,7 +1117,9 @@ class ImportParser(LineBasedParser):
     def _get_mark_if_any(self):
         """Parse a mark section."""
         line = self.next_line()
-        if line.startswith('mark :'):
+        if line is None:
+            return None
+        elif line.startswith('mark :'):
             return line[len('mark :'):]
         else:
             self.push_line(line)
@@ -451,83 +1138,71 @@ class ImportParser(LineBasedParser):
             self.push_line(line)
             return None
 
-    def _get_merge(self):
-        """Parse a merge section."""
-        line = self.next_line()
-        if line is None:
-            return None
-        elif line.startswith('merge '):
-            return line[len('merge '):]
-        else:
-            self.push_line(line)
-            return None
-
-    def _get_property(self):
-        """Parse a property section."""
-        line = self.next_line()
-        if line is None:
-            return None
-        elif line.startswith('property '):
-            return self._name_value(line[len('property '):])
-        else:
-            self.push_line(line)
-            return None
-
     def _get_user_info(self, cmd, section, required=True,
         accept_just_who=False):
         """Parse a user section."""
         line = self.next_line()
-        if line.startswith(section + ' '):
+        if line is not None and line.startswith(section + ' '):
             return self._who_when(line[len(section + ' '):], cmd, section,
                 accept_just_who=accept_just_who)
         elif required:
             self.abort(errors.MissingSection, cmd, section)
-        else:
+        elif line is not None:
             self.push_line(line)
-            return None
+        return None
 
     def _get_data(self, required_for, section='data'):
         """Parse a data section."""
         line = self.next_line()
-        if line.startswith('data '):
+        if line is not None and line.startswith('data '):
             rest = line[len('data '):]
             if rest.startswith('<<'):
                 return self.read_until(rest[2:])
             else:
                 size = int(rest)
-                read_bytes = self.read_bytes(size)
-                # optional LF after data.
-                next = self.input.readline()
-                self.lineno += 1
-                if len(next) > 1 or next != "\n":
-                    self.push_line(next[:-1])
+                if section == 'data':
+                    read_bytes = self._read_file_data(size)
+                else:
+                    read_bytes = self.read_bytes(size)
+                # optional LF after data, looked at in the buffer rather
+                # than read as a line and pushed back
+                if self._pos == len(self._data):
+                    self._fill()
+                if self._data[self._pos:self._pos + 1] == '\n':
+                    self._pos += 1
                 return read_bytes
         else:
             self.abort(errors.MissingSection, required_for, section)
 
+    def _read_file_data(self, size):
+        """Read the contents of a file from a data section."""
+        if self._map is not None:
+            if self.lazy_data:
+                return self.read_lazy(size)
+            return self.read_buffer(size)
+        elif self.lazy_data and self._seekable:
+            return self.read_lazy(size)
+        elif self.spool_threshold is not None and size > self.spool_threshold:
+            return self.read_spooled(size)
+        else:
+            return self.read_bytes(size)
+
     def _who_when(self, s, cmd, section, accept_just_who=False):
         """Parse who and when information from a string.
 
         :return: a tuple of (name,email,timestamp,timezone). name may be
             the empty string if only an email address was given.
         """
+        who, sep, datestr = s.rpartition('> ')
+        if sep and datestr and '<' in who:
+            # The usual "name <email> date": the identity has most likely
+            # been seen before, so only the date is left to parse
+            id, name, email = self.identities[who]
+            when = self._parse_date(datestr.lstrip())
+            return Authorship(name, email, when[0], when[1])
         match = _WHO_AND_WHEN_RE.search(s)
         if match:
-            datestr = match.group(3).lstrip()
-            if self.date_parser is None:
-                # auto-detect the date format
-                if len(datestr.split(' ')) == 2:
-                    format = 'raw'
-                elif datestr == 'now':
-                    format = 'now'
-                else:
-                    format = 'rfc2822'
-                self.date_parser = dates.DATE_PARSERS_BY_NAME[format]
-            try:
-                when = self.date_parser(datestr, self.lineno)
-            except ValueError:
-                print "failed to parse datestr '%s'" % (datestr,)
-                raise
+            when = self._parse_date(match.group(3).lstrip())
             name = match.group(1)
             email = match.group(2)
         else:
@@ -554,8 +1229,35 @@ class ImportParser(LineBasedParser):
             name, email = self.user_mapper.map_name_and_email(name, email)
         return Authorship(name, email, when[0], when[1])
 
+    def _parse_date(self, datestr):
+        """Parse the date of a user section.
+
+        :return: a tuple of (timestamp,timezone)
+        """
+        if self.date_parser is None:
+            # auto-detect the date format
+            if len(datestr.split(' ')) == 2:
+                format = 'raw'
+            elif datestr == 'now':
+                format = 'now'
+            else:
+                format = 'rfc2822'
+            self.date_parser = dates.DATE_PARSERS_BY_NAME[format]
+        try:
+            return self.date_parser(datestr)
+        except errors.ParsingError, e:
+            # Only work out where we are when there is a problem
+            e.lineno = self.lineno
+            raise
+        except ValueError:
+            self.abort(errors.InvalidDate, datestr)
+
     def _name_value(self, s):
-        """Parse a (name,value) tuple from 'name value-length value'."""
+        """Parse a (name,value) tuple from 'name value-length value'.
+
+        The value is decoded from UTF-8 if it can be, otherwise it is
+        left as bytes.
+        """
         parts = s.split(' ', 2)
         name = parts[0]
         if len(parts) == 1:
@@ -567,10 +1269,21 @@ class ImportParser(LineBasedParser):
             if still_to_read > 0:
                 read_bytes = self.read_bytes(still_to_read)
                 value += "\n" + read_bytes[:still_to_read - 1]
-            value = value.decode('utf8')
+            try:
+                value = value.decode('utf8')
+            except UnicodeDecodeError:
+                pass
         return (name, value)
 
     def _path(self, s):
+        """Parse a path, or find it already parsed."""
+        return self._paths[s]
+
+    def _path_pair(self, s):
+        """Parse two paths separated by a space, or find them parsed."""
+        return list(self._path_pairs[s])
+
+    def _parse_path(self, s):
         """Parse a path."""
         if s.startswith('"'):
             if s[-1] != '"':
@@ -579,7 +1292,7 @@ class ImportParser(LineBasedParser):
                 return _unquote_c_string(s[1:-1])
         return s
 
-    def _path_pair(self, s):
+    def _parse_path_pair(self, s):
         """Parse two paths separated by a space."""
         # TODO: handle a space in the first path
         if s.startswith('"'):
@@ -592,7 +1305,7 @@ class ImportParser(LineBasedParser):
             parts[1] = parts[1][1:-1]
         elif parts[1].startswith('"') or parts[1].endswith('"'):
             self.abort(errors.BadFormat, '?', '?', s)
-        return map(_unquote_c_string, parts)
+        return tuple(map(_unquote_c_string, parts))
 
     def _mode(self, s):
         """Check file mode format and parse into an int.
@@ -614,9 +1327,174 @@ class ImportParser(LineBasedParser):
             self.abort(errors.BadFormat, 'filemodify', 'mode', s)
 
 
+def block_reader(input, binary=False):
+    """Get a function reading up to a given number of bytes of input.
+
+    A read of block_size bytes from a pipe or socket waits for all of
+    them, or for the writer to close it, which may not happen until
+    the whole stream has been parsed (e.g. with the done feature).
+    Such inputs are read with read1 if they have it, otherwise by
+    lines with readline: unlike reading the file descriptor directly,
+    that also sees what the file object has buffered. Other inputs are
+    read with read.
+
+    :param binary: if True, the input isn't made of lines (e.g. it is
+      compressed), so inputs without read1 are read with read, as many
+      bytes at a time as are waiting
+    """
+    try:
+        fileno = input.fileno()
+        st = os.fstat(fileno)
+    except (AttributeError, IOError, OSError, ValueError):
+        return input.read
+    if stat.S_ISREG(st.st_mode):
+        return input.read
+    if getattr(input, 'read1', None) is not None:
+        return input.read1
+    if binary:
+        return functools.partial(_read_waiting, input.read, fileno)
+    if getattr(input, 'readline', None) is not None:
+        return functools.partial(_read_lines, input.readline, fileno)
+    return input.read
+
+
+def _bytes_waiting(fileno):
+    """Get how many bytes can be read from a file descriptor at once.
+
+    :return: the number of bytes, or None if it can't be told
+    """
+    if fcntl is None:
+        return None
+    try:
+        return struct.unpack('i', fcntl.ioctl(fileno, termios.FIONREAD,
+            '\0\0\0\0'))[0]
+    except (IOError, OSError):
+        return None
+
+
+def _read_waiting(read, fileno, size):
+    """Read up to size bytes, without waiting for more than one.
+
+    Reading as many bytes as are waiting in the file descriptor doesn't
+    wait, as any the file object has buffered come first.
+    """
+    waiting = _bytes_waiting(fileno)
+    if waiting is None:
+        return read(size)
+    elif waiting:
+        return read(min(size, waiting))
+    data = read(1)
+    waiting = _bytes_waiting(fileno)
+    if data and waiting and size > 1:
+        data += read(min(size - 1, waiting))
+    return data
+
+
+def _read_lines(readline, fileno, size):
+    """Read lines up to size bytes, without waiting for more than one.
+
+    The first line is waited for. More are only read while the bytes
+    found waiting in the file descriptor by then haven't all been read:
+    those bytes, like any the file object has buffered, can be read
+    without waiting.
+    """
+    line = readline(size)
+    if not line.endswith('\n'):
+        return line
+    waiting = _bytes_waiting(fileno)
+    if waiting is None:
+        return line
+    lines = [line]
+    read = len(line)
+    limit = min(size, read + waiting)
+    while read < limit:
+        line = readline(size - read)
+        if not line:
+            break
+        lines.append(line)
+        read += len(line)
+        if not line.endswith('\n'):
+            break
+    return ''.join(lines)
+
+
+def _count_newlines(data, start, end):
+    """Count the newlines in data[start:end] without copying it all."""
+    if isinstance(data, str):
+        return data.count("\n", start, end)
+    count = 0
+    for i in xrange(start, end, BLOCK_SIZE):
+        count += data[i:min(i + BLOCK_SIZE, end)].count("\n")
+    return count
+
+
 def _unquote_c_string(s):
     """replace C-style escape sequences (\n, \", etc.) with real chars."""
+    if '\\' not in s:
+        # Nothing to replace, as is true of most paths
+        return s
     # HACK: Python strings are close enough
     return s.decode('string_escape', 'replace')
 
+class _LineNumber(object):
+    """The line number of a byte of a parser's input, counted when asked.
+
+    Once counted, the number is kept and the parser let go. If the input
+    can't be read any more, the number is None.
+    """
+
+    __slots__ = ('parser', 'offset', 'value', '__weakref__')
+
+    def __init__(self, parser, offset):
+        self.parser = parser
+        self.offset = offset
+        self.value = None
+
+    def __call__(self):
+        if self.parser is not None:
+            self.resolve()
+        return self.value
+
+    def resolve(self):
+        parser, self.parser = self.parser, None
+        try:
+            self.value = parser.line_number(self.offset)
+        except (EnvironmentError, ValueError):
+            # The input has been closed
+            pass
+
+
 Authorship = collections.namedtuple('Authorship', 'name email timestamp timezone')
+
+# A range of the input skipped after an error, from the start of the
+# command the error was in to the start of the next command
+DroppedRange = collections.namedtuple('DroppedRange', 'start end error')
+
+
+class IdentityTable(dict):
+    """The distinct identities of authors, committers and taggers.
+
+    Each distinct "name <email" text, i.e. a user section up to the
+    closing '>' of the email address, is parsed and given to the user
+    mapper only once and numbered from 0 in the order seen. Looking the
+    text up gives a tuple of (id,name,email), with name and email as
+    mapped; identities lists the (name,email) of each id.
+    """
+
+    def __init__(self, user_mapper=None):
+        dict.__init__(self)
+        self.user_mapper = user_mapper
+        self.identities = []
+
+    def __missing__(self, who):
+        lt = who.index('<')
+        name = who[:lt]
+        email = who[lt + 1:]
+        if name.endswith(" "):
+            name = name[:-1]
+        if self.user_mapper:
+            name, email = self.user_mapper.map_name_and_email(name, email)
+        result = (len(self.identities), name, email)
+        self.identities.append((name, email))
+        self[who] = result
+        return result
@@ -0,0 +1,112 @@
+# Copyright (C) 2026 Canonical Ltd
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Handles on the data of blobs and file modifications.
+
+These stand in for the string normally held by BlobCommand.data and
+FileModifyCommand.data when the parser is asked not to read payloads
+it doesn't have to. They support len(), str() and comparison with
+strings, so commands can be displayed without knowing about them,
+but they are best written out with iter_chunks so that the data is
+never held in memory all at once.
+"""
+
+import mmap
+
+
+# Number of bytes read from the source at a time when writing out
+CHUNK_SIZE = 64 * 1024
+
+
+class LazyPayload(object):
+    """The data of a command, read from its source only when used.
+
+    :ivar source: a memory map or a seekable file-like object
+    :ivar offset: the offset of the data in source
+    :ivar length: the number of bytes of data
+    """
+
+    def __init__(self, source, offset, length):
+        self.source = source
+        self.offset = offset
+        self.length = length
+
+    def _read(self, offset, size):
+        """Read size bytes at offset from the start of the data."""
+        start = self.offset + offset
+        source = self.source
+        if isinstance(source, mmap.mmap):
+            return source[start:start + size]
+        # Leave the source where it was, as the parser may still be
+        # reading from it
+        saved = source.tell()
+        try:
+            source.seek(start)
+            return source.read(size)
+        finally:
+            source.seek(saved)
+
+    def read(self):
+        """Read all the data.
+
+        :return: a string
+        """
+        return self._read(0, self.length)
+
+    def iter_chunks(self, chunk_size=CHUNK_SIZE):
+        """Iterate over the data in chunks of at most chunk_size bytes."""
+        for offset in xrange(0, self.length, chunk_size):
+            yield self._read(offset, min(chunk_size, self.length - offset))
+
+    def write_to(self, outf, chunk_size=CHUNK_SIZE):
+        """Write the data to a file-like object, a chunk at a time."""
+        for chunk in self.iter_chunks(chunk_size):
+            outf.write(chunk)
+
+    def __len__(self):
+        return self.length
+
+    def __str__(self):
+        return self.read()
+
+    def __eq__(self, other):
+        if isinstance(other, LazyPayload):
+            if (self.source is other.source and self.offset == other.offset
+                and self.length == other.length):
+                return True
+            other = other.read()
+        elif not isinstance(other, basestring):
+            return NotImplemented
+        return len(other) == self.length and self.read() == other
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __repr__(self):
+        return "<%s of %d bytes at offset %d>" % (self.__class__.__name__,
+            self.length, self.offset)
+
+
+def iter_chunks(data, chunk_size=CHUNK_SIZE):
+    """Iterate over data in chunks of at most chunk_size bytes.
+
+    :param data: a string, buffer or payload handle
+    """
+    if isinstance(data, LazyPayload):
+        return data.iter_chunks(chunk_size)
+    return (data[i:i + chunk_size] for i in xrange(0, len(data), chunk_size))
@@ -28,12 +28,44 @@ To import from a fast-import stream to your version-control system:
 
 See git-fast-import.1 for the meaning of each command and the
 processors package for examples.
+
+Processors recording what each mark became, such as importers, can
+set handles_marks. The object names of marks are then kept in their
+marks attribute when the stream asks for marks to be loaded or saved
+(the import-marks, import-marks-if-exists and export-marks features),
+and handlers should record them, e.g.
+
+   if self.marks is not None:
+       self.marks[cmd.id] = revision_id
+
+A processor can save its state at checkpoint commands, and every so
+often, so that a run which stops can be restarted from the last
+checkpoint rather than from the start of the stream:
+
+   proc.checkpoint_path = 'filter.checkpoint'
+   p = proc.restart(input) or fastimport.parser.ImportParser(input)
+   proc.process(p.iter_commands)
+
+Subclasses keeping state across commands should then implement
+get_state and set_state.
 """
 
+import cPickle
+import errno
+import os
 import sys
 import time
 
 import errors
+import marks
+import parser
+
+
+# Features naming marks files
+_MARKS_FEATURES = ('import-marks', 'import-marks-if-exists', 'export-marks')
+
+# Version of the checkpoint files written by save_checkpoint
+_CHECKPOINT_VERSION = 1
 
 
 class ImportProcessor(object):
@@ -45,6 +77,11 @@ class ImportProcessor(object):
 
     known_params = []
 
+    # Whether the processor loads and saves the marks files named by
+    # the marks features, rather than leaving them to whatever imports
+    # its output
+    handles_marks = False
+
     def __init__(self, params=None, verbose=False, outf=None):
         if outf is None:
             self.outf = sys.stdout
@@ -61,6 +98,24 @@ class ImportProcessor(object):
         # iterating through the remaining commands
         self.finished = False
 
+        # The object names by mark, if marks are loaded or saved, the
+        # file they are saved to at the end and whether in the binary
+        # format; see _marks_feature
+        self.marks = None
+        self.export_marks_path = None
+        self.binary_marks = False
+
+        # The file the state is saved to at checkpoints, if any, and how
+        # often in seconds it is also saved without a checkpoint command
+        self.checkpoint_path = None
+        self.checkpoint_interval = None
+        # The (name,value) of the features seen, the input restarted
+        # from and the state of the subclass to restore when processing
+        # starts
+        self._features = []
+        self._restart_input = None
+        self._restored_state = None
+
     def validate_parameters(self):
         """Validate that the parameters are correctly specified."""
         for p in self.params:
@@ -76,7 +131,16 @@ class ImportProcessor(object):
 
     def _process(self, command_iter):
         self.pre_process()
+        if self._restored_state is not None:
+            self.set_state(self._restored_state)
+            self._restored_state = None
+        last_checkpoint = time.time()
         for cmd in command_iter():
+            if cmd.name == 'feature':
+                self._features.append((cmd.feature_name, cmd.value))
+                if self.handles_marks and (
+                    cmd.feature_name in _MARKS_FEATURES):
+                    self._marks_feature(cmd)
             try:
                 handler = getattr(self.__class__, cmd.name + "_handler")
             except KeyError:
@@ -85,9 +149,161 @@ class ImportProcessor(object):
                 self.pre_handler(cmd)
                 handler(self, cmd)
                 self.post_handler(cmd)
+            if self.checkpoint_path is not None and (
+                cmd.name == 'checkpoint' or
+                (self.checkpoint_interval is not None and
+                 time.time() - last_checkpoint >= self.checkpoint_interval)):
+                if self.save_checkpoint(cmd):
+                    last_checkpoint = time.time()
             if self.finished:
                 break
         self.post_process()
+        if self.export_marks_path is not None:
+            marks.save_marks(self.export_marks_path, self.marks,
+                binary=self.binary_marks)
+
+    def _marks_feature(self, cmd):
+        """Load marks or remember where to save them.
+
+        Marks files in the binary format are mapped into memory rather
+        than read, and marks are then saved in that format too.
+        """
+        if cmd.feature_name == 'export-marks':
+            self.export_marks_path = cmd.value
+        elif (cmd.feature_name == 'import-marks' or
+            os.path.exists(cmd.value)):
+            self.marks = marks.load_marks(cmd.value)
+            self.binary_marks = isinstance(self.marks, marks.MappedMarks)
+        if self.marks is None:
+            self.marks = marks.MarkTable()
+
+    def get_state(self):
+        """Get the state to save at a checkpoint.
+
+        Subclasses keeping state across commands should return it here,
+        as anything that can be pickled, and take it back in set_state.
+        """
+        return None
+
+    def set_state(self, state):
+        """Restore the state returned by get_state at a checkpoint.
+
+        This is called when processing restarts, after pre_process.
+        """
+        pass
+
+    def save_checkpoint(self, cmd):
+        """Save what is needed to restart after a command to checkpoint_path.
+
+        The marks are saved too, to the export-marks file if there is
+        one, otherwise next to the checkpoint.
+
+        :return: False if the checkpoint couldn't be saved as where the
+          command ends isn't known yet
+        """
+        end_offset = getattr(cmd, 'end_offset', None)
+        if end_offset is None:
+            return False
+        self.outf.flush()
+        try:
+            output_offset = self.outf.tell()
+        except (AttributeError, IOError, ValueError):
+            output_offset = None
+        if self.marks is None:
+            marks_path = None
+        elif self.export_marks_path is not None:
+            marks_path = self.export_marks_path
+            marks.save_marks(marks_path, self.marks, self.binary_marks)
+        else:
+            marks_path = self.checkpoint_path + '.marks'
+            marks.save_marks(marks_path, self.marks, binary=True)
+        state = {
+            'version': _CHECKPOINT_VERSION,
+            # The command the checkpoint was saved after, to check the
+            # stream restarted from is the same one
+            'last_command': (cmd.name, getattr(cmd, 'mark', None),
+                cmd.offset),
+            'offset': end_offset,
+            'output_offset': output_offset,
+            'features': self._features,
+            'marks_path': marks_path,
+            'export_marks_path': self.export_marks_path,
+            'binary_marks': self.binary_marks,
+            'processor': self.get_state(),
+            }
+        # Replace the last checkpoint only once this one is complete
+        f = open(self.checkpoint_path + '.tmp', 'wb')
+        try:
+            cPickle.dump(state, f, 2)
+        finally:
+            f.close()
+        os.rename(self.checkpoint_path + '.tmp', self.checkpoint_path)
+        return True
+
+    def restart(self, input, **parser_kwargs):
+        """Carry on from the checkpoint saved to checkpoint_path, if any.
+
+        The marks and features are restored at once, the state of the
+        subclass when processing starts. If the output can seek, what
+        was written after the checkpoint is dropped. Line numbers are
+        counted from the checkpoint.
+
+        :param input: the stream, which must be able to seek
+        :param parser_kwargs: passed on to the ImportParser
+        :return: an ImportParser reading the rest of the stream from the
+          checkpoint, whose commands should be given to process, or None
+          if there is no checkpoint
+        :raise BadRestart: if the checkpoint is not of this stream
+        """
+        try:
+            f = open(self.checkpoint_path, 'rb')
+        except IOError, e:
+            if e.errno == errno.ENOENT:
+                return None
+            raise
+        try:
+            state = cPickle.load(f)
+        finally:
+            f.close()
+        name, mark, offset = state['last_command']
+        if state['version'] != _CHECKPOINT_VERSION:
+            raise errors.BadRestart(mark or name)
+        # Check the command before the checkpoint is where it was
+        input.seek(offset)
+        try:
+            last = parser.ImportParser(input).iter_commands().next()
+        except (StopIteration, errors.ParsingError):
+            raise errors.BadRestart(mark or name)
+        if (last.name != name or getattr(last, 'mark', None) != mark or
+            last.end_offset != state['offset']):
+            raise errors.BadRestart(mark or name)
+        input.seek(state['offset'])
+        p = parser.ImportParser(input, **parser_kwargs)
+        p.features.update(dict(state['features']))
+        self._features = list(state['features'])
+        if state['marks_path'] is not None:
+            self.marks = marks.load_marks(state['marks_path'])
+        self.export_marks_path = state['export_marks_path']
+        self.binary_marks = state['binary_marks']
+        if state['output_offset'] is not None:
+            self.outf.seek(state['output_offset'])
+            self.outf.truncate()
+        self._restart_input = input
+        self._restored_state = state['processor']
+        return p
+
+    def command_at(self, offset):
+        """Parse the command at an offset of the input restarted from.
+
+        Data is read only when used. The input is left where it was.
+        """
+        saved = self._restart_input.tell()
+        try:
+            self._restart_input.seek(offset)
+            p = parser.ImportParser(self._restart_input, lazy_data=True)
+            return p.iter_commands().next()
+        finally:
+            self._restart_input.seek(saved)
 
     def warning(self, msg, *args):
         """Output a warning but timestamp it."""
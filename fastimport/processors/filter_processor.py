@@ -19,6 +19,7 @@
 from fastimport import (
     commands,
     helpers,
+    marks,
     processor,
     )
 import stat
@@ -45,11 +46,11 @@ class BaseFilterProcessor(processor.ImportProcessor):
         self.squash_empty_commits = bool(
             self.params.get('squash_empty_commits', True))
         # Buffer of blobs until we know we need them: mark -> cmd
-        self.blobs = {}
+        self.blobs = marks.MarkTable()
         # These are the commits we've squashed so far
-        self.squashed_commits = set()
+        self.squashed_commits = marks.MarkSet()
         # Map of commit-id to list of parents
-        self.parents = {}
+        self.parents = marks.MarkTable()
 
     def pre_handler(self, cmd):
         self.command = cmd
@@ -63,9 +64,37 @@ class BaseFilterProcessor(processor.ImportProcessor):
             return
         # print referenced blobs and the command
         for blob_id in self.referenced_blobs:
-            self._print_command(self.blobs[blob_id])
+            blob = self.blobs[blob_id]
+            if isinstance(blob, (int, long)):
+                # Only the offset of blobs from before a restart is kept
+                blob = self.command_at(blob)
+            self._print_command(blob)
         self._print_command(self.command)
 
+    def get_state(self):
+        """Get the blobs, squashed commits and parents to save."""
+        # Blobs are saved as their offsets in the input, to be parsed
+        # again when needed
+        blobs = marks.MarkTable(helpers.array_typecode(8, False))
+        for blob_id, blob in self.blobs.iteritems():
+            if isinstance(blob, (int, long)):
+                blobs[blob_id] = blob
+            else:
+                blobs[blob_id] = blob.offset
+        return {
+            'blobs': blobs,
+            'squashed_commits': self.squashed_commits,
+            'parents': self.parents,
+            }
+
+    def set_state(self, state):
+        """Restore the blobs, squashed commits and parents saved."""
+        self.blobs = marks.MarkTable()
+        for blob_id, offset in state['blobs'].iteritems():
+            self.blobs[blob_id] = offset
+        self.squashed_commits = state['squashed_commits']
+        self.parents = state['parents']
+
     def progress_handler(self, cmd):
         """Process a ProgressCommand."""
         # These always pass through
@@ -148,8 +177,11 @@ class BaseFilterProcessor(processor.ImportProcessor):
 
     def _print_command(self, cmd):
         """Wrapper to avoid adding unnecessary blank lines."""
-        text = repr(cmd)
-        self.outf.write(text)
+        text = ""
+        for chunk in cmd.iter_chunks():
+            if chunk:
+                self.outf.write(chunk)
+                text = chunk
         if not text.endswith("\n"):
             self.outf.write("\n")
 
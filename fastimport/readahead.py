@@ -0,0 +1,190 @@
+# Copyright (C) 2026 Canonical Ltd
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Reading of input in a background thread.
+
+When a stream comes from a pipe or socket, a ReadAheadFile lets reading
+overlap with parsing: a thread keeps a bounded queue of blocks filled
+while the parser works on the previous ones:
+
+   input = fastimport.readahead.ReadAheadFile(sys.stdin)
+   p = fastimport.parser.ImportParser(input)
+"""
+
+import Queue
+import sys
+import threading
+import time
+
+from fastimport.parser import (
+    BLOCK_SIZE,
+    block_reader,
+    )
+
+
+# Number of blocks which may be read ahead of the reader
+DEPTH = 4
+
+# How often, in seconds, a thread waiting on the queue checks for close
+_POLL_INTERVAL = 0.1
+
+
+class ReadAheadFile(object):
+    """A file-like object reading from another in a background thread.
+
+    Only read is supported. The input is read in blocks of up to
+    block_size bytes, as much as is available from a pipe or socket
+    (see parser.block_reader); at most depth blocks are held waiting to
+    be read.
+
+    The following counters are kept, see also stats():
+
+    :ivar blocks: the number of blocks read from the input
+    :ivar bytes: the number of bytes read from the input
+    :ivar read_time: the time the thread spent reading the input
+    :ivar waits: how many times a block wasn't ready when needed
+    :ivar wait_time: the time spent waiting for blocks
+    :ivar depth_total: the sum of the queue depths seen when taking a
+      block from the queue
+    :ivar max_depth: the largest queue depth seen
+    """
+
+    def __init__(self, input, block_size=BLOCK_SIZE, depth=DEPTH):
+        self.input = input
+        self.block_size = block_size
+        self.blocks = 0
+        self.bytes = 0
+        self.read_time = 0.0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.depth_total = 0
+        self.max_depth = 0
+        self._gets = 0
+        self._queue = Queue.Queue(depth)
+        self._block = ''
+        self._pos = 0
+        self._eof = False
+        self._closed = False
+        self._thread = threading.Thread(target=self._read_ahead,
+            name='fastimport read-ahead')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _read_ahead(self):
+        """Fill the queue with blocks of the input.
+
+        This runs in the background thread. The end of the input is
+        queued as an empty block and an error as its exc_info.
+        """
+        try:
+            read = block_reader(self.input)
+            while not self._closed:
+                start = time.time()
+                block = read(self.block_size)
+                self.read_time += time.time() - start
+                self.blocks += 1
+                self.bytes += len(block)
+                self._put(block)
+                if not block:
+                    break
+        except Exception:
+            self._put(sys.exc_info())
+
+    def _put(self, item):
+        while not self._closed:
+            try:
+                self._queue.put(item, timeout=_POLL_INTERVAL)
+            except Queue.Full:
+                continue
+            return
+
+    def _next_block(self):
+        """Move on to the next block of the input.
+
+        :return: False at the end of the input
+        """
+        depth = self._queue.qsize()
+        self._gets += 1
+        self.depth_total += depth
+        self.max_depth = max(self.max_depth, depth)
+        if depth:
+            block = self._queue.get()
+        else:
+            self.waits += 1
+            start = time.time()
+            block = self._queue.get()
+            self.wait_time += time.time() - start
+        if isinstance(block, tuple):
+            self._eof = True
+            raise block[0], block[1], block[2]
+        self._block = block
+        self._pos = 0
+        if not block:
+            self._eof = True
+            return False
+        return True
+
+    def read(self, size=-1):
+        """Read at most size bytes, or all that is left if size < 0.
+
+        A read only waits for a block when none is being read from, so
+        fewer bytes than asked for may be returned before the end of
+        the input: those left of the current block.
+        """
+        if self._closed:
+            raise ValueError("I/O operation on closed file")
+        if size < 0:
+            parts = [self._block[self._pos:]]
+            self._pos = len(self._block)
+            while not self._eof and self._next_block():
+                parts.append(self._block)
+                self._pos = len(self._block)
+            return ''.join(parts)
+        if not size:
+            return ''
+        if self._pos == len(self._block):
+            if self._eof or not self._next_block():
+                return ''
+        if self._pos == 0 and size >= len(self._block):
+            # Hand the whole block over without copying it
+            part = self._block
+        else:
+            part = self._block[self._pos:self._pos + size]
+        self._pos += len(part)
+        return part
+
+    def close(self):
+        """Stop reading ahead.
+
+        The input itself is not closed. The thread is given a moment to
+        finish but not waited for if it is blocked reading the input,
+        e.g. from an idle pipe: it is a daemon thread, and exits once the
+        read returns.
+        """
+        self._closed = True
+        self._thread.join(2 * _POLL_INTERVAL)
+
+    def stats(self):
+        """Get the counters of the reading done so far.
+
+        :return: a dictionary of the counters, plus mean_depth, the
+          average number of blocks ready when one was needed
+        """
+        result = dict((name, getattr(self, name)) for name in
+            ('blocks', 'bytes', 'read_time', 'waits', 'wait_time',
+             'depth_total', 'max_depth'))
+        result['mean_depth'] = (float(self.depth_total) /
+            max(self._gets, 1))
+        return result
@@ -0,0 +1,219 @@
+# Copyright (C) 2026 Canonical Ltd
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Scanner finding the commands of a fast-import stream without parsing them.
+
+Only command headers, marks, data sections and properties are looked at:
+data and the lines of property values are skipped over by their declared
+lengths, so no command objects are built and
+the contents of files are never read if the input can seek:
+
+   table = fastimport.scanner.scan(open('export.fi', 'rb'))
+   print table.counts()['commit']
+"""
+
+import array
+
+from fastimport import (
+    commands,
+    helpers,
+    )
+from fastimport.parser import (
+    BLOCK_SIZE,
+    LineBasedParser,
+    )
+
+
+# Prefixes of command headers, as recognised by ImportParser, and the
+# names of the commands they start
+HEADERS = [
+    ('commit ', 'commit'),
+    ('blob', 'blob'),
+    ('done', 'done'),
+    ('progress ', 'progress'),
+    ('reset ', 'reset'),
+    ('tag ', 'tag'),
+    ('checkpoint', 'checkpoint'),
+    ('feature', 'feature'),
+    ]
+HEADER_PREFIXES = tuple([prefix for prefix, name in HEADERS])
+
+
+class CommandScanner(LineBasedParser):
+    """Finds where the commands of a stream are."""
+
+    def __init__(self, input, block_size=BLOCK_SIZE):
+        """Create a scanner.
+
+        :param input: the file-like object to read from
+        :param block_size: the number of bytes to read from input at once
+        """
+        LineBasedParser.__init__(self, input, block_size)
+
+    def iter_commands(self):
+        """Iterate over the commands in the stream.
+
+        Scanning stops after a 'done' command. Each command is returned
+        once its end has been found.
+
+        :return: an iterator of (name, offset, mark, data_size) tuples,
+          where offset is where the command starts in the input, mark is
+          None if the command has no mark and data_size is the total size
+          of the data sections of the command
+        """
+        name = offset = mark = None
+        data_size = 0
+        # Lines are looked at in place in the buffer rather than copied
+        # out of it, as most of them are skipped
+        while True:
+            data = self._data
+            start = self._pos
+            end = data.find('\n', start)
+            if end != -1:
+                end += 1
+            elif self._fill():
+                continue
+            elif start < len(data):
+                end = len(data)
+            else:
+                break
+            self._pos = end
+            if data.startswith('data ', start):
+                data_size += self._skip_data(
+                    data[start + len('data '):end].rstrip('\n'))
+            elif data.startswith('mark :', start):
+                mark = data[start + len('mark :'):end].rstrip('\n')
+            elif data.startswith('property ', start):
+                self._skip_property(
+                    data[start + len('property '):end].rstrip('\n'))
+            elif data.startswith(HEADER_PREFIXES, start):
+                if name is not None:
+                    yield name, offset, mark, data_size
+                for prefix, name in HEADERS:
+                    if data.startswith(prefix, start):
+                        break
+                offset = self._data_offset + start
+                mark = None
+                data_size = 0
+                if name == 'done':
+                    break
+        if name is not None:
+            yield name, offset, mark, data_size
+
+    def _skip_property(self, rest):
+        """Skip over the lines of a property value after its first one.
+
+        As for ImportParser, the value starts on the property line and
+        its length includes the newlines in it.
+        """
+        parts = rest.split(' ', 2)
+        if len(parts) > 1:
+            if len(parts) > 2:
+                value = parts[2]
+            else:
+                value = ''
+            still_to_read = int(parts[1]) - len(value)
+            if still_to_read > 0:
+                self.skip_bytes(still_to_read)
+
+    def _skip_data(self, rest):
+        """Skip over the contents of a data section.
+
+        :return: the size of the data
+        """
+        if rest.startswith('<<'):
+            return len(self.read_until(rest[2:]))
+        else:
+            size = int(rest)
+            self.skip_bytes(size)
+            return size
+
+
+class ScanTable(object):
+    """The commands found in a stream by a CommandScanner.
+
+    Each column is an array with an item per command, in stream order:
+
+    :ivar kinds: the position of the command name in COMMAND_NAMES
+    :ivar offsets: the offset of the command in the stream
+    :ivar lengths: the number of bytes up to the next command
+    :ivar marks: the mark of the command if it is a number, or 0
+    :ivar data_sizes: the total size of the data sections of the command
+    """
+
+    # Names of the commands found, including 'done'
+    COMMAND_NAMES = commands.COMMAND_NAMES + ['done']
+
+    def __init__(self):
+        self.kinds = array.array(helpers.array_typecode(1, False))
+        self.offsets = array.array(helpers.array_typecode(8, False))
+        self.lengths = array.array(helpers.array_typecode(8, False))
+        self.marks = array.array(helpers.array_typecode(8, False))
+        self.data_sizes = array.array(helpers.array_typecode(8, False))
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def kind(self, i):
+        """Get the name of the i'th command."""
+        return self.COMMAND_NAMES[self.kinds[i]]
+
+    def counts(self):
+        """Count the commands of each kind.
+
+        :return: a dictionary of command names to numbers of commands
+        """
+        counts = dict.fromkeys(self.COMMAND_NAMES, 0)
+        for kind in self.kinds:
+            counts[self.COMMAND_NAMES[kind]] += 1
+        return counts
+
+    def data_size(self, name=None):
+        """Get the total size of the data sections of the commands.
+
+        :param name: only count commands with this name
+        """
+        if name is None:
+            return sum(self.data_sizes)
+        kind = self.COMMAND_NAMES.index(name)
+        return sum([size for k, size in zip(self.kinds, self.data_sizes)
+            if k == kind])
+
+
+def scan(input, block_size=BLOCK_SIZE):
+    """Scan a stream for its commands.
+
+    :param input: the file-like object to read the stream from
+    :return: a ScanTable
+    """
+    table = ScanTable()
+    scanner = CommandScanner(input, block_size)
+    kind_of = dict([(name, i) for i, name in
+        enumerate(table.COMMAND_NAMES)])
+    previous = None
+    for name, offset, mark, data_size in scanner.iter_commands():
+        if previous is not None:
+            table.lengths.append(offset - previous)
+        table.kinds.append(kind_of[name])
+        table.offsets.append(offset)
+        if mark is not None and mark.isdigit():
+            table.marks.append(int(mark))
+        else:
+            table.marks.append(0)
+        table.data_sizes.append(data_size)
+        previous = offset
+    if previous is not None:
+        table.lengths.append(scanner.offset - previous)
+    return table
@@ -23,11 +23,18 @@ import unittest
 def test_suite():
     names = [
         'test_commands',
+        'test_compression',
         'test_dates',
         'test_errors',
+        'test_feedparser',
         'test_filter_processor',
         'test_helpers',
+        'test_index',
+        'test_marks',
+        'test_parallel',
         'test_parser',
+        'test_payload',
+        'test_readahead',
         ]
     module_names = ['fastimport.tests.' + name for name in names]
     result = unittest.TestSuite()
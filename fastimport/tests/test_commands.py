@@ -15,6 +15,7 @@
 
 """Test how Commands are displayed"""
 
+import cPickle
 from unittest import TestCase
 
 from fastimport import (
@@ -32,6 +33,12 @@ class TestBlobDisplay(TestCase):
         c = commands.BlobCommand(None, "hello world")
         self.assertEqual("blob\ndata 11\nhello world", repr(c))
 
+    def test_blob_chunks(self):
+        c = commands.BlobCommand("1", "x" * 100000)
+        chunks = list(c.iter_chunks())
+        self.assertEqual(3, len(chunks))
+        self.assertEqual(repr(c), "".join(chunks))
+
 
 class TestCheckpointDisplay(TestCase):
 
@@ -55,6 +62,7 @@ class TestCommitDisplay(TestCase):
             "release v1.0\n"
             "from :aaa",
             repr(c))
+        self.assertEqual(repr(c), "".join(c.iter_chunks()))
 
     def test_commit_unicode_committer(self):
         # user tuple is (name, email, secs-since-epoch, secs-offset-from-utc)
@@ -227,6 +235,10 @@ class TestCommitCopy(TestCase):
     def test_invalid_attribute(self):
         self.assertRaises(TypeError, self.c.copy, invalid=True)
 
+    def test_chunks(self):
+        c2 = self.c.copy()
+        self.assertEqual(repr(self.c), "".join(c2.iter_chunks()))
+
 class TestFeatureDisplay(TestCase):
 
     def test_feature(self):
@@ -295,6 +307,7 @@ class TestFileModifyDisplay(TestCase):
         c = commands.FileModifyCommand("foo/bar", 0100644, None,
             "hello world")
         self.assertEqual("M 644 inline foo/bar\ndata 11\nhello world", repr(c))
+        self.assertEqual(repr(c), "".join(c.iter_chunks()))
 
     def test_filemodify_symlink(self):
         c = commands.FileModifyCommand("foo/bar", 0120000, None, "baz")
@@ -442,3 +455,44 @@ class TestPathChecking(TestCase):
         self.assertRaises(ValueError, commands.FileCopyCommand, None, "foo")
         self.assertRaises(ValueError, commands.FileCopyCommand, "foo", "")
         self.assertRaises(ValueError, commands.FileCopyCommand, "foo", None)
+
+
+class TestCommandFields(TestCase):
+
+    def test_no_dict(self):
+        cmd = commands.FileModifyCommand('NEWS', 0100644, ':1', None)
+        self.assertFalse(hasattr(cmd, '__dict__'))
+        self.assertRaises(AttributeError, setattr, cmd, 'bogus', 1)
+
+    def test_dump_str(self):
+        cmd = commands.BlobCommand('1', 'aaa', lineno=3)
+        self.assertEqual("'blob'\t'1'\t'(...)'\t':1'\tNone\tNone\t3",
+            cmd.dump_str())
+        self.assertEqual("':1'\t3", cmd.dump_str(['id', 'lineno']))
+
+    def test_pickle(self):
+        cmd = commands.CommitCommand("refs/heads/master", "1", None,
+            ('Joe', 'joe@example.com', 1234567890, 0), "msg", None, [],
+            [commands.FileDeleteCommand('a'),
+             commands.FileDeleteAllCommand()], lineno=5)
+        cmd.offset = 10
+        for protocol in (0, 2):
+            copy = cPickle.loads(cPickle.dumps(cmd, protocol))
+            self.assertEqual(repr(cmd), repr(copy))
+            self.assertEqual((5, 10), (copy.lineno, copy.offset))
+
+    def test_deleteall_shared(self):
+        self.assertTrue(commands.FileDeleteAllCommand() is
+            commands.FileDeleteAllCommand())
+
+    def test_subclass_without_slots(self):
+
+        class ExtraCommand(commands.ImportCommand):
+
+            def __init__(self, extra):
+                commands.ImportCommand.__init__(self, 'extra')
+                self.extra = extra
+
+        cmd = ExtraCommand('x')
+        self.assertEqual('extra', cmd.name)
+        self.assertEqual("'extra'\tNone\tNone\t'x'", cmd.dump_str())
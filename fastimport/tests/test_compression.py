@@ -0,0 +1,220 @@
+# Copyright (C) 2026 Canonical Ltd
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test compressed input and output"""
+
+import bz2
+import gzip
+import os
+import threading
+from cStringIO import StringIO
+from unittest import TestCase
+
+from fastimport import (
+    compression,
+    errors,
+    parser,
+    )
+
+
+_sample_stream = \
+"""blob
+mark :1
+data 5
+hello
+commit refs/heads/master
+mark :2
+committer Joe <joe@example.com> 1234567890 +0000
+data 6
+first
+M 644 :1 README
+
+"""
+
+
+def gzip_compress(data):
+    f = StringIO()
+    g = gzip.GzipFile(fileobj=f, mode='wb')
+    g.write(data)
+    g.close()
+    return f.getvalue()
+
+
+class NonSeekable(object):
+
+    def __init__(self, text):
+        self._f = StringIO(text)
+
+    def read(self, size=-1):
+        return self._f.read(size)
+
+
+class BrokenFile(object):
+
+    def write(self, data):
+        raise IOError("broken pipe")
+
+    def flush(self):
+        pass
+
+
+class TestDetect(TestCase):
+
+    def test_detect(self):
+        self.assertEqual('gz', compression.detect(gzip_compress('x')))
+        self.assertEqual('bz2', compression.detect(bz2.compress('x')))
+        self.assertEqual('xz', compression.detect('\xfd7zXZ\x00\x00'))
+        self.assertEqual(None, compression.detect('blob\n'))
+        self.assertEqual(None, compression.detect(''))
+
+
+class TestOpenInput(TestCase):
+
+    def read_all(self, f):
+        parts = []
+        while True:
+            data = f.read(7)
+            if not data:
+                return ''.join(parts)
+            parts.append(data)
+
+    def test_uncompressed_seekable(self):
+        f = StringIO(_sample_stream)
+        self.assertTrue(compression.open_input(f) is f)
+        self.assertEqual(0, f.tell())
+
+    def test_uncompressed_unseekable(self):
+        f = compression.open_input(NonSeekable(_sample_stream))
+        self.assertEqual(_sample_stream, self.read_all(f))
+
+    def test_gzip(self):
+        f = compression.open_input(StringIO(gzip_compress(_sample_stream)))
+        self.assertEqual(_sample_stream, self.read_all(f))
+
+    def test_gzip_members(self):
+        data = gzip_compress("abc") + gzip_compress("def")
+        f = compression.open_input(NonSeekable(data), read_ahead=False)
+        self.assertEqual("abcdef", f.read())
+
+    def test_bzip2(self):
+        f = compression.open_input(NonSeekable(bz2.compress(_sample_stream)))
+        self.assertEqual(_sample_stream, self.read_all(f))
+
+    def test_members_ending_on_block_boundary(self):
+        for compress in (gzip_compress, bz2.compress):
+            first = compress("abc")
+            f = compression.DecompressingFile(
+                NonSeekable(first + compress("def")),
+                compression.detect(first), block_size=len(first))
+            self.assertEqual("abcdef", f.read())
+
+    def test_small_reads(self):
+        data = "".join(["%06d\n" % i for i in xrange(10000)])
+        f = compression.DecompressingFile(
+            NonSeekable(gzip_compress(data)), 'gz')
+        self.assertEqual("000000\n0", f.read(8))
+        self.assertEqual(data[8:], self.read_all(f) + f.read())
+
+    def test_xz_without_lzma(self):
+        if compression.lzma is not None:
+            return
+        self.assertRaises(errors.UnsupportedCompression,
+            compression.open_input, StringIO('\xfd7zXZ\x00\x00'))
+
+    def test_parse(self):
+        p = parser.ImportParser(StringIO(bz2.compress(_sample_stream)),
+            decompress=True)
+        cmds = list(p.iter_commands())
+        self.assertEqual(['blob', 'commit'], [c.name for c in cmds])
+        self.assertEqual('hello', cmds[0].data)
+        self.assertEqual(26, cmds[1].offset)
+
+    def test_prefixed_readline(self):
+        f = compression._PrefixedFile("ab\nc", StringIO("de\nfg\n"))
+        self.assertEqual("a", f.readline(1))
+        self.assertEqual("b\n", f.readline())
+        self.assertEqual("cd", f.readline(2))
+        self.assertEqual("e\n", f.readline())
+        self.assertEqual("fg\n", f.readline())
+
+    def parse_pipe_left_open(self, data):
+        """Parse data from a pipe whose writer stays open."""
+        r, w = os.pipe()
+        input = os.fdopen(r, 'rb')
+        os.write(w, data)
+        p = parser.ImportParser(input, decompress=True)
+        def cleanup():
+            # Let a read in progress return before closing what it reads
+            os.close(w)
+            thread.join()
+            if hasattr(p.input, 'close'):
+                p.input.close()
+                p.input._thread.join()
+            input.close()
+        names = []
+        def parse():
+            for cmd in p.iter_commands():
+                names.append(cmd.name)
+        thread = threading.Thread(target=parse)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(cleanup)
+        thread.join(5)
+        self.assertFalse(thread.isAlive())
+        return names
+
+    def test_uncompressed_pipe_left_open(self):
+        self.assertEqual(['feature', 'blob'], self.parse_pipe_left_open(
+            "feature done\nblob\ndata 3\nabc\ndone\n"))
+
+    def test_gzip_pipe_left_open(self):
+        self.assertEqual(['feature', 'blob'], self.parse_pipe_left_open(
+            gzip_compress("feature done\nblob\ndata 3\nabc\ndone\n")))
+
+
+class TestCompressingFile(TestCase):
+
+    def test_gzip(self):
+        out = StringIO()
+        f = compression.CompressingFile(out, 'gz', block_size=10)
+        for line in StringIO(_sample_stream):
+            f.write(line)
+        f.close()
+        self.assertEqual(_sample_stream,
+            gzip.GzipFile(fileobj=StringIO(out.getvalue())).read())
+
+    def test_bzip2(self):
+        out = StringIO()
+        f = compression.CompressingFile(out, 'bz2')
+        f.write(_sample_stream)
+        f.flush()
+        f.close()
+        self.assertEqual(_sample_stream, bz2.decompress(out.getvalue()))
+
+    def test_error_is_kept(self):
+        f = compression.CompressingFile(BrokenFile(), 'gz', block_size=1)
+        f.write("x")
+        self.assertRaises(IOError, f.flush)
+        self.assertRaises(IOError, f.write, "y")
+        self.assertRaises(IOError, f.close)
+
+    def test_write_after_close(self):
+        f = compression.CompressingFile(StringIO())
+        f.close()
+        self.assertRaises(ValueError, f.write, "x")
+
+    def test_unknown_format(self):
+        self.assertRaises(errors.UnsupportedCompression,
+            compression.CompressingFile, StringIO(), 'zip')
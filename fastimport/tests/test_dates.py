@@ -19,6 +19,7 @@ from unittest import TestCase
 
 from fastimport import (
     dates,
+    errors,
     )
 
 class ParseTzTests(TestCase):
@@ -32,3 +33,60 @@ class ParseTzTests(TestCase):
 
     def test_parse_tz_odd(self):
         self.assertEquals(1864800, dates.parse_tz("+51800"))
+
+
+class ParseRawTests(TestCase):
+
+    def test_parse_raw(self):
+        self.assertEquals((1234567890, -21600),
+            dates.parse_raw("1234567890 -0600"))
+        self.assertTrue(isinstance(dates.parse_raw("1234567890 +0000")[0],
+            int))
+
+    def test_parse_raw_fraction(self):
+        self.assertEquals((1234567890.5, 0),
+            dates.parse_raw("1234567890.5 +0000"))
+
+    def test_parse_raw_bad_timezone(self):
+        self.assertRaises(errors.InvalidTimezone, dates.parse_raw,
+            "1234567890 0600", 7)
+        self.assertRaises(errors.InvalidTimezone, dates.parse_raw,
+            "1234567890 ", 7)
+
+    def test_parse_raw_dates(self):
+        timestamps, timezones = dates.parse_raw_dates(
+            ["1234567890 +0100", "1234567900 -0130", "1234567910 +0100"])
+        self.assertEquals([1234567890, 1234567900, 1234567910],
+            list(timestamps))
+        self.assertEquals([3600, -5400, 3600], list(timezones))
+
+    def test_parse_raw_dates_bad_timezone(self):
+        try:
+            dates.parse_raw_dates(["1 +0000", "2 x"], lineno=10)
+        except errors.InvalidTimezone, e:
+            self.assertEquals(11, e.lineno)
+        else:
+            self.fail("no error raised")
+
+
+class ParseRfc2822Tests(TestCase):
+
+    def test_parse_rfc2822(self):
+        self.assertEquals((1212489296, 7200),
+            dates.parse_rfc2822("Tue, 3 Jun 2008 12:34:56 +0200"))
+        self.assertEquals((1212501896, -5400),
+            dates.parse_rfc2822("3 Jun 2008 12:34:56 -0130"))
+
+    def test_parse_rfc2822_other_forms(self):
+        self.assertEquals((1234567890, 0),
+            dates.parse_rfc2822("Fri, 13 Feb 2009 23:31:30 GMT"))
+        self.assertEquals((1212514440, -18000),
+            dates.parse_rfc2822("Tue, 3 jun 08 12:34 EST"))
+
+    def test_parse_rfc2822_invalid(self):
+        try:
+            dates.parse_rfc2822("yesterday", 5)
+        except errors.InvalidDate, e:
+            self.assertEquals(5, e.lineno)
+        else:
+            self.fail("no error raised")
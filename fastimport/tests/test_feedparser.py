@@ -0,0 +1,157 @@
+# Copyright (C) 2026 Canonical Ltd
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test the feed parser"""
+
+from cStringIO import StringIO
+from unittest import TestCase
+
+from fastimport import (
+    errors,
+    feedparser,
+    parser,
+    )
+
+
+_sample_stream = \
+"""feature done
+blob
+mark :1
+data 5
+hello
+
+blob
+data <<EOF
+commit refs/heads/fake
+EOF
+# a comment
+commit refs/heads/master
+mark :2
+author Joe <joe@example.com> 1234567890 +0000
+committer Joe <joe@example.com> 1234567890 +0000
+data 13
+commit blob
+
+property branch-nick 6 master
+M 644 :1 README
+M 644 inline NEWS
+data 8
+reset x
+
+progress here
+reset refs/heads/old
+from :2
+
+commit refs/heads/master
+committer Joe <joe@example.com> 1234567900 +0000
+data 7
+second
+from :2
+merge :1
+D README
+tag v1
+from :2
+tagger Joe <joe@example.com> 1234567910 +0000
+data 4
+v1.0
+checkpoint
+done
+ignored
+"""
+
+
+class TestFeedParser(TestCase):
+
+    def parse_serial(self, text):
+        return list(parser.ImportParser(StringIO(text)).iter_commands())
+
+    def parse_fed(self, text, chunk_size):
+        p = feedparser.FeedParser()
+        cmds = []
+        for i in range(0, len(text), chunk_size):
+            cmds.extend(p.feed(text[i:i + chunk_size]))
+        cmds.extend(p.close())
+        return cmds
+
+    def test_same_as_serial(self):
+        expected = self.parse_serial(_sample_stream)
+        for chunk_size in (1, 2, 3, 7, 64, len(_sample_stream)):
+            got = self.parse_fed(_sample_stream, chunk_size)
+            self.assertEqual([repr(c) for c in expected],
+                [repr(c) for c in got])
+            self.assertEqual(
+                [(c.offset, c.end_offset, getattr(c, 'lineno', None))
+                    for c in expected],
+                [(c.offset, c.end_offset, getattr(c, 'lineno', None))
+                    for c in got])
+
+    def test_multiline_property(self):
+        text = ("commit refs/heads/master\n"
+            "committer Joe <joe@example.com> 1234567890 +0000\n"
+            "data 3\nmsg\n"
+            "property note 12 a\n"
+            "blob thing\n"
+            "property other 1 b\n"
+            "M 644 inline README\n"
+            "data 6\nhello\n"
+            "\n"
+            "progress done\n")
+        expected = self.parse_serial(text)
+        self.assertEqual(2, len(expected))
+        for chunk_size in range(1, len(text) + 1):
+            got = self.parse_fed(text, chunk_size)
+            self.assertEqual([repr(c) for c in expected],
+                [repr(c) for c in got])
+
+    def test_commands_returned_early(self):
+        p = feedparser.FeedParser()
+        self.assertEqual([], p.feed("blob\nmark :1\ndata 3\nabc\n"))
+        # The blob is complete once the line after it arrives
+        cmds = p.feed("progress one\nprogress two")
+        self.assertEqual(['blob', 'progress'], [c.name for c in cmds])
+        self.assertEqual('one', cmds[1].message)
+        cmds = p.feed("\ncommit refs/heads/master\n")
+        self.assertEqual(['two'], [c.message for c in cmds])
+
+    def test_commit_waits_for_lookahead(self):
+        p = feedparser.FeedParser()
+        self.assertEqual([], p.feed(
+            "commit refs/heads/master\n"
+            "committer Joe <joe@example.com> 1234567890 +0000\n"
+            "data 3\nmsg\n"))
+        # More file commands may still come
+        self.assertEqual([], p.feed("M 644 :1 README\n"))
+        cmds = p.feed("reset refs/heads/old\n")
+        self.assertEqual(['commit'], [c.name for c in cmds])
+        self.assertEqual(1, len(cmds[0].file_iter))
+        cmds = p.close()
+        self.assertEqual(['reset'], [c.name for c in cmds])
+
+    def test_missing_done(self):
+        p = feedparser.FeedParser()
+        p.feed("feature done\nprogress x\n")
+        self.assertRaises(errors.PrematureEndOfStream, p.close)
+
+    def test_missing_bytes(self):
+        p = feedparser.FeedParser()
+        self.assertEqual([], p.feed("blob\ndata 10\nabc"))
+        self.assertRaises(errors.MissingBytes, p.close)
+
+    def test_buffers_only_the_tail(self):
+        p = feedparser.FeedParser()
+        p.block_size = 16
+        for i in range(100):
+            p.feed("progress %d\n" % (i,))
+        self.assertTrue(len(p._data) - p._pos < 32)
@@ -15,11 +15,15 @@
 
 """Test FilterProcessor"""
 
+import os
+import shutil
+import tempfile
 from cStringIO import StringIO
 
 from unittest import TestCase
 
 from fastimport import (
+    errors,
     parser,
     )
 
@@ -1106,3 +1110,95 @@ merge :4
 merge :1001
 M 644 :99 DATA2
 """)
+
+
+_SAMPLE_WITH_CHECKPOINTS = \
+"""blob
+mark :1
+data 4
+one
+blob
+mark :2
+data 4
+two
+commit refs/heads/master
+mark :3
+committer a <b@c> 1234798653 +0000
+data 5
+first
+M 644 :1 README
+checkpoint
+commit refs/heads/master
+mark :4
+committer a <b@c> 1234798654 +0000
+data 6
+second
+from :3
+M 644 :2 NEWS
+checkpoint
+commit refs/heads/master
+mark :5
+committer a <b@c> 1234798655 +0000
+data 5
+third
+from :4
+M 644 :2 doc/two
+progress done
+"""
+
+
+class Crash(Exception):
+    pass
+
+
+class TestCheckpoints(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.checkpoint = os.path.join(self.dir, 'checkpoint')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def make_processor(self, outf):
+        proc = filter_processor.FilterProcessor(
+            params={'exclude_patterns': 'NEWS'}, outf=outf)
+        proc.checkpoint_path = self.checkpoint
+        return proc
+
+    def filter(self, text, checkpoint=True):
+        outf = StringIO()
+        proc = self.make_processor(outf)
+        if not checkpoint:
+            proc.checkpoint_path = None
+        proc.process(parser.ImportParser(StringIO(text)).iter_commands)
+        return outf.getvalue()
+
+    def test_restart(self):
+        expected = self.filter(_SAMPLE_WITH_CHECKPOINTS, checkpoint=False)
+        input = StringIO(_SAMPLE_WITH_CHECKPOINTS)
+        outf = open(os.path.join(self.dir, 'out'), 'w+b')
+        proc = self.make_processor(outf)
+        self.assertEqual(None, proc.restart(input))
+        def crash_after_third_commit():
+            for cmd in parser.ImportParser(input).iter_commands():
+                yield cmd
+                if cmd.name == 'commit' and cmd.mark == '5':
+                    raise Crash()
+        self.assertRaises(Crash, proc.process, crash_after_third_commit)
+        # Start again from the second checkpoint
+        input = StringIO(_SAMPLE_WITH_CHECKPOINTS)
+        proc = self.make_processor(outf)
+        p = proc.restart(input)
+        self.assertEqual(_SAMPLE_WITH_CHECKPOINTS.index('commit refs/heads/'
+            'master\nmark :5'), p.offset)
+        proc.process(p.iter_commands)
+        outf.seek(0)
+        self.assertEqual(expected, outf.read())
+        outf.close()
+
+    def test_restart_other_stream(self):
+        self.filter(_SAMPLE_WITH_CHECKPOINTS)
+        proc = self.make_processor(StringIO())
+        self.assertRaises(errors.BadRestart, proc.restart,
+            StringIO(_SAMPLE_WITH_CHECKPOINTS.replace('mark :4', 'mark :44')))
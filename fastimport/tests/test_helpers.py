@@ -53,3 +53,33 @@ class TestCommonDirectory(unittest.TestCase):
     def test_lots_of_paths(self):
         c = helpers.common_directory(['foo/bar/x', 'foo/bar/y', 'foo/bar/z'])
         self.assertEqual(c, 'foo/bar/')
+
+
+class TestInternTable(unittest.TestCase):
+
+    def test_computed_once(self):
+        made = []
+        def make(key):
+            made.append(key)
+            return key.upper()
+        t = helpers.InternTable(make, 10)
+        self.assertEqual('A', t['a'])
+        self.assertEqual('A', t['a'])
+        self.assertEqual(['a'], made)
+
+    def test_least_recently_used_dropped(self):
+        made = []
+        def make(key):
+            made.append(key)
+            return [key]
+        t = helpers.InternTable(make, 2)
+        a = t['a']
+        t['b']
+        # 'a' and 'b' become the old generation
+        t['c']
+        self.assertTrue(t['a'] is a)
+        # 'b' wasn't used since, so goes when the generation turns over
+        t['d']
+        t['b']
+        self.assertEqual(['a', 'b', 'c', 'd', 'b'], made)
+        self.assertTrue(t['a'] is a)
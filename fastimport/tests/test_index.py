@@ -0,0 +1,159 @@
+# Copyright (C) 2026 Canonical Ltd
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test the stream index"""
+
+from cStringIO import StringIO
+from unittest import TestCase
+
+from fastimport import (
+    errors,
+    index,
+    parser,
+    )
+
+
+_sample_stream = \
+"""blob
+mark :1
+data 5
+hello
+commit refs/heads/master
+mark :2
+committer Joe <joe@example.com> 1234567890 +0000
+data 6
+first
+M 644 :1 README
+
+blob
+mark :3
+data 3
+bye
+commit refs/heads/master
+mark :4
+committer Joe <joe@example.com> 1234567900 +0000
+data 7
+second
+from :2
+M 644 :3 README
+M 644 inline NEWS
+data 4
+news
+
+reset refs/heads/old
+from :2
+
+tag v1
+from :4
+tagger Joe <joe@example.com> 1234567910 +0000
+data 4
+v1.0
+"""
+
+
+class TestStreamIndex(TestCase):
+
+    def _build(self):
+        return index.build_index(StringIO(_sample_stream))
+
+    def test_columns(self):
+        idx = self._build()
+        self.assertEqual(6, len(idx))
+        self.assertEqual(['blob', 'commit', 'blob', 'commit', 'reset', 'tag'],
+            [idx.kind(i) for i in range(len(idx))])
+        self.assertEqual([1, 2, 3, 4, 0, 0], list(idx.marks))
+        self.assertEqual([0, 26], list(idx.offsets[:2]))
+        self.assertEqual(len(_sample_stream),
+            idx.offsets[-1] + idx.lengths[-1])
+        self.assertEqual([0, 1234567890, 0, 1234567900, 0, 1234567910],
+            list(idx.timestamps))
+        self.assertEqual([None, 'refs/heads/master', None,
+            'refs/heads/master', 'refs/heads/old', 'v1'],
+            [idx.ref(i) for i in range(len(idx))])
+        self.assertEqual(['refs/heads/master', 'refs/heads/old', 'v1'],
+            idx.ref_names)
+
+    def test_find(self):
+        idx = self._build()
+        self.assertEqual(3, idx.find(4))
+        self.assertEqual(3, idx.find(':4'))
+        self.assertEqual(0, idx.find('1'))
+        self.assertRaises(KeyError, idx.find, 5)
+        self.assertRaises(KeyError, idx.find, 0)
+
+    def test_save_load(self):
+        idx = self._build()
+        f = StringIO()
+        idx.save(f)
+        loaded = index.StreamIndex.load(StringIO(f.getvalue()))
+        for name in ('kinds', 'marks', 'offsets', 'lengths', 'timestamps',
+                     'refs'):
+            self.assertEqual(getattr(idx, name), getattr(loaded, name))
+        self.assertEqual(idx.ref_names, loaded.ref_names)
+        self.assertEqual(3, loaded.find(4))
+
+    def test_load_bad(self):
+        self.assertRaises(errors.BadIndex, index.StreamIndex.load,
+            StringIO("FIDX"))
+        self.assertRaises(errors.BadIndex, index.StreamIndex.load,
+            StringIO("XXXX\x01\x00\x00\x00\x00\x00\x00\x00"))
+        f = StringIO()
+        self._build().save(f)
+        self.assertRaises(errors.BadIndex, index.StreamIndex.load,
+            StringIO(f.getvalue()[:30]))
+
+
+class TestStreamReader(TestCase):
+
+    def _reader(self):
+        stream = StringIO(_sample_stream)
+        return index.StreamReader(stream, index.build_index(stream))
+
+    def test_get(self):
+        reader = self._reader()
+        cmd = reader.get(4)
+        self.assertEqual('commit', cmd.name)
+        self.assertEqual('4', cmd.mark)
+        self.assertEqual('second\n', cmd.message)
+        self.assertEqual(':2', cmd.from_)
+        self.assertEqual(reader.index.offsets[3], cmd.offset)
+        file_cmds = list(cmd.iter_files())
+        self.assertEqual('news', str(file_cmds[1].data))
+        self.assertEqual('bye', str(reader.get(':3').data))
+
+    def test_parse(self):
+        reader = self._reader()
+        cmd = reader.parse(5)
+        self.assertEqual('tag', cmd.name)
+        self.assertEqual('v1.0', cmd.message)
+
+    def test_extract(self):
+        reader = self._reader()
+        out = StringIO()
+        reader.extract(4, 4, out)
+        # The blob used by the commit comes too
+        start = reader.index.offsets[2]
+        end = reader.index.offsets[4]
+        self.assertEqual(_sample_stream[start:end], out.getvalue())
+        cmds = list(parser.ImportParser(StringIO(out.getvalue()))
+            .iter_commands())
+        self.assertEqual(['blob', 'commit'], [c.name for c in cmds])
+
+    def test_extract_range(self):
+        reader = self._reader()
+        out = StringIO()
+        reader.extract(2, 4, out)
+        self.assertEqual(_sample_stream[:reader.index.offsets[4]],
+            out.getvalue())
@@ -0,0 +1,273 @@
+# Copyright (C) 2026 Canonical Ltd
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test the mark tables"""
+
+import os
+import shutil
+import tempfile
+from cStringIO import StringIO
+from unittest import TestCase
+
+from fastimport import (
+    errors,
+    marks,
+    parser,
+    processor,
+    )
+from fastimport.processors import filter_processor
+
+
+class TestMarkNumber(TestCase):
+
+    def test_mark_number(self):
+        self.assertEqual(12, marks.mark_number(':12'))
+        self.assertEqual(12, marks.mark_number(12))
+        self.assertEqual(None, marks.mark_number('12'))
+        self.assertEqual(None, marks.mark_number(':0'))
+        self.assertEqual(None, marks.mark_number('@3'))
+        self.assertEqual(None, marks.mark_number('refs/heads/master'))
+
+
+class TestMarkTable(TestCase):
+
+    def test_mapping(self):
+        t = marks.MarkTable()
+        t[':1'] = 'one'
+        t[3] = None
+        t['@7'] = 'seven'
+        self.assertEqual(3, len(t))
+        self.assertEqual('one', t[1])
+        self.assertEqual(None, t[':3'])
+        self.assertTrue(':3' in t)
+        self.assertFalse(':2' in t)
+        self.assertEqual('seven', t['@7'])
+        self.assertRaises(KeyError, t.__getitem__, ':2')
+        self.assertEqual('x', t.get(':2', 'x'))
+        self.assertEqual([':1', ':3', '@7'], list(t))
+        del t[':1']
+        self.assertFalse(':1' in t)
+        self.assertEqual(2, len(t))
+        self.assertRaises(KeyError, t.__delitem__, ':1')
+
+    def test_array(self):
+        t = marks.MarkTable('l')
+        for i in range(1, 1000):
+            t[':%d' % i] = i * 2
+        self.assertEqual(999, len(t))
+        self.assertEqual(1998, t[':999'])
+        self.assertEqual([(':1', 2), (':2', 4)], list(t.iteritems())[:2])
+
+    def test_far_marks(self):
+        t = marks.MarkTable()
+        t[1] = 'one'
+        far = marks._MAX_GAP + 10
+        t[far] = 'far'
+        self.assertEqual({far: 'far'}, t._others)
+        self.assertEqual('far', t[far])
+        # Once the table reaches it, the mark moves into the list
+        t[far - 20] = 'near'
+        self.assertEqual({}, t._others)
+        self.assertEqual('far', t[far])
+        self.assertEqual(3, len(t))
+
+    def test_high_marks(self):
+        # As when carrying on from the marks of a previous import
+        t = marks.MarkTable('l')
+        first = 20000001
+        for i in xrange(first, first + 100000):
+            t[i] = i
+        self.assertEqual({}, t._others)
+        self.assertTrue(len(t._values) < 200000)
+        self.assertEqual(first + 5, t[first + 5])
+        self.assertRaises(KeyError, t.__getitem__, first - 1)
+        self.assertEqual(100000, len(t))
+        # Lower marks grow the table down
+        t[first - 100] = 1
+        self.assertEqual({}, t._others)
+        self.assertEqual(1, t[first - 100])
+        self.assertEqual(':%d' % (first - 100,), iter(t).next())
+        t[':1'] = 2
+        self.assertEqual({':1': 2}, t._others)
+        self.assertEqual(2, t[':1'])
+
+    def test_growing_down_twice(self):
+        # Moving :600000 in grows the table down again
+        t = marks.MarkTable()
+        t[':2500000'] = 'c'
+        t[':600000'] = 'a'
+        t[':1500000'] = 'b'
+        self.assertEqual({}, t._others)
+        self.assertEqual([(':600000', 'a'), (':1500000', 'b'),
+            (':2500000', 'c')], list(t.iteritems()))
+
+class TestMarkSet(TestCase):
+
+    def test_set(self):
+        s = marks.MarkSet([':1', ':9', '@4'])
+        s.add(':9')
+        self.assertEqual(3, len(s))
+        self.assertTrue(':9' in s)
+        self.assertTrue(9 in s)
+        self.assertFalse(':2' in s)
+        self.assertTrue('@4' in s)
+        self.assertEqual([':1', ':9', '@4'], list(s))
+        s.discard(':9')
+        s.discard(':10')
+        s.discard('@4')
+        self.assertEqual([':1'], list(s))
+
+    def test_high_marks(self):
+        s = marks.MarkSet()
+        first = 20000001
+        for i in xrange(first, first + 100000):
+            s.add(i)
+        self.assertEqual(set(), s._others)
+        self.assertTrue(s._bitmap.capacity() < 200000)
+        self.assertTrue(first in s)
+        self.assertFalse(first - 1 in s)
+        s.add(first - 3)
+        s.add(5)
+        s.discard(first - 2)
+        self.assertEqual(set([5]), s._others)
+        self.assertEqual([':%d' % (first - 3,), ':%d' % (first,)],
+            list(s)[:2])
+        self.assertEqual(100002, len(s))
+
+
+class TestMarksFiles(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.table = marks.MarkTable()
+        self.table[':1'] = 'a' * 40
+        self.table[':3'] = 'b' * 40
+        self.table['@5'] = 'not a mark'
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_text(self):
+        f = StringIO()
+        marks.write_marks(f, self.table)
+        self.assertEqual(":1 %s\n:3 %s\n" % ('a' * 40, 'b' * 40),
+            f.getvalue())
+        table = marks.read_marks(StringIO(f.getvalue()))
+        self.assertEqual([(':1', 'a' * 40), (':3', 'b' * 40)],
+            list(table.iteritems()))
+
+    def test_text_invalid(self):
+        self.assertRaises(errors.BadMarks, marks.read_marks,
+            StringIO("1 abc\n"))
+
+    def test_binary(self):
+        path = os.path.join(self.dir, 'marks')
+        marks.save_marks(path, self.table, binary=True)
+        loaded = marks.load_marks(path)
+        self.assertTrue(isinstance(loaded, marks.MappedMarks))
+        self.assertEqual(2, len(loaded))
+        self.assertEqual('a' * 40, loaded[':1'])
+        self.assertEqual('b' * 40, loaded.get(3))
+        self.assertFalse(':2' in loaded)
+        self.assertFalse(':4' in loaded)
+        self.assertRaises(KeyError, loaded.__getitem__, ':2')
+        loaded[':3'] = 'c' * 40
+        loaded[':4'] = 'd' * 40
+        self.assertEqual(3, len(loaded))
+        self.assertEqual([(':1', 'a' * 40), (':3', 'c' * 40),
+            (':4', 'd' * 40)], list(loaded.iteritems()))
+        loaded.close()
+
+    def test_load_text(self):
+        path = os.path.join(self.dir, 'marks')
+        marks.save_marks(path, self.table)
+        loaded = marks.load_marks(path)
+        self.assertTrue(isinstance(loaded, marks.MarkTable))
+        self.assertEqual('b' * 40, loaded[':3'])
+
+    def test_bad_binary(self):
+        path = os.path.join(self.dir, 'marks')
+        marks.save_marks(path, self.table, binary=True)
+        f = open(path, 'ab')
+        f.write('x')
+        f.close()
+        self.assertRaises(errors.BadMarks, marks.load_marks, path)
+
+
+class MarkingProcessor(processor.ImportProcessor):
+
+    handles_marks = True
+
+    def blob_handler(self, cmd):
+        self.marks[cmd.id] = 'blob-%s' % (cmd.mark,)
+
+    def feature_handler(self, cmd):
+        pass
+
+
+class TestProcessorMarks(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def process(self, text):
+        p = parser.ImportParser(StringIO(text))
+        proc = MarkingProcessor()
+        proc.process(p.iter_commands)
+        return proc
+
+    def test_import_and_export(self):
+        old = os.path.join(self.dir, 'old')
+        new = os.path.join(self.dir, 'new')
+        marks.save_marks(old, {':1': 'blob-x'}, binary=True)
+        proc = self.process(
+            "feature import-marks=%s\n"
+            "feature export-marks=%s\n"
+            "blob\nmark :2\ndata 0\n" % (old, new))
+        self.assertEqual('blob-x', proc.marks[':1'])
+        loaded = marks.load_marks(new)
+        self.assertTrue(isinstance(loaded, marks.MappedMarks))
+        self.assertEqual([(':1', 'blob-x'), (':2', 'blob-2')],
+            list(loaded.iteritems()))
+
+    def test_import_if_exists(self):
+        new = os.path.join(self.dir, 'new')
+        self.process(
+            "feature import-marks-if-exists=%s\n"
+            "feature export-marks=%s\n"
+            "blob\nmark :1\ndata 0\n" % (new, new))
+        self.assertEqual(":1 blob-1\n", open(new).read())
+
+    def test_not_handled(self):
+        # Marks files are left to whatever imports the output
+        old = os.path.join(self.dir, 'old')
+        new = os.path.join(self.dir, 'new')
+        f = open(new, 'w')
+        f.write(":1 blob-x\n")
+        f.close()
+        p = parser.ImportParser(StringIO(
+            "feature import-marks=%s\n"
+            "feature export-marks=%s\n"
+            "blob\nmark :2\ndata 0\n" % (old, new)))
+        proc = filter_processor.FilterProcessor(outf=StringIO())
+        proc.process(p.iter_commands)
+        self.assertEqual(None, proc.marks)
+        self.assertEqual(":1 blob-x\n", open(new).read())
+        self.assertTrue(proc.outf.getvalue().startswith(
+            "feature import-marks=%s\n"
+            "feature export-marks=%s\n" % (old, new)))
@@ -0,0 +1,226 @@
+# Copyright (C) 2026 Canonical Ltd
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test the scanner and parallel parsing"""
+
+import os
+import tempfile
+import weakref
+from cStringIO import StringIO
+from unittest import TestCase
+
+from fastimport import (
+    errors,
+    parallel,
+    parser,
+    scanner,
+    )
+
+
+_sample_stream = \
+"""# a comment
+feature done
+blob
+mark :1
+data 5
+hello
+blob
+data <<EOF
+commit refs/heads/fake
+EOF
+commit refs/heads/master
+mark :2
+committer Joe <joe@example.com> 1234567890 +0000
+data 13
+commit blob
+
+M 644 :1 README
+M 644 inline NEWS
+data 8
+reset x
+
+progress here
+blob
+data 3
+bye
+commit refs/heads/master
+committer Joe <joe@example.com> 1234567900 +0000
+data 7
+second
+from :2
+D README
+
+tag v1
+from :2
+tagger Joe <joe@example.com> 1234567910 +0000
+data 4
+v1.0
+checkpoint
+
+done
+"""
+
+
+# A property value whose second line looks like a command
+_property_stream = \
+"""commit refs/heads/master
+mark :1
+committer Joe <joe@example.com> 1234567890 +0000
+data 3
+msg
+property note 12 a
+blob thing
+M 644 inline README
+data 6
+hello
+
+progress done
+"""
+
+
+class NonSeekable(object):
+
+    def __init__(self, text):
+        self._f = StringIO(text)
+
+    def read(self, size=-1):
+        return self._f.read(size)
+
+
+class TestCommandScanner(TestCase):
+
+    def test_iter_commands(self):
+        s = scanner.CommandScanner(StringIO(_sample_stream))
+        found = list(s.iter_commands())
+        cmds = list(parser.ImportParser(StringIO(_sample_stream))
+            .iter_commands())
+        self.assertEqual([(c.name, c.offset) for c in cmds],
+            [(name, offset) for name, offset, mark, size in found[:-1]])
+        self.assertEqual(('done', len(_sample_stream) - 5, None, 0),
+            found[-1])
+        self.assertEqual([None, '1', None, '2', None, None, None, None,
+            None],
+            [mark for name, offset, mark, size in found[:-1]])
+        self.assertEqual([0, 5, 23, 21, 0, 3, 7, 4, 0],
+            [size for name, offset, mark, size in found[:-1]])
+
+    def test_scan(self):
+        table = scanner.scan(StringIO(_sample_stream), block_size=7)
+        self.assertEqual(10, len(table))
+        self.assertEqual(['feature', 'blob', 'blob', 'commit'],
+            [table.kind(i) for i in range(4)])
+        self.assertEqual([0, 1, 0, 2, 0], list(table.marks[:5]))
+        self.assertEqual(len(_sample_stream),
+            table.offsets[-1] + table.lengths[-1])
+        self.assertEqual(table.offsets[1],
+            table.offsets[0] + table.lengths[0])
+        counts = table.counts()
+        self.assertEqual(3, counts['blob'])
+        self.assertEqual(2, counts['commit'])
+        self.assertEqual(1, counts['tag'])
+        self.assertEqual(0, counts['reset'])
+        self.assertEqual(63, table.data_size())
+        self.assertEqual(31, table.data_size('blob'))
+
+    def test_multiline_property(self):
+        found = list(scanner.CommandScanner(StringIO(_property_stream))
+            .iter_commands())
+        cmds = list(parser.ImportParser(StringIO(_property_stream))
+            .iter_commands())
+        self.assertEqual({'note': u'a\nblob thing'}, cmds[0].properties)
+        self.assertEqual([(c.name, c.offset) for c in cmds],
+            [(name, offset) for name, offset, mark, size in found])
+
+    def test_scan_unseekable(self):
+        table = scanner.scan(NonSeekable(_sample_stream), block_size=7)
+        expected = scanner.scan(StringIO(_sample_stream))
+        self.assertEqual(expected.offsets, table.offsets)
+        self.assertEqual(expected.data_sizes, table.data_sizes)
+
+
+class TestParallelParsing(TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def write(self, text):
+        f = open(self.path, 'wb')
+        try:
+            f.write(text)
+        finally:
+            f.close()
+
+    def assertSameCommands(self, expected, got):
+        self.assertEqual(len(expected), len(got))
+        for e, g in zip(expected, got):
+            self.assertEqual(e.__class__, g.__class__)
+            self.assertEqual((e.offset, e.end_offset),
+                (g.offset, g.end_offset))
+            self.assertEqual(getattr(e, 'lineno', None),
+                getattr(g, 'lineno', None))
+            self.assertEqual(getattr(e, 'id', None), getattr(g, 'id', None))
+            self.assertEqual(repr(e), repr(g))
+
+    def test_same_as_serial(self):
+        self.write(_sample_stream)
+        expected = list(parser.ImportParser(StringIO(_sample_stream))
+            .iter_commands())
+        for range_size in (1, 100, 1000):
+            got = list(parallel.iter_commands(self.path, processes=2,
+                range_size=range_size))
+            self.assertSameCommands(expected, got)
+
+    def test_multiline_property(self):
+        self.write(_property_stream)
+        expected = list(parser.ImportParser(StringIO(_property_stream))
+            .iter_commands())
+        for range_size in (1, 40, 1000):
+            got = list(parallel.iter_commands(self.path, processes=2,
+                range_size=range_size))
+            self.assertSameCommands(expected, got)
+
+    def test_lazy_data(self):
+        self.write(_sample_stream)
+        got = list(parallel.iter_commands(self.path, processes=2,
+            range_size=1, lazy_data=True))
+        self.assertEqual('hello', got[1].data.read())
+        self.assertEqual('reset x\n', str(got[3].file_iter[1].data))
+        # The file is closed with the last payload reading from it
+        source = weakref.ref(got[1].data.source)
+        del got
+        self.assertEqual(None, source())
+
+    def test_error_line_number(self):
+        text = _sample_stream.replace('progress here', 'bogus')
+        self.write(text)
+        cmds = []
+        try:
+            for cmd in parallel.iter_commands(self.path, processes=2,
+                range_size=1):
+                cmds.append(cmd)
+        except errors.InvalidCommand, e:
+            self.assertEqual(22, e.lineno)
+        else:
+            self.fail("no error raised")
+        self.assertEqual(4, len(cmds))
+
+    def test_missing_done(self):
+        self.write(_sample_stream[:-len("done\n")])
+        self.assertRaises(errors.PrematureEndOfStream, list,
+            parallel.iter_commands(self.path, processes=2, range_size=1))
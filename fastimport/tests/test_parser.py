@@ -15,7 +15,10 @@
 
 """Test the Import parsing"""
 
+import os
 import StringIO
+import tempfile
+import threading
 import time
 import unittest
 
@@ -23,6 +26,7 @@ from fastimport import (
     commands,
     errors,
     parser,
+    payload,
     )
 
 
@@ -50,18 +54,59 @@ class TestLineBasedParser(unittest.TestCase):
         # Test missing bytes
         self.assertRaises(errors.MissingBytes, p.read_bytes, 10)
 
+    def test_push_line_not_last_line(self):
+        s = StringIO.StringIO("foo\nbar\n")
+        p = parser.LineBasedParser(s)
+        self.assertEqual('foo', p.next_line())
+        p.push_line('baz')
+        self.assertEqual('baz', p.next_line())
+        self.assertEqual('bar', p.next_line())
+        self.assertEqual(None, p.next_line())
+
+    def test_small_blocks(self):
+        s = StringIO.StringIO("foo\nbarbaz\nbaz\nabcdef")
+        p = parser.LineBasedParser(s, block_size=2)
+        self.assertEqual('foo', p.next_line())
+        self.assertEqual('barbaz', p.next_line())
+        p.push_line('barbaz')
+        self.assertEqual('barbaz', p.next_line())
+        self.assertEqual('ba', p.read_bytes(2))
+        self.assertEqual('z\nabc', p.read_bytes(5))
+        self.assertEqual('def', p.readline())
+        self.assertEqual('', p.readline())
+        self.assertEqual(3, p.lineno)
+        self.assertEqual(21, p.offset)
+
     def test_read_until(self):
-        # TODO
-        return
         s = StringIO.StringIO("foo\nbar\nbaz\nabc\ndef\nghi\n")
         p = parser.LineBasedParser(s)
-        self.assertEqual('foo\nbar', p.read_until('baz'))
+        self.assertEqual('foo\nbar\n', p.read_until('baz'))
+        self.assertEqual(3, p.lineno)
         self.assertEqual('abc', p.next_line())
-        # Test that the line buffer is ignored
-        p.push_line('abc')
-        self.assertEqual('def', p.read_until('ghi'))
+        self.assertEqual('def\n', p.read_until('ghi'))
         # Test missing terminator
-        self.assertRaises(errors.MissingTerminator, p.read_until('>>>'))
+        self.assertRaises(errors.MissingTerminator, p.read_until, '>>>')
+
+    def test_read_until_small_blocks(self):
+        s = StringIO.StringIO("foo\nEOFbar\nEO\nEOF\nabc\n")
+        p = parser.LineBasedParser(s, block_size=2)
+        self.assertEqual('foo\nEOFbar\nEO\n', p.read_until('EOF'))
+        self.assertEqual('abc', p.next_line())
+
+    def test_read_until_empty(self):
+        s = StringIO.StringIO("EOF\nabc\n")
+        p = parser.LineBasedParser(s)
+        self.assertEqual('', p.read_until('EOF'))
+        self.assertEqual('abc', p.next_line())
+
+    def test_read_until_end_of_stream(self):
+        p = parser.LineBasedParser(StringIO.StringIO("foo\nEOF"))
+        self.assertEqual('foo\n', p.read_until('EOF'))
+        self.assertEqual(None, p.next_line())
+        p = parser.LineBasedParser(StringIO.StringIO("foo\nEOFX"))
+        self.assertRaises(errors.MissingTerminator, p.read_until, 'EOF')
+        p = parser.LineBasedParser(StringIO.StringIO("EOF"))
+        self.assertEqual('', p.read_until('EOF'))
 
 
 # Sample text
@@ -297,6 +342,519 @@ more data
         self.assertEquals([], list(cmds))
 
 
+class TestPositions(unittest.TestCase):
+
+    text = ("blob\nmark :1\ndata 4\na\naa\n"
+        "commit refs/heads/master\n"
+        "mark :2\n"
+        "committer <bugs@bunny.org> 1234567890 +0000\n"
+        "data 3\nmsg\n"
+        "M 644 inline README\n"
+        "data 5\nhel\no\n"
+        "\n"
+        "blob\nmark :3\ndata 4\nbbbb\n")
+
+    def test_offsets(self):
+        p = parser.ImportParser(StringIO.StringIO(self.text))
+        blob1, commit, blob2 = list(p.iter_commands())
+        self.assertEqual((0, 25), (blob1.offset, blob1.end_offset))
+        self.assertEqual((25, 147), (commit.offset, commit.end_offset))
+        self.assertEqual((147, len(self.text)),
+            (blob2.offset, blob2.end_offset))
+        self.assertEqual(len(self.text), p.offset)
+
+    def test_lazy_line_numbers(self):
+        p = parser.ImportParser(StringIO.StringIO(self.text))
+        cmds = p.iter_commands()
+        blob1, commit, blob2 = cmds.next(), cmds.next(), cmds.next()
+        # Nothing has been counted yet
+        self.assertEqual(0, p._counted)
+        self.assertTrue(callable(blob2._lineno))
+        self.assertEqual(16, blob2.lineno)
+        self.assertEqual(1, blob1.lineno)
+        self.assertEqual(6, commit.lineno)
+        self.assertEqual(5, p.line_number(commit.offset - 1))
+        self.assertEqual(19, p.lineno)
+
+    def test_line_numbers_after_close(self):
+        text = "".join(["blob\nmark :%d\ndata 4\na\naa\n\n" % i
+            for i in range(1, 1001)])
+        f = tempfile.TemporaryFile()
+        f.write(text)
+        f.seek(0)
+        p = parser.ImportParser(f)
+        p.block_size = 4096
+        cmds = list(p.iter_commands())
+        f.close()
+        # The line numbers of the commands kept were counted at the end
+        self.assertEqual([1, 7, 5995], [cmds[0].lineno, cmds[1].lineno,
+            cmds[-1].lineno])
+        self.assertEqual(None, cmds[500]._lineno.parser)
+
+    def test_line_number_of_closed_input(self):
+        f = tempfile.TemporaryFile()
+        f.write(self.text)
+        f.seek(0)
+        p = parser.ImportParser(f)
+        blob1 = p.iter_commands().next()
+        f.close()
+        # Counted when the iterator was dropped
+        self.assertEqual(1, blob1.lineno)
+        f = tempfile.TemporaryFile()
+        f.write(self.text)
+        f.seek(0)
+        p = parser.ImportParser(f)
+        p.block_size = 4
+        cmds = p.iter_commands()
+        blob1 = cmds.next()
+        cmds.next()
+        # Nothing to count with any more: unknown, but no error
+        f.close()
+        self.assertEqual(None, blob1.lineno)
+
+    def test_unseekable_line_numbers(self):
+        p = parser.ImportParser(NonSeekable(self.text))
+        p.block_size = 4
+        blob1, commit, blob2 = list(p.iter_commands())
+        self.assertEqual([1, 6, 16],
+            [blob1.lineno, commit.lineno, blob2.lineno])
+        self.assertEqual(19, p.lineno)
+
+    def test_error_line_number(self):
+        p = parser.ImportParser(StringIO.StringIO(self.text + "bogus\n"))
+        try:
+            list(p.iter_commands())
+        except errors.InvalidCommand, e:
+            self.assertEqual(20, e.lineno)
+        else:
+            self.fail("no error raised")
+
+    def test_timezone_error_line_number(self):
+        p = parser.ImportParser(StringIO.StringIO(
+            "commit refs/heads/master\n"
+            "committer <bugs@bunny.org> 1234567890 bogus\n"
+            "data 3\nmsg\n"))
+        try:
+            list(p.iter_commands())
+        except errors.InvalidTimezone, e:
+            self.assertEqual(2, e.lineno)
+        else:
+            self.fail("no error raised")
+
+
+class TestMappedInput(unittest.TestCase):
+
+    def make_file(self, text):
+        f = tempfile.TemporaryFile()
+        f.write(text)
+        f.seek(0)
+        self.addCleanup(f.close)
+        return f
+
+    def test_blob_data_is_buffer(self):
+        text = ("blob\nmark :1\ndata 4\naaaa\n"
+            "commit refs/heads/master\n"
+            "committer <bugs@bunny.org> 1234567890 +0000\n"
+            "data 3\nmsg\n"
+            "M 644 inline README\n"
+            "data 5\nhello\n")
+        p = parser.ImportParser(self.make_file(text), use_mmap=True)
+        blob, commit = list(p.iter_commands())
+        self.assertTrue(isinstance(blob.data, buffer))
+        self.assertEqual('aaaa', str(blob.data))
+        self.assertEqual("blob\nmark :1\ndata 4\naaaa", repr(blob))
+        self.assertEqual('msg', commit.message)
+        [filecmd] = list(commit.iter_files())
+        self.assertEqual('hello', str(filecmd.data))
+        unmapped = parser.ImportParser(StringIO.StringIO(text))
+        list(unmapped.iter_commands())
+        self.assertEqual(unmapped.lineno, p.lineno)
+
+    def test_starts_at_file_position(self):
+        f = self.make_file("junk\nblob\ndata 3\nabc\n")
+        f.seek(5)
+        p = parser.ImportParser(f, use_mmap=True)
+        [blob] = list(p.iter_commands())
+        self.assertEqual('abc', str(blob.data))
+
+    def test_missing_bytes(self):
+        f = self.make_file("blob\ndata 10\nabc\n")
+        p = parser.ImportParser(f, use_mmap=True)
+        self.assertRaises(errors.MissingBytes, list, p.iter_commands())
+
+    def test_pipe_is_not_mapped(self):
+        r, w = os.pipe()
+        os.write(w, "blob\ndata 3\nabc\n")
+        os.close(w)
+        f = os.fdopen(r, 'rb')
+        self.addCleanup(f.close)
+        p = parser.ImportParser(f, use_mmap=True)
+        [blob] = list(p.iter_commands())
+        self.assertEqual('abc', blob.data)
+
+    def test_empty_file(self):
+        p = parser.ImportParser(self.make_file(""), use_mmap=True)
+        self.assertEqual([], list(p.iter_commands()))
+
+
+class TestLazyData(unittest.TestCase):
+
+    text = ("blob\nmark :1\ndata 4\naaaa\n"
+        "commit refs/heads/master\n"
+        "committer <bugs@bunny.org> 1234567890 +0000\n"
+        "data 3\nmsg\n"
+        "M 644 inline README\n"
+        "data 5\nhel\no\n"
+        "blob\nmark :2\ndata 4\nbbbb\n")
+
+    def test_lazy_payloads(self):
+        p = parser.ImportParser(StringIO.StringIO(self.text), lazy_data=True)
+        blob1, commit, blob2 = list(p.iter_commands())
+        self.assertTrue(isinstance(blob1.data, payload.LazyPayload))
+        self.assertEqual(4, len(blob1.data))
+        self.assertEqual('aaaa', blob1.data.read())
+        self.assertEqual('msg', commit.message)
+        [filecmd] = list(commit.iter_files())
+        self.assertEqual('hel\no', filecmd.data.read())
+        self.assertEqual('bbbb', blob2.data.read())
+        self.assertEqual(13, blob2.lineno)
+
+    def test_mapped(self):
+        f = tempfile.TemporaryFile()
+        self.addCleanup(f.close)
+        f.write(self.text)
+        f.seek(0)
+        p = parser.ImportParser(f, use_mmap=True, lazy_data=True)
+        blob1, commit, blob2 = list(p.iter_commands())
+        self.assertTrue(isinstance(blob1.data, payload.LazyPayload))
+        self.assertEqual('aaaa', blob1.data.read())
+        self.assertEqual('bbbb', blob2.data.read())
+
+    def test_small_blocks(self):
+        p = parser.ImportParser(StringIO.StringIO(self.text), lazy_data=True)
+        p.block_size = 3
+        blob1, commit, blob2 = list(p.iter_commands())
+        self.assertEqual('aaaa', blob1.data.read())
+        self.assertEqual('bbbb', blob2.data.read())
+        self.assertEqual(13, blob2.lineno)
+
+    def test_missing_bytes(self):
+        p = parser.ImportParser(StringIO.StringIO("blob\ndata 10\nabc\n"),
+            lazy_data=True)
+        self.assertRaises(errors.MissingBytes, list, p.iter_commands())
+
+    def test_unseekable_input(self):
+        p = parser.ImportParser(NonSeekable(self.text), lazy_data=True)
+        blob1, commit, blob2 = list(p.iter_commands())
+        self.assertEqual('aaaa', blob1.data)
+
+
+class TestSpooledData(unittest.TestCase):
+
+    text = ("blob\nmark :1\ndata 4\naaaa\n"
+        "blob\nmark :2\ndata 13\nbbbb\nbbbb\nbbb\n"
+        "blob\nmark :3\ndata 2\ncc\n")
+
+    def test_spooled(self):
+        p = parser.ImportParser(NonSeekable(self.text), spool_threshold=5)
+        p.block_size = 4
+        blob1, blob2, blob3 = list(p.iter_commands())
+        self.assertEqual('aaaa', blob1.data)
+        self.assertTrue(isinstance(blob2.data, payload.LazyPayload))
+        self.assertEqual('bbbb\nbbbb\nbbb', blob2.data.read())
+        self.assertEqual(['bbbb', '\nbbb', 'b\nbb', 'b'],
+            list(blob2.data.iter_chunks(4)))
+        self.assertEqual('cc', blob3.data)
+        self.assertEqual(11, blob3.lineno)
+
+    def test_spooled_to_one_file(self):
+        p = parser.ImportParser(NonSeekable(self.text), spool_threshold=1)
+        blobs = []
+        # Reading payloads between copies leaves them where they are
+        for blob in p.iter_commands():
+            blob.data.read()
+            blobs.append(blob)
+        self.assertEqual(['aaaa', 'bbbb\nbbbb\nbbb', 'cc'],
+            [b.data.read() for b in blobs])
+        self.assertTrue(blobs[0].data.source is blobs[2].data.source)
+        self.assertEqual([0, 4, 17], [b.data.offset for b in blobs])
+
+    def test_iter_bytes(self):
+        p = parser.LineBasedParser(StringIO.StringIO("foo\nbarbaz\n"),
+            block_size=2)
+        self.assertEqual('foo', p.next_line())
+        self.assertEqual(['ba', 'rb', 'az'], list(p.iter_bytes(6)))
+        self.assertEqual('', p.next_line())
+        self.assertRaises(errors.MissingBytes, list, p.iter_bytes(1))
+
+
+class TestStreamedFileCommands(unittest.TestCase):
+
+    text = ("commit refs/heads/master\n"
+        "mark :1\n"
+        "committer <bugs@bunny.org> 1234567890 +0000\n"
+        "data 3\nmsg\n"
+        "M 644 inline a\n"
+        "data 2\naa\n"
+        "M 644 :9 b\n"
+        "D c\n"
+        "\n"
+        "commit refs/heads/master\n"
+        "mark :2\n"
+        "committer <bugs@bunny.org> 1234567891 +0000\n"
+        "data 3\nmsg\n"
+        "from :1\n"
+        "D a\n"
+        "\n"
+        "progress done\n")
+
+    def test_streamed(self):
+        p = parser.ImportParser(StringIO.StringIO(self.text),
+            stream_file_commands=True)
+        cmds = p.iter_commands()
+        commit = cmds.next()
+        self.assertFalse(isinstance(commit.file_iter, list))
+        self.assertEqual(None, commit.end_offset)
+        file_cmds = list(commit.iter_files())
+        self.assertEqual(['a', 'b', 'c'], [f.path for f in file_cmds])
+        self.assertEqual('aa', file_cmds[0].data)
+        self.assertEqual(129, commit.end_offset)
+        commit = cmds.next()
+        self.assertEqual(':1', commit.from_)
+        self.assertEqual(['a'], [f.path for f in commit.iter_files()])
+        self.assertEqual('progress', cmds.next().name)
+
+    def test_skipped(self):
+        p = parser.ImportParser(StringIO.StringIO(self.text),
+            stream_file_commands=True)
+        cmds = p.iter_commands()
+        commit1 = cmds.next()
+        self.assertEqual('a', commit1.iter_files().next().path)
+        # What is left of the first commit is skipped
+        commit2 = cmds.next()
+        self.assertEqual('2', commit2.mark)
+        self.assertEqual(129, commit1.end_offset)
+        self.assertEqual([], list(commit1.iter_files()))
+        self.assertEqual(['commit', 'progress'],
+            [commit2.name] + [c.name for c in cmds])
+
+    def test_same_as_listed(self):
+        listed = list(parser.ImportParser(StringIO.StringIO(self.text))
+            .iter_commands())
+        p = parser.ImportParser(StringIO.StringIO(self.text),
+            stream_file_commands=True)
+        streamed = []
+        for cmd in p.iter_commands():
+            streamed.append(repr(cmd))
+        self.assertEqual([repr(cmd) for cmd in listed], streamed)
+
+
+class TestRecovery(unittest.TestCase):
+
+    # A bad committer, then a blob whose data looks like commands
+    text = ("commit refs/heads/master\n"
+        "mark :1\n"
+        "committer <bugs@bunny.org> 1234567890 bogus\n"
+        "data 3\nmsg\n"
+        "M 644 inline a\n"
+        "data 12\nreset x\nbogus\n"
+        "\n"
+        "blob\n"
+        "mark :2\n"
+        "data 16\ncommit x\ndone\nz\n"
+        "\n"
+        "bogus\n"
+        "progress done\n")
+
+    def test_strict(self):
+        p = parser.ImportParser(StringIO.StringIO(self.text))
+        self.assertRaises(errors.InvalidTimezone, list, p.iter_commands())
+
+    def test_recover(self):
+        p = parser.ImportParser(StringIO.StringIO(self.text), recover=True)
+        cmds = list(p.iter_commands())
+        self.assertEqual(['blob', 'progress'], [c.name for c in cmds])
+        self.assertEqual('commit x\ndone\nz\n', cmds[0].data)
+        self.assertEqual(2, len(p.dropped))
+        commit = p.dropped[0]
+        self.assertEqual((0, cmds[0].offset), commit[:2])
+        self.assertTrue(isinstance(commit.error, errors.InvalidTimezone))
+        bogus = p.dropped[1]
+        self.assertEqual((self.text.index('bogus\nprogress'), cmds[1].offset),
+            bogus[:2])
+        self.assertTrue(isinstance(bogus.error, errors.InvalidCommand))
+
+    def test_error_budget(self):
+        p = parser.ImportParser(StringIO.StringIO(self.text), recover=True,
+            error_budget=1)
+        self.assertRaises(errors.InvalidCommand, list, p.iter_commands())
+        self.assertEqual(1, len(p.dropped))
+
+    def test_streamed(self):
+        p = parser.ImportParser(StringIO.StringIO(
+            "commit refs/heads/master\n"
+            "committer <bugs@bunny.org> 1234567890 +0000\n"
+            "data 3\nmsg\n"
+            "M 644 inline a\n"
+            "data 2\naa\n"
+            "X bogus\n"
+            "M 644 :1 b\n"
+            "\n"
+            "progress done\n"), recover=True, stream_file_commands=True)
+        names = []
+        for cmd in p.iter_commands():
+            names.append(cmd.name)
+            if cmd.name == 'commit':
+                self.assertEqual('a', cmd.iter_files().next().path)
+        self.assertEqual(['commit', 'progress'], names)
+        self.assertEqual(1, len(p.dropped))
+        self.assertTrue(isinstance(p.dropped[0].error,
+            errors.InvalidCommand))
+
+    def test_truncated_data(self):
+        p = parser.ImportParser(StringIO.StringIO(
+            "blob\nmark :1\ndata 100\nshort\n"), recover=True)
+        self.assertEqual([], list(p.iter_commands()))
+        self.assertEqual(1, len(p.dropped))
+        self.assertTrue(isinstance(p.dropped[0].error, errors.MissingBytes))
+
+    def test_missing_section(self):
+        # The commit ends where its committer should be, at a blob
+        text = ("commit refs/heads/master\n"
+            "mark :1\n"
+            "blob\n"
+            "mark :2\n"
+            "data 3\nabc\n"
+            "progress done\n")
+        p = parser.ImportParser(StringIO.StringIO(text), recover=True)
+        cmds = list(p.iter_commands())
+        self.assertEqual([('blob', ':2'), ('progress', None)],
+            [(c.name, getattr(c, 'id', None)) for c in cmds])
+        self.assertEqual([(0, text.index('blob'))],
+            [d[:2] for d in p.dropped])
+        self.assertTrue(isinstance(p.dropped[0].error,
+            errors.MissingSection))
+
+    def test_missing_path(self):
+        p = parser.ImportParser(StringIO.StringIO(
+            "commit refs/heads/master\n"
+            "committer <bugs@bunny.org> 1234567890 +0000\n"
+            "data 3\nmsg\n"
+            "M 644 :1\n"
+            "\n"
+            "progress done\n"), recover=True)
+        self.assertEqual(['progress'], [c.name for c in p.iter_commands()])
+        self.assertEqual(1, len(p.dropped))
+        self.assertTrue(isinstance(p.dropped[0].error, errors.BadFormat))
+
+    def test_missing_timezone(self):
+        p = parser.ImportParser(StringIO.StringIO(
+            "commit refs/heads/master\n"
+            "committer <bugs@bunny.org> 1234567890 \n"
+            "data 3\nmsg\n"
+            "\n"
+            "progress done\n"), recover=True)
+        self.assertEqual(['progress'], [c.name for c in p.iter_commands()])
+        self.assertEqual(1, len(p.dropped))
+        self.assertTrue(isinstance(p.dropped[0].error,
+            errors.InvalidTimezone))
+
+    def test_bad_date(self):
+        p = parser.ImportParser(StringIO.StringIO(
+            "commit refs/heads/master\n"
+            "committer <bugs@bunny.org> soon +0000\n"
+            "data 3\nmsg\n"
+            "\n"
+            "progress done\n"), recover=True)
+        self.assertEqual(['progress'], [c.name for c in p.iter_commands()])
+        self.assertEqual(1, len(p.dropped))
+        self.assertTrue(isinstance(p.dropped[0].error, errors.InvalidDate))
+
+    def test_truncated_sections(self):
+        for text in ["progress a\nblob\n", "progress a\nblob\nmark :1\n",
+            "progress a\ntag v1\nfrom :1\n"]:
+            p = parser.ImportParser(StringIO.StringIO(text), recover=True)
+            self.assertEqual(['progress'],
+                [c.name for c in p.iter_commands()])
+            self.assertEqual(1, len(p.dropped))
+            self.assertTrue(isinstance(p.dropped[0].error,
+                errors.MissingSection))
+
+
+class TestBinarySafety(unittest.TestCase):
+
+    # Neither the paths, the message nor a property value are UTF-8
+    text = ("commit refs/heads/master\n"
+        "committer <bugs@bunny.org> 1234567890 +0000\n"
+        "data 3\nm\xe9g\n"
+        "property p 2 \xff\xfe\n"
+        "property q 2 \xc3\xa9\n"
+        "M 644 inline caf\xe9\n"
+        "data 3\n\x00\xff\n"
+        "D \"\\351t\\351\"\n"
+        "\n")
+
+    def test_bytes_kept(self):
+        p = parser.ImportParser(StringIO.StringIO(self.text))
+        cmd = p.iter_commands().next()
+        self.assertEqual('m\xe9g', cmd.message)
+        self.assertEqual({'p': '\xff\xfe', 'q': u'\xe9'}, cmd.properties)
+        modify, delete = cmd.iter_files()
+        self.assertEqual('caf\xe9', modify.path)
+        self.assertEqual('\x00\xff\n', modify.data)
+        self.assertEqual('\xe9t\xe9', delete.path)
+
+    def test_round_trip(self):
+        p = parser.ImportParser(StringIO.StringIO(self.text))
+        cmd = p.iter_commands().next()
+        p = parser.ImportParser(StringIO.StringIO(repr(cmd) + "\n"))
+        self.assertEqual(repr(cmd), repr(p.iter_commands().next()))
+
+
+class TestPipeInput(unittest.TestCase):
+
+    def parse_while_open(self, f):
+        """Parse the commands available from f, whose writer stays open."""
+        names = []
+        def parse():
+            for cmd in parser.ImportParser(f).iter_commands():
+                names.append(cmd.name)
+        thread = threading.Thread(target=parse)
+        thread.daemon = True
+        thread.start()
+        thread.join(5)
+        self.assertFalse(thread.isAlive())
+        return names
+
+    def test_done_without_eof(self):
+        r, w = os.pipe()
+        self.addCleanup(os.close, w)
+        f = os.fdopen(r, 'rb')
+        self.addCleanup(f.close)
+        os.write(w, "feature done\nprogress hi\ndone\n")
+        self.assertEqual(['feature', 'progress'], self.parse_while_open(f))
+
+    def test_buffered_by_file_object(self):
+        r, w = os.pipe()
+        self.addCleanup(os.close, w)
+        f = os.fdopen(r, 'rb')
+        self.addCleanup(f.close)
+        os.write(w, "export\nfeature done\nblob\ndata 3\nabc\ndone\n")
+        # What a remote helper reads first leaves the rest in the buffer
+        self.assertEqual("export\n", f.readline())
+        self.assertEqual(['feature', 'blob'], self.parse_while_open(f))
+
+
+class NonSeekable(object):
+    """An input stream which can only be read once."""
+
+    def __init__(self, text):
+        self._f = StringIO.StringIO(text)
+
+    def read(self, count):
+        return self._f.read(count)
+
+
 class TestStringParsing(unittest.TestCase):
 
     def test_unquote(self):
@@ -305,6 +863,67 @@ class TestStringParsing(unittest.TestCase):
             parser._unquote_c_string(s))
 
 
+class TestPathParsing(unittest.TestCase):
+
+    def test_repeated_paths_shared(self):
+        p = parser.ImportParser(StringIO.StringIO(
+            "commit refs/heads/master\n"
+            "committer Joe <joe@example.com> 1234567890 +0000\n"
+            "data 0\n"
+            "M 644 :1 doc/README\n"
+            "D \"doc/README\"\n"
+            "M 644 :2 doc/README\n"
+            "M 644 :3 \"doc/new\\tline\"\n"))
+        cmd = p.iter_commands().next()
+        paths = [c.path for c in cmd.iter_files()]
+        self.assertEqual(['doc/README', 'doc/README', 'doc/README',
+            'doc/new\tline'], paths)
+        self.assertTrue(paths[0] is paths[2])
+
+
+class TestIdentities(unittest.TestCase):
+
+    def test_identities_shared(self):
+        mapped = []
+        class Mapper(object):
+            def map_name_and_email(self, name, email):
+                mapped.append((name, email))
+                return name.upper(), email
+        p = parser.ImportParser(StringIO.StringIO(
+            "commit refs/heads/master\n"
+            "author Joe Wong <joe@example.com> 1234567890 +0100\n"
+            "committer Jane <jane@example.com> 1234567890 +0000\n"
+            "data 0\n"
+            "commit refs/heads/master\n"
+            "committer Joe Wong <joe@example.com> 1234567900 -0600\n"
+            "data 0\n"),
+            user_mapper=Mapper())
+        first, second = list(p.iter_commands())
+        self.assertEqual(('JOE WONG', 'joe@example.com', 1234567890, 3600),
+            first.author)
+        self.assertEqual(('JOE WONG', 'joe@example.com', 1234567900,
+            -21600), second.committer)
+        self.assertTrue(first.author.name is second.committer.name)
+        self.assertEqual([('Joe Wong', 'joe@example.com'),
+            ('Jane', 'jane@example.com')], mapped)
+        self.assertEqual([('JOE WONG', 'joe@example.com'),
+            ('JANE', 'jane@example.com')], p.identities.identities)
+        self.assertEqual(1, p.identities['Jane <jane@example.com'][0])
+
+
+class TestDateParsing(unittest.TestCase):
+
+    def test_rfc2822_dates(self):
+        p = parser.ImportParser(StringIO.StringIO(
+            "feature date-format=rfc2822\n"
+            "commit refs/heads/master\n"
+            "committer Joe <joe@example.com> Tue, 3 Jun 2008 12:34:56 +0200\n"
+            "data 0\n"))
+        cmd = list(p.iter_commands())[1]
+        self.assertEqual(('Joe', 'joe@example.com', 1212489296, 7200),
+            cmd.committer)
+
+
 class TestPathPairParsing(unittest.TestCase):
 
     def test_path_pair_simple(self):
@@ -0,0 +1,69 @@
+# Copyright (C) 2026 Canonical Ltd
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test the payload handles"""
+
+import mmap
+import tempfile
+from cStringIO import StringIO
+from unittest import TestCase
+
+from fastimport import (
+    commands,
+    payload,
+    )
+
+
+class TestLazyPayload(TestCase):
+
+    def test_read(self):
+        source = StringIO("foo hello world bar")
+        source.seek(3)
+        p = payload.LazyPayload(source, 4, 11)
+        self.assertEqual(11, len(p))
+        self.assertEqual("hello world", p.read())
+        self.assertEqual("hello world", str(p))
+        # The source is left where it was
+        self.assertEqual(3, source.tell())
+
+    def test_read_mmap(self):
+        f = tempfile.TemporaryFile()
+        self.addCleanup(f.close)
+        f.write("foo hello world bar")
+        f.flush()
+        m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        p = payload.LazyPayload(m, 4, 11)
+        self.assertEqual("hello world", p.read())
+
+    def test_chunks(self):
+        p = payload.LazyPayload(StringIO("hello world"), 0, 11)
+        self.assertEqual(["hell", "o wo", "rld"], list(p.iter_chunks(4)))
+        out = StringIO()
+        p.write_to(out, 4)
+        self.assertEqual("hello world", out.getvalue())
+
+    def test_equality(self):
+        source = StringIO("hello hello")
+        p = payload.LazyPayload(source, 0, 5)
+        self.assertEqual(p, "hello")
+        self.assertEqual("hello", p)
+        self.assertNotEqual(p, "hell")
+        self.assertEqual(p, payload.LazyPayload(source, 6, 5))
+        self.assertNotEqual(p, payload.LazyPayload(source, 5, 5))
+
+    def test_blob_display(self):
+        p = payload.LazyPayload(StringIO("hello world"), 0, 11)
+        c = commands.BlobCommand("1", p)
+        self.assertEqual("blob\nmark :1\ndata 11\nhello world", repr(c))
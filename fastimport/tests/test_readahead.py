@@ -0,0 +1,125 @@
+# Copyright (C) 2026 Canonical Ltd
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test reading ahead in a background thread"""
+
+import os
+import threading
+import time
+from cStringIO import StringIO
+from unittest import TestCase
+
+from fastimport import (
+    parser,
+    readahead,
+    )
+
+
+class BrokenFile(object):
+
+    def __init__(self):
+        self.reads = 0
+
+    def read(self, size):
+        self.reads += 1
+        if self.reads > 1:
+            raise IOError("broken pipe")
+        return "x" * size
+
+
+class TestReadAheadFile(TestCase):
+
+    def test_read(self):
+        f = readahead.ReadAheadFile(StringIO("0123456789" * 10),
+            block_size=16, depth=2)
+        self.assertEqual("012", f.read(3))
+        # What is left of the block, rather than waiting for the next
+        self.assertEqual("3456789012345", f.read(22))
+        self.assertEqual("6789", f.read(4))
+        rest = f.read()
+        self.assertEqual(100 - 20, len(rest))
+        self.assertEqual("", f.read(10))
+        f.close()
+        stats = f.stats()
+        self.assertEqual(8, stats['blocks'])
+        self.assertEqual(100, stats['bytes'])
+        self.assertTrue(stats['max_depth'] <= 2)
+
+    def test_read_whole_blocks(self):
+        block = "a" * 16
+        f = readahead.ReadAheadFile(StringIO(block * 2), block_size=16)
+        # Whole blocks are handed over as they are
+        self.assertEqual(block, f.read(16))
+        self.assertEqual(block, f.read(100))
+        self.assertEqual("", f.read(100))
+        f.close()
+
+    def test_error(self):
+        f = readahead.ReadAheadFile(BrokenFile(), block_size=4)
+        self.assertEqual("xxxx", f.read(4))
+        self.assertRaises(IOError, f.read, 4)
+        f.close()
+
+    def test_close_early(self):
+        f = readahead.ReadAheadFile(StringIO("x" * 1000), block_size=1,
+            depth=1)
+        self.assertEqual("x", f.read(1))
+        f.close()
+        self.assertRaises(ValueError, f.read, 1)
+
+    def test_close_while_reading(self):
+        r, w = os.pipe()
+        input = os.fdopen(r, 'rb')
+        os.write(w, "abc")
+        f = readahead.ReadAheadFile(input, block_size=16)
+        # The thread is left waiting for the rest of the block
+        start = time.time()
+        f.close()
+        self.assertTrue(time.time() - start < 1)
+        os.close(w)
+        f._thread.join()
+        input.close()
+
+    def test_parse(self):
+        text = "progress one\nblob\nmark :1\ndata 3\nabc\nprogress two\n"
+        f = readahead.ReadAheadFile(StringIO(text), block_size=5)
+        cmds = list(parser.ImportParser(f).iter_commands())
+        self.assertEqual(['progress', 'blob', 'progress'],
+            [c.name for c in cmds])
+        self.assertEqual('abc', cmds[1].data)
+        f.close()
+
+    def test_parse_pipe_left_open(self):
+        r, w = os.pipe()
+        input = os.fdopen(r, 'rb')
+        os.write(w, "feature done\nblob\ndata 3\nabc\ndone\n")
+        f = readahead.ReadAheadFile(input)
+        def cleanup():
+            # Let the thread's read return before closing what it reads
+            f.close()
+            os.close(w)
+            f._thread.join()
+            input.close()
+        self.addCleanup(cleanup)
+        names = []
+        def parse():
+            for cmd in parser.ImportParser(f).iter_commands():
+                names.append(cmd.name)
+        thread = threading.Thread(target=parse)
+        thread.daemon = True
+        thread.start()
+        thread.join(5)
+        self.assertFalse(thread.isAlive())
+        self.assertEqual(['feature', 'blob'], names)